@@ -0,0 +1,315 @@
+"""
+Benchmarks for the Python side of `emat_verspm.VERSPModel`.
+
+These benchmarks run complete designs of experiments through
+`VERSPModel.run_experiments`, with the stand-in for `Rscript` in
+`benchmarks/bin` in place of VisionEval, so they measure everything
+except the model itself: creating the model (`__init__`), `setup`
+(and each group of input files it writes), the bookkeeping in `run`
+(R startup and the output file rename loop), `post_process`, the
+parsers (`load_measures`) and `archive`.  The time of each stage is
+taken from the stage metrics recorded for each experiment.
+
+Each combination of design size and number of workers is run in
+a fresh model, database and archive directory.  A worker count of
+0 runs the experiments sequentially in this process, otherwise a
+local pool with that many workers (processes, or threads with
+`--executor thread`) is used.
+
+The results are written as JSON, along with details of the software
+and machine, so they can be kept to track performance over time, and
+a previous results file can be given with `--compare` to report the
+changes from it.
+
+Example:
+
+	python benchmarks/verspm_bench.py --sizes 10 100 1000 10000 --workers 0 2 4 --output bench.json
+
+The stand-in is a Python script run as `Rscript`, so these benchmarks
+do not run on Windows.  See `benchmarks/bin/Rscript` for the settings
+that control the size of the synthetic output files.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import platform
+import tempfile
+import subprocess
+
+this_directory = os.path.dirname(os.path.abspath(__file__))
+repo_directory = os.path.dirname(this_directory)
+
+
+def environment():
+	"""
+	Describe the software and machine running the benchmarks.
+
+	Returns:
+		dict
+	"""
+	import numpy, pandas, emat
+	try:
+		import pyarrow
+	except ImportError:
+		pyarrow = None
+	try:
+		commit = subprocess.run(
+			['git', 'rev-parse', 'HEAD'],
+			cwd=repo_directory, capture_output=True, text=True,
+		).stdout.strip() or None
+	except OSError:
+		commit = None
+	return dict(
+		time=time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+		commit=commit,
+		python=platform.python_version(),
+		platform=platform.platform(),
+		processor=platform.processor(),
+		cpu_count=os.cpu_count(),
+		emat=emat.__version__,
+		numpy=numpy.__version__,
+		pandas=pandas.__version__,
+		pyarrow=getattr(pyarrow, '__version__', None),
+	)
+
+
+def _records(df):
+	"""Convert a DataFrame to a dict of dicts by row, with NaN as None."""
+	df = df.astype(object).where(df.notna(), None)
+	return df.to_dict(orient='index')
+
+
+def bench_init(repeats):
+	"""
+	Time the creation of a VERSPModel.
+
+	Args:
+		repeats (int): The number of models to create.
+
+	Returns:
+		dict: The minimum, mean and maximum seconds.
+	"""
+	import emat_verspm
+	times = []
+	for _ in range(repeats):
+		start = time.perf_counter()
+		model = emat_verspm.VERSPModel(db=False)
+		times.append(time.perf_counter() - start)
+		model.master_directory.cleanup()
+	return dict(
+		repeats=repeats,
+		min=min(times),
+		mean=sum(times) / len(times),
+		max=max(times),
+	)
+
+
+def bench_design(n_experiments, n_workers, config, executor='process', seed=0):
+	"""
+	Time running a design of experiments.
+
+	Args:
+		n_experiments (int): The number of experiments in the design.
+		n_workers (int): The number of local pool workers, or 0 to run
+			the experiments sequentially in this process.
+		config (dict): Updates to the model configuration.
+		executor (str): Run the local pool workers as 'process'es or 'thread's.
+		seed (int): The random seed for the design.
+
+	Returns:
+		dict
+	"""
+	import emat_verspm
+	from emat import SQLiteDB
+	workdir = tempfile.mkdtemp(prefix='verspm-bench-')
+	try:
+		db = SQLiteDB(os.path.join(workdir, 'bench.db'), initialize=True)
+		model = emat_verspm.VERSPModel(db=db)
+		model.config.update(config)
+		model.archive_path = os.path.join(workdir, 'archive')
+		design = model.design_experiments(
+			n_samples=n_experiments,
+			random_seed=seed,
+			design_name=f"bench_{n_experiments}",
+		)
+		start = time.perf_counter()
+		model.run_experiments(design, n_workers=n_workers or None, executor=executor)
+		wall = time.perf_counter() - start
+		stages = model.stage_metrics_summary(design)
+		model.master_directory.cleanup()
+	finally:
+		shutil.rmtree(workdir, ignore_errors=True)
+	return dict(
+		n_experiments=n_experiments,
+		n_workers=n_workers,
+		executor=executor,
+		wall=wall,
+		experiments_per_second=n_experiments / wall,
+		stages=_records(stages),
+	)
+
+
+def compare(results, previous, threshold):
+	"""
+	Report the changes in results from a previous benchmark.
+
+	Args:
+		results (dict): The current results.
+		previous (dict): The previous results.
+		threshold (float): Report a regression when a time grows
+			by more than this ratio.
+
+	Returns:
+		int: The number of regressions.
+	"""
+	regressions = 0
+
+	def report(label, before, after):
+		nonlocal regressions
+		if not before or after is None:
+			return
+		ratio = after / before
+		flag = ''
+		if ratio > threshold:
+			flag = '  REGRESSION'
+			regressions += 1
+		print(f"{label:<60} {before:12.5f} {after:12.5f} {ratio:8.2f}{flag}", file=sys.stderr)
+
+	print(f"{'':<60} {'previous':>12} {'current':>12} {'ratio':>8}", file=sys.stderr)
+	report('__init__', previous['init']['mean'], results['init']['mean'])
+	prior_runs = {
+		(r['n_experiments'], r['n_workers']): r
+		for r in previous['results']
+	}
+	for run in results['results']:
+		prior = prior_runs.get((run['n_experiments'], run['n_workers']))
+		if prior is None:
+			continue
+		label = f"{run['n_experiments']} experiments, {run['n_workers']} workers"
+		report(f"{label}: seconds per experiment", 1 / prior['experiments_per_second'], 1 / run['experiments_per_second'])
+		for stage, metrics in run['stages'].items():
+			if stage in prior['stages']:
+				report(f"{label}: {stage}", prior['stages'][stage]['wall_mean'], metrics['wall_mean'])
+	return regressions
+
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+	parser.add_argument(
+		'--sizes', type=int, nargs='+', default=[10, 100],
+		help='numbers of experiments in each design (at least 2)',
+	)
+	parser.add_argument(
+		'--workers', type=int, nargs='+', default=[0, 2],
+		help='numbers of local pool workers, 0 for sequential runs',
+	)
+	parser.add_argument(
+		'--executor', choices=('process', 'thread'), default='process',
+		help='run the local pool workers as processes or threads',
+	)
+	parser.add_argument(
+		'--households', type=int, default=80000,
+		help='rows in each synthetic Household table',
+	)
+	parser.add_argument(
+		'--run-seconds', type=float, default=0.0,
+		help='emulated run time of the model itself',
+	)
+	parser.add_argument(
+		'--archive-format', choices=('zip', 'parquet', 'blobs'), default='zip',
+	)
+	parser.add_argument(
+		'--r-session', action='store_true',
+		help='run the model in a persistent R session',
+	)
+	parser.add_argument(
+		'--full-extract', action='store_true',
+		help='extract every datastore table and run the full query',
+	)
+	parser.add_argument(
+		'--memory-budget', type=float, default=None,
+		help='memory budget for concurrent model runs in MB, by default 80%% of the host',
+	)
+	parser.add_argument(
+		'--memory-governor', action='store_true',
+		help='wait for memory to start model runs, implied by --memory-budget',
+	)
+	parser.add_argument(
+		'--init-repeats', type=int, default=3,
+		help='number of models created to time __init__',
+	)
+	parser.add_argument(
+		'--output', default=None,
+		help='file for the JSON results, by default written to stdout',
+	)
+	parser.add_argument(
+		'--compare', default=None,
+		help='a previous JSON results file to compare with',
+	)
+	parser.add_argument(
+		'--threshold', type=float, default=1.1,
+		help='time ratio above which a change is reported as a regression',
+	)
+	args = parser.parse_args(argv)
+	if min(args.sizes) < 2:
+		parser.error('each design must have at least 2 experiments')
+	if platform.system() == 'Windows':
+		parser.error('the Rscript stand-in does not run on Windows')
+
+	output = os.path.abspath(args.output) if args.output else None
+	previous = None
+	if args.compare:
+		with open(args.compare, 'rt') as f:
+			previous = json.load(f)
+
+	# The stand-in and the synthetic file settings are found by
+	# the model (and its worker processes) through the environment.
+	os.environ['PATH'] = os.path.join(this_directory, 'bin') + os.pathsep + os.environ['PATH']
+	os.environ['VERSPM_BENCH_HOUSEHOLDS'] = str(args.households)
+	os.environ['VERSPM_BENCH_RUN_SECONDS'] = str(args.run_seconds)
+	sys.path.insert(0, repo_directory)
+	logging.getLogger("EMAT").setLevel(logging.ERROR)
+
+	config = dict(
+		archive_format=args.archive_format,
+		r_session=args.r_session,
+		full_extract=args.full_extract,
+		memory_governor=args.memory_governor or args.memory_budget is not None,
+		memory_budget_mb=args.memory_budget,
+	)
+	results = dict(
+		environment=environment(),
+		settings=dict(
+			households=args.households,
+			run_seconds=args.run_seconds,
+			executor=args.executor,
+			**config,
+		),
+		init=bench_init(args.init_repeats),
+		results=[],
+	)
+	for n_experiments in args.sizes:
+		for n_workers in args.workers:
+			print(f"running {n_experiments} experiments on {n_workers} workers", file=sys.stderr)
+			results['results'].append(bench_design(n_experiments, n_workers, config, args.executor))
+
+	if output:
+		with open(output, 'wt') as f:
+			json.dump(results, f, indent=1)
+	else:
+		json.dump(results, sys.stdout, indent=1)
+		print()
+
+	if previous is not None:
+		if compare(results, previous, args.threshold):
+			return 1
+	return 0
+
+
+if __name__ == '__main__':
+	sys.exit(main())
@@ -1,5 +1,6 @@
 
 import os
+import atexit
 import numpy as np
 import pandas as pd
 import logging
@@ -9,12 +10,44 @@ import shutil
 import platform
 import subprocess
 import json
-from distutils.dir_util import copy_tree
+import hashlib
+import sqlite3
+import warnings
+import time
+import functools
+import contextlib
+import threading
+import queue
+import uuid
+import collections
+import csv
+import io
 
 from emat import Scope, SQLiteDB
+from emat.exceptions import MissingArchivePathError, MissingIdWarning
 from emat.model.core_files import FilesCoreModel
+from emat.model.core_files import parsers as emat_parsers
 from emat.model.core_files.parsers import TableParser, MappingParser, loc, key
 
+from verspm_inputs import (
+	join_norm, fingerprint_tree, MixtureStore, _mixture_stores,
+	get_scenario_input_cache, _tree_fingerprints,
+	InputValidationError, read_geo, input_schema, validate_input,
+	_input_schemas, _validated_inputs,
+)
+from verspm_memory import max_rss_mb, process_usage, MemoryGovernor, MemoryReservation
+from verspm_journal import open_journal, record_journal_event
+from verspm_sink import ResultSink, _SpoolingDB
+from verspm_pool import (
+	schedule_experiments,
+	_local_worker_model_for, _local_worker_init, _local_worker_run,
+	_thread_worker_run, _pool_results, _reprocess_archives, _reprocess_worker_run,
+)
+# These are used from this module by notebooks and scripts.
+from verspm_inputs import scenario_input, MixturePair, ScenarioInputCache  # noqa: F401
+from verspm_memory import host_memory  # noqa: F401
+from verspm_sink import spool_results  # noqa: F401
+
 _logger = logging.getLogger("EMAT.VERSPM")
 
 # The demo model code is located in the same
@@ -23,544 +56,4791 @@ _logger = logging.getLogger("EMAT.VERSPM")
 # current working directory is different.
 this_directory = os.path.dirname(__file__)
 
-def scenario_input(*filename):
-	"""The path to a scenario_input file."""
-	return os.path.join(this_directory, 'scenario_inputs', *filename)
 
-def join_norm(*args):
-	"""Normalize joined paths."""
-	return os.path.normpath(os.path.join(*args))
+def _reflink(source, destination):
+	"""
+	Clone a file as a copy-on-write reflink, where the filesystem supports it.
 
+	Returns:
+		bool: Whether the clone was made.
+	"""
+	try:
+		import fcntl
+	except ImportError:
+		return False
+	FICLONE = 0x40049409
+	try:
+		with open(source, 'rb') as src, open(destination, 'wb') as dst:
+			fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+	except OSError:
+		if os.path.exists(destination):
+			os.remove(destination)
+		return False
+	shutil.copystat(source, destination)
+	return True
 
 
-class VERSPModel(FilesCoreModel):
+def provision_model_directory(source, destination, writable=(), link=True):
 	"""
-	A class for using the Vision Eval RSPM as a files core model.
+	Populate a model directory from a source model directory, cheaply.
+
+	Files in the `inputs` and `defs` sub-directories are shared with
+	the source as hardlinks, as they are only read by the model.  The
+	exceptions are the files named in `writable`, which are re-written
+	by `setup` and so must not share storage with the source; these,
+	and all other files, are cloned as copy-on-write reflinks where the
+	filesystem supports that, or copied otherwise.
 
 	Args:
-		db (emat.Database, optional):
-			An optional Database to store experiments and results.
-			This allows this module to store results in a persistent
-			manner across sessions.  If a `db` is not given, one is
-			created and initialized in the temporary directory
-			alongside the other model files, but it will be
-			deleted automatically when the Python session ends.
-		db_filename (str, default "verspm.db")
-			The filename used to create a database if no existing
-			database is given in `db`.
-		scope (emat.Scope, optional):
-			A YAML file that defines the scope for these model
-			runs. If not given, the default scope stored in this
-			package directly is used.
+		source (str):
+			The source model directory.
+		destination (str):
+			The model directory to populate.  Existing files are replaced.
+		writable (Collection[str]):
+			Paths relative to the model directory, using '/' as the
+			separator, of files that must be real copies.
+		link (bool, default True):
+			Whether to use hardlinks at all.  If False, every file is
+			cloned or copied.
+
+	Returns:
+		Dict[str, int]: Counts of files 'linked', 'cloned' and 'copied'.
 	"""
+	writable = set(writable)
+	counts = dict(linked=0, cloned=0, copied=0)
+	for dirpath, dirnames, filenames in os.walk(source):
+		rel_dir = os.path.relpath(dirpath, source)
+		os.makedirs(join_norm(destination, rel_dir), exist_ok=True)
+		for filename in filenames:
+			rel_path = os.path.normpath(os.path.join(rel_dir, filename)).replace(os.sep, '/')
+			src = os.path.join(dirpath, filename)
+			dst = join_norm(destination, rel_path)
+			if os.path.lexists(dst):
+				os.remove(dst)
+			shareable = (
+				link
+				and rel_path.split('/')[0] in ('inputs', 'defs')
+				and rel_path not in writable
+			)
+			if shareable:
+				try:
+					os.link(src, dst)
+				except OSError:
+					pass
+				else:
+					counts['linked'] += 1
+					continue
+			if _reflink(src, dst):
+				counts['cloned'] += 1
+			else:
+				shutil.copy2(src, dst)
+				counts['copied'] += 1
+	_logger.debug(f"provisioned {destination} from {source}: {counts}")
+	return counts
 
-	def __init__(self, db=None, db_filename="verspm.db", scope=None):
 
-		# Make a temporary directory for this instance.
-		self.master_directory = tempfile.TemporaryDirectory()
-		os.chdir(self.master_directory.name)
-		_logger.warning(f"changing cwd to {self.master_directory.name}")
-		cwd = self.master_directory.name
+# The model directories provisioned in this process, mapped to the
+# source each was provisioned from, so that a worker can keep using
+# its provisioned directory instead of re-copying it for each experiment.
+_provisioned_directories = {}
 
-		# Housekeeping for this example:
-		# Also copy the CONFIG and SCOPE files
-		for i in ['model-config', 'scope']:
-			shutil.copy2(
-				join_norm(this_directory, 'verspm-emat-files', f"verspm-{i}.yml"),
-				join_norm(cwd, f"verspm-{i}.yml"),
+
+def rscript_command():
+	"""The name of the `Rscript` command line tool on this platform."""
+	# On Windows, the tool also includes `.exe`.
+	if platform.system() == 'Windows':
+		return 'Rscript.exe'
+	else:
+		return 'Rscript'
+
+
+# Extract only the given datastore fields, each given as
+# "<Group>/<Table>/<Name>", instead of the whole datastore.
+_r_extract_fields = """
+emat_extract <- function(model, fields) {{
+	results <- model$results()
+	selection <- results$select()
+	selection$select(fields)
+	results$extract(selection = selection)
+}}
+"""
+
+# The R side of an RSession.  It loads VisionEval once, then reads one
+# tab-delimited command per line from stdin, and answers each command
+# with a sentinel line on stdout once the command is complete.  All
+# other output (i.e. VisionEval progress messages) passes through.
+_r_session_script = """
+.libPaths("{r_lib}")
+require(visioneval)
+source("{r_runtime}", chdir = TRUE)
+""" + _r_extract_fields + """
+cat("@@EMAT:READY\\n")
+flush(stdout())
+commands <- file("stdin", open = "r")
+repeat {{
+	line <- readLines(commands, n = 1)
+	if (length(line) == 0) break
+	parts <- strsplit(line, "\\t", fixed = TRUE)[[1]]
+	if (parts[1] == "quit") break
+	status <- tryCatch({{
+		if (parts[1] == "open") {{
+			setwd(dirname(parts[2]))
+			assign("thismodel", openModel(parts[2]), envir = globalenv())
+		}} else if (parts[1] == "run") {{
+			thismodel$run()
+		}} else if (parts[1] == "extract") {{
+			if (length(parts) > 1) emat_extract(thismodel, parts[-1]) else thismodel$extract()
+		}} else if (parts[1] == "query") {{
+			if (length(parts) > 1) {{
+				thismodel$query(FileName = parts[2], Geography = c(Type = "Marea", Value = "RVMPO"))
+			}} else {{
+				thismodel$query(Geography = c(Type = "Marea", Value = "RVMPO"))
+			}}
+		}} else if (parts[1] != "ping") {{
+			stop(paste("unknown command", parts[1]))
+		}}
+		"OK"
+	}}, error = function(e) paste0("ERROR\\t", gsub("\\n", " ", conditionMessage(e))))
+	cat("\\n@@EMAT:", status, "\\n", sep = "")
+	flush(stdout())
+}}
+"""
+
+
+class RSession:
+	"""
+	A long-lived R process with VisionEval loaded, driven over a pipe.
+
+	Starting `Rscript`, loading the visioneval package and sourcing
+	`VisionEval.R` is a fixed cost paid by every model run launched
+	as a fresh process.  An RSession pays this cost once, and then
+	runs any number of models by sending "open", "run", "extract"
+	and "query" commands to the waiting R process.  The process is
+	restarted automatically if it crashes, and after `max_runs`
+	model runs, to limit any build-up of state in R.
+
+	Args:
+		r_runtime_path (str):
+			The VisionEval runtime directory, containing `VisionEval.R`.
+		r_library_path (str):
+			The R library directory where VisionEval is installed.
+		max_runs (int, optional):
+			Restart the R process after this many model runs.
+	"""
+
+	sentinel = b"@@EMAT:"
+
+	def __init__(self, r_runtime_path, r_library_path, max_runs=None):
+		self.r_runtime_path = r_runtime_path
+		self.r_library_path = r_library_path
+		self.max_runs = max_runs
+		self.process = None
+		self.n_runs = 0
+		self._script_filename = None
+
+	@property
+	def alive(self):
+		"""Bool: Whether the R process is running."""
+		return self.process is not None and self.process.poll() is None
+
+	def start(self):
+		"""
+		Start the R process, and wait until VisionEval is loaded.
+
+		Raises:
+			subprocess.CalledProcessError:
+				If R exits before VisionEval is loaded.
+		"""
+		if self.alive:
+			return
+		fd, self._script_filename = tempfile.mkstemp(prefix='verspm_session_', suffix='.R')
+		with os.fdopen(fd, 'wt') as r_script:
+			r_script.write(_r_session_script.format(
+				r_lib=self.r_library_path,
+				r_runtime=join_norm(self.r_runtime_path, 'VisionEval.R'),
+			))
+		_logger.info("VERSPM R SESSION starting")
+		self.process = subprocess.Popen(
+			[rscript_command(), self._script_filename],
+			stdin=subprocess.PIPE,
+			stdout=subprocess.PIPE,
+			stderr=subprocess.STDOUT,
+			**_process_group_kwargs(),
+		)
+		self.n_runs = 0
+		status, output = self._read_until_sentinel()
+		if status != b"READY":
+			raise subprocess.CalledProcessError(
+				self.process.returncode or -1, self.process.args, output,
 			)
 
-		if scope is None:
-			scope = Scope(join_norm(cwd, "verspm-scope.yml"))
+	def close(self):
+		"""Shut down the R process, if it is running."""
+		if self.alive:
+			try:
+				self.process.stdin.write(b"quit\n")
+				self.process.stdin.flush()
+				self.process.wait(timeout=30)
+			except (OSError, subprocess.TimeoutExpired):
+				self.process.kill()
+				self.process.wait()
+		self.process = None
+		if self._script_filename is not None:
+			try:
+				os.remove(self._script_filename)
+			except OSError:
+				pass
+			self._script_filename = None
+
+	def restart(self):
+		"""Shut down and then start the R process."""
+		self.close()
+		self.start()
+
+	def _read_until_sentinel(self, log=None):
+		"""
+		Read R output up to the next sentinel line.
+
+		Args:
+			log (RunLog, optional): Stream the output to this log,
+				instead of returning it.
+
+		Returns:
+			Tuple[bytes, bytes]:
+				The status from the sentinel line (None if R exited
+				instead), and the output that preceded it.
+		"""
+		output = []
+		while True:
+			line = self.process.stdout.readline()
+			if not line:
+				self.process.wait()
+				return None, b"".join(output)
+			if line.startswith(self.sentinel):
+				return line[len(self.sentinel):].rstrip(), b"".join(output)
+			if log is None:
+				output.append(line)
+			else:
+				log.write('stdout', line)
+
+	def command(self, *args, log=None, timeout=None):
+		"""
+		Send one command to R and wait for it to complete.
+
+		Args:
+			*args (str): The command and its arguments.
+			log (RunLog, optional): Stream the output to this log,
+				instead of returning it.
+			timeout (float, optional): Kill the R process, and any
+				processes it started, if the command runs for longer
+				than this many seconds.
+
+		Returns:
+			bytes: The R output generated by the command.
+
+		Raises:
+			RunTimeoutError:
+				If the command runs past the timeout.
+			subprocess.CalledProcessError:
+				If the command fails in R, or if R crashes.
+		"""
+		self.start()
+		try:
+			self.process.stdin.write(("\t".join(args) + "\n").encode())
+			self.process.stdin.flush()
+		except OSError:
+			self.process.wait()
+			raise subprocess.CalledProcessError(self.process.returncode or -1, args, b"")
+		timer = None
+		expired = []
+		if timeout is not None:
+			def expire(process=self.process):
+				expired.append(True)
+				kill_process_tree(process)
+			timer = threading.Timer(timeout, expire)
+			timer.daemon = True
+			timer.start()
+		try:
+			status, output = self._read_until_sentinel(log)
+		finally:
+			if timer is not None:
+				timer.cancel()
+		if status is None:
+			if expired:
+				_logger.error(f"VERSPM R SESSION timed out during {args[0]}")
+				raise RunTimeoutError(self.process.returncode or -1, args, timeout, output)
+			_logger.error(f"VERSPM R SESSION crashed during {args[0]}")
+			raise subprocess.CalledProcessError(self.process.returncode or -1, args, output)
+		if status != b"OK":
+			raise subprocess.CalledProcessError(1, args, output + status + b"\n")
+		return output
+
+	def run_model(self, model_path, extract=True, log=None, timeout=None, fields=None, query_file=None):
+		"""
+		Open, run, extract and query a VisionEval model.
+
+		Args:
+			model_path (str): The absolute path of the model directory.
+			extract (bool, default True): Extract the datastore tables
+				and query the measures after running the model.
+			log (RunLog, optional): Where to stream the R output.  If
+				not given, the output is kept in memory only.
+			timeout (float, optional): Kill the R process, and any
+				processes it started, if the model run takes longer
+				than this many seconds in total.  The process is
+				restarted for the next run.
+			fields (Collection[str], optional): Extract only these
+				datastore fields (see `VERSPModel.extraction_plan`), or
+				no tables at all if empty.  By default, all the tables
+				are extracted.
+			query_file (str or False, optional): Run only the query
+				specifications in this file, or no query if False.  By
+				default, the model's full query is run.
+
+		Returns:
+			subprocess.CompletedProcess:
+				The result, with the (tail of the) R output as `stdout`,
+				for consistency with running the model with `Rscript`.
+		"""
+		if self.max_runs and self.n_runs >= self.max_runs:
+			_logger.info(f"VERSPM R SESSION restarting after {self.n_runs} runs")
+			self.restart()
+		if log is None:
+			log = RunLog(tail_bytes=float('inf'))
+		args = ['RSession', model_path]
+		returncode = 0
+		usage = {}
+		timed_out = False
+		start_time = time.perf_counter()
+		try:
+			if not self.alive:
+				self.start()
+				usage['r_startup'] = time.perf_counter() - start_time
+			before = process_usage(self.process.pid)
+			commands = [('open', model_path), ('run',)]
+			if extract:
+				if fields is None:
+					commands.append(('extract',))
+				elif fields:
+					commands.append(('extract', *fields))
+				if query_file is None:
+					commands.append(('query',))
+				elif query_file:
+					commands.append(('query', query_file))
+			for command in commands:
+				remaining = None
+				if timeout is not None:
+					remaining = max(timeout - (time.perf_counter() - start_time), 0)
+				self.command(*command, log=log, timeout=remaining)
+		except subprocess.CalledProcessError as err:
+			if err.output:
+				log.write('stdout', err.output)
+			returncode = err.returncode
+			timed_out = isinstance(err, RunTimeoutError)
+		else:
+			after = process_usage(self.process.pid)
+			if before and after:
+				usage['child_cpu'] = after['cpu'] - before['cpu']
+				usage['child_max_rss_mb'] = after['max_rss_mb']
+		finally:
+			self.n_runs += 1
+		result = subprocess.CompletedProcess(args, returncode, log.tail('stdout'), b"")
+		result.usage = usage
+		result.timed_out = timed_out
+		return result
+
+
+_r_sessions = {}
+
+def get_r_session(r_runtime_path, r_library_path, max_runs=None):
+	"""
+	Get the RSession for a VisionEval installation, shared within this thread.
+
+	Each thread gets its own session, so that model runs in several
+	threads (see `VERSPModel.run_experiments`) can proceed at once.
+
+	Args:
+		r_runtime_path (str):
+			The VisionEval runtime directory, containing `VisionEval.R`.
+		r_library_path (str):
+			The R library directory where VisionEval is installed.
+		max_runs (int, optional):
+			Restart the R process after this many model runs.
+
+	Returns:
+		RSession
+	"""
+	k = (r_runtime_path, r_library_path, threading.get_ident())
+	if k not in _r_sessions:
+		_r_sessions[k] = RSession(r_runtime_path, r_library_path, max_runs)
+	_r_sessions[k].max_runs = max_runs
+	return _r_sessions[k]
+
+def close_r_sessions(thread_only=False):
+	"""
+	Shut down RSessions.
+
+	Args:
+		thread_only (bool, default False): Shut down only the
+			sessions of this thread, instead of every RSession
+			in this process.
+	"""
+	for k in list(_r_sessions):
+		if not thread_only or k[2] == threading.get_ident():
+			session = _r_sessions.pop(k, None)
+			if session is not None:
+				session.close()
+
+atexit.register(close_r_sessions)
+
+
+# The columns of the VisionEval output tables that are used by
+# `VERSPModel.post_process`, with the dtypes to read them as.
+_household_columns = {
+	'HhSize': 'int64',
+	'Income': 'float64',
+	'Dvmt': 'float64',
+	'WalkTrips': 'float64',
+	'DailyCO2e': 'float64',
+	'DailyGGE': 'float64',
+	'AveVehCostPM': 'float64',
+	'OwnCost': 'float64',
+}
+_marea_columns = {
+	'ComSvcUrbanGGE': 'float64',
+	'ComSvcNonUrbanGGE': 'float64',
+}
+
+@functools.lru_cache(maxsize=None)
+def _csv_engine():
+	"""The fastest available pandas CSV parsing engine."""
+	import importlib
+	import importlib.util
+	if importlib.util.find_spec('pyarrow') is None:
+		return 'c'
+	# An installed pyarrow may still not load, e.g. when built
+	# against another version of numpy.
+	try:
+		importlib.import_module('pyarrow.csv')
+	except ImportError:
+		return 'c'
+	return 'pyarrow'
+
+def read_output_table(filename, columns):
+	"""
+	Read selected columns from a VisionEval output table.
+
+	If the CSV file does not exist but a Parquet file with the same
+	name does, as in a Parquet archive, only the selected columns are
+	read from that instead.
+
+	Args:
+		filename (str): The CSV file to read.
+		columns (Mapping[str, str]): The columns to read, and their dtypes.
+
+	Returns:
+		pandas.DataFrame
+	"""
+	if not os.path.exists(filename):
+		# Tables in a Parquet archive (see `archive_output_tables`)
+		# are stored under the same name with a different extension.
+		parquet_filename = os.path.splitext(filename)[0] + '.parquet'
+		if os.path.exists(parquet_filename):
+			return pd.read_parquet(
+				parquet_filename,
+				columns=list(columns),
+			).astype(dict(columns))
+	return pd.read_csv(
+		filename,
+		usecols=list(columns),
+		dtype=dict(columns),
+		engine=_csv_engine(),
+	)[list(columns)]
+
+
+# The datastore tables written by VisionEval's extract step, which
+# are stored as Parquet files in a Parquet archive.
+_table_filename = re.compile(r"^[A-Za-z]+_[0-9]{4}_[0-9]+\.csv$")
+
+def archive_output_tables(output_path, archive_path, compression='zstd'):
+	"""
+	Archive model outputs, with each datastore table as a Parquet file.
+
+	Each extracted datastore table (e.g. `Household_2038_1.csv`) is
+	written as a compressed Parquet file of the same name (e.g.
+	`Household_2038_1.parquet`), which can later be read back a few
+	columns at a time using `read_output_table`.  All other output
+	files, including query results and computed measures, are copied
+	as they are, so measure parsers can read them directly.  A
+	`manifest.json` file describes the archive content.
+
+	Args:
+		output_path (str): The model output directory.
+		archive_path (str): The directory to write the archive into.
+		compression (str, default 'zstd'): The Parquet compression codec.
+
+	Returns:
+		dict: The manifest.
+	"""
+	os.makedirs(archive_path, exist_ok=True)
+	manifest = dict(tables={}, files=[])
+	for entry in sorted(os.scandir(output_path), key=lambda e: e.name):
+		destination = os.path.join(archive_path, entry.name)
+		if entry.is_dir():
+			shutil.copytree(entry.path, destination, dirs_exist_ok=True)
+			manifest['files'].append(entry.name + '/')
+		elif _table_filename.match(entry.name):
+			table = entry.name[:-len('.csv')]
+			df = pd.read_csv(entry.path, engine=_csv_engine())
+			df.to_parquet(
+				os.path.join(archive_path, f"{table}.parquet"),
+				compression=compression,
+				index=False,
+			)
+			manifest['tables'][table] = dict(
+				file=f"{table}.parquet",
+				rows=len(df),
+				columns=list(df.columns),
+			)
+		else:
+			shutil.copy2(entry.path, destination)
+			manifest['files'].append(entry.name)
+	with open(os.path.join(archive_path, 'manifest.json'), 'wt') as f:
+		json.dump(manifest, f, indent=1)
+	return manifest
+
+
+# The manifest of an experiment archive in the 'blobs' archive format.
+_blob_manifest_filename = 'blob_manifest.json'
+
+def blob_path(store_path, digest):
+	"""The file of a blob in a blob store, by the SHA-256 digest of its content."""
+	return os.path.join(store_path, digest[:2], digest + '.gz')
+
+
+def store_blob(store_path, filename, compresslevel=1):
+	"""
+	Store a file in a content-addressed blob store.
+
+	The file is stored (gzip compressed) under the SHA-256 digest of its
+	content, unless a blob with the same content is already stored, so
+	identical files from many experiments are stored only once.  A new
+	blob is written to a temporary file first and then moved into place,
+	so concurrent writers never see a partial blob.
+
+	Args:
+		store_path (str): The blob store directory.
+		filename (str): The file to store.
+		compresslevel (int, default 1): The gzip compression level.
+
+	Returns:
+		Tuple[str, bool]: The digest, and whether a new blob was written.
+	"""
+	import gzip
+	h = hashlib.sha256()
+	with open(filename, 'rb') as f:
+		for chunk in iter(lambda: f.read(1 << 20), b""):
+			h.update(chunk)
+	digest = h.hexdigest()
+	destination = blob_path(store_path, digest)
+	if os.path.exists(destination):
+		return digest, False
+	os.makedirs(os.path.dirname(destination), exist_ok=True)
+	fd, tmp = tempfile.mkstemp(dir=os.path.dirname(destination), suffix='.tmp')
+	try:
+		with open(filename, 'rb') as f, os.fdopen(fd, 'wb') as raw:
+			with gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=compresslevel, mtime=0) as g:
+				shutil.copyfileobj(f, g, 1 << 20)
+		os.replace(tmp, destination)
+	except BaseException:
+		if os.path.exists(tmp):
+			os.remove(tmp)
+		raise
+	return digest, True
+
+
+def archive_output_blobs(output_path, archive_path, store_path, rel_output_path='output'):
+	"""
+	Archive model outputs in a content-addressed blob store.
+
+	Each output file is stored with `store_blob`, and the archive itself
+	gets only a manifest, `blob_manifest.json`, giving the digest and
+	size of each file.  The manifest refers to the store by its path
+	relative to the archive, so a tree of archives and their store can
+	be moved together.  Outputs archived this way are read back with
+	`ArchivedOutputs`.
+
+	Args:
+		output_path (str): The model output directory.
+		archive_path (str): The directory to write the manifest into.
+		store_path (str): The blob store directory.
+		rel_output_path (str, default 'output'): The name of the output
+			directory, under which the files are listed in the manifest.
+
+	Returns:
+		dict: The manifest.
+	"""
+	os.makedirs(archive_path, exist_ok=True)
+	manifest = dict(
+		store=os.path.relpath(store_path, archive_path),
+		files={},
+	)
+	n_new = 0
+	for root, dirs, files in os.walk(output_path):
+		dirs.sort()
+		for name in sorted(files):
+			filename = os.path.join(root, name)
+			digest, new = store_blob(store_path, filename)
+			n_new += new
+			rel = os.path.normpath(os.path.join(rel_output_path, os.path.relpath(filename, output_path)))
+			manifest['files'][rel.replace(os.sep, '/')] = dict(
+				sha256=digest,
+				size=os.path.getsize(filename),
+			)
+	with open(os.path.join(archive_path, _blob_manifest_filename), 'wt') as f:
+		json.dump(manifest, f, indent=1)
+	_logger.debug(f"VERSPM ARCHIVE {n_new} new blobs for {len(manifest['files'])} files")
+	return manifest
+
+
+class UnarchivedOutputError(FileNotFoundError):
+	"""
+	An output needed for a measure is not in an experiment archive.
+
+	Runs only archive the outputs needed for the measures of the scope
+	at the time, unless they are made with `full_extract`.
+
+	Attributes:
+		measure_names (List[str]): The measures that need the output.
+	"""
+
+	def __init__(self, measure_names, missing):
+		self.measure_names = list(measure_names)
+		super().__init__(f"{', '.join(self.measure_names)} unavailable, {missing} not found")
+
+
+class ArchivedOutputs:
+	"""
+	The model outputs in an experiment archive, read without extracting them.
+
+	Outputs archived as `run_archive.zip` are streamed from the zip file
+	one member at a time, outputs archived in a blob store (the 'blobs'
+	archive format) are streamed from their blobs, and outputs archived
+	as files (the 'parquet' archive format) are read in place.
+
+	Args:
+		archive_path (str): The experiment archive directory.
+		rel_output_path (str, default 'output'): The output directory
+			within the archive.
+
+	Raises:
+		FileNotFoundError: If the archive has no outputs.
+	"""
+
+	def __init__(self, archive_path, rel_output_path='output'):
+		self.archive_path = archive_path
+		self.rel_output_path = rel_output_path
+		self.zipname = os.path.join(archive_path, 'run_archive.zip')
+		self.zip = None
+		self.blobs = None
+		manifest_filename = os.path.join(archive_path, _blob_manifest_filename)
+		if os.path.exists(self.zipname):
+			import zipfile
+			self.zip = zipfile.ZipFile(self.zipname)
+			self._members = {
+				os.path.normpath(name): name
+				for name in self.zip.namelist()
+			}
+		elif os.path.exists(manifest_filename):
+			with open(manifest_filename, 'rt') as f:
+				manifest = json.load(f)
+			store_path = os.path.join(archive_path, manifest['store'])
+			self.blobs = {
+				os.path.normpath(name): blob_path(store_path, entry['sha256'])
+				for name, entry in manifest['files'].items()
+			}
+		elif not os.path.isdir(join_norm(archive_path, rel_output_path)):
+			raise FileNotFoundError(join_norm(archive_path, rel_output_path))
+
+	def _member(self, filename):
+		name = os.path.normpath(os.path.join(self.rel_output_path, filename))
+		if name not in self._members:
+			raise FileNotFoundError(f"{self.zipname}:{name}")
+		return self._members[name]
+
+	def _open_blob(self, filename):
+		import gzip
+		name = os.path.normpath(os.path.join(self.rel_output_path, filename))
+		if name not in self.blobs:
+			raise FileNotFoundError(os.path.join(self.archive_path, name))
+		return gzip.open(self.blobs[name], 'rb')
+
+	def read_text(self, filename):
+		"""
+		Read a text output file.
+
+		Args:
+			filename (str): The file name, relative to the output directory.
+
+		Returns:
+			str
+		"""
+		if self.zip is not None:
+			with self.zip.open(self._member(filename)) as f:
+				return io.TextIOWrapper(f, newline='').read()
+		if self.blobs is not None:
+			with self._open_blob(filename) as f:
+				return io.TextIOWrapper(f, newline='').read()
+		f = join_norm(self.archive_path, self.rel_output_path, filename)
+		if not os.path.exists(f):
+			raise FileNotFoundError(f)
+		with open(f, 'rt', newline='') as fi:
+			return fi.read()
+
+	def read_table(self, filename, columns):
+		"""
+		Read selected columns from an output table, like `read_output_table`.
+
+		Args:
+			filename (str): The CSV file name, relative to the output directory.
+			columns (Mapping[str, str]): The columns to read, and their dtypes.
+
+		Returns:
+			pandas.DataFrame
+		"""
+		if self.zip is not None or self.blobs is not None:
+			opened = self.zip.open(self._member(filename)) if self.zip is not None else self._open_blob(filename)
+			with opened as f:
+				return pd.read_csv(
+					f,
+					usecols=list(columns),
+					dtype=dict(columns),
+					engine=_csv_engine(),
+				)[list(columns)]
+		return read_output_table(
+			join_norm(self.archive_path, self.rel_output_path, filename),
+			columns,
+		)
+
+	def restore(self, destination):
+		"""
+		Write all the archived outputs out as files.
+
+		Args:
+			destination (str): The directory to write the output
+				directory (`rel_output_path`) into.
+
+		Returns:
+			str: The restored output directory.
+		"""
+		output_path = join_norm(destination, self.rel_output_path)
+		if self.zip is not None:
+			self.zip.extractall(destination)
+		elif self.blobs is not None:
+			for name in self.blobs:
+				filename = os.path.join(destination, name)
+				os.makedirs(os.path.dirname(filename), exist_ok=True)
+				with self._open_blob(os.path.relpath(name, self.rel_output_path)) as f, open(filename, 'wb') as g:
+					shutil.copyfileobj(f, g, 1 << 20)
+		else:
+			shutil.copytree(join_norm(self.archive_path, self.rel_output_path), output_path, dirs_exist_ok=True)
+		return output_path
+
+	def close(self):
+		"""Close the zip file, if any."""
+		if self.zip is not None:
+			self.zip.close()
+			self.zip = None
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		self.close()
+
+
+_deflators = {}
+
+def read_deflators(filename):
+	"""
+	Read a VisionEval deflators file, shared within this process.
+
+	Args:
+		filename (str): The deflators CSV file.
+
+	Returns:
+		pandas.Series: The deflator values, indexed by year as str.
+	"""
+	filename = os.path.abspath(filename)
+	if filename not in _deflators:
+		deflators_df = pd.read_csv(filename)
+		_deflators[filename] = pd.Series(
+			deflators_df['Value'].to_numpy(),
+			index=deflators_df['Year'].astype(str),
+		)
+	return _deflators[filename]
+
+def deflate_currency(values, deflators, FromYear, ToYear):
+	"""
+	Convert currency values from one year's dollars to another's.
+
+	Args:
+		values (array-like): The currency values.
+		deflators (pandas.Series): The deflators, from `read_deflators`.
+		FromYear, ToYear (int or str): The years to convert between.
+
+	Returns:
+		array-like
+
+	Raises:
+		KeyError: If either year is not in the deflators.
+	"""
+	FromYear = str(FromYear)
+	ToYear = str(ToYear)
+	if FromYear not in deflators.index:
+		raise KeyError(f"invalid FromYear {FromYear}")
+	if ToYear not in deflators.index:
+		raise KeyError(f"invalid ToYear {ToYear}")
+	return values * deflators[ToYear] / deflators[FromYear]
+
+
+
+# The cell values that pandas reads as missing by default.
+_na_values = {
+	'', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan',
+	'1.#IND', '1.#QNAN', '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None',
+	'n/a', 'nan', 'null',
+}
+
+
+class IndexedTable:
+	"""
+	A CSV table, with an index of its row and column labels.
+
+	Cells are looked up by label through the index and converted to
+	float only when they are used, so a table with dozens of measures
+	can be parsed without building a DataFrame.  The equivalent
+	DataFrame, as read by `pandas.read_csv(..., index_col=0)`, is
+	available as `frame` for any getter that needs it, and is built
+	from the text already read instead of reading the file again.
+
+	Args:
+		text (str): The CSV text.
+		**reader_kwargs: Keyword arguments for `pandas.read_csv`,
+			used only to build `frame`.
+	"""
+
+	def __init__(self, text, **reader_kwargs):
+		self.text = text
+		self.reader_kwargs = reader_kwargs
+		rows = list(csv.reader(io.StringIO(text)))
+		header = rows[0] if rows else []
+		self.cells = rows[1:]
+		self.columns = {}
+		for position, label in enumerate(header[1:], start=1):
+			self.columns.setdefault(label, position)
+		self.index = {}
+		self.duplicates = set()
+		for position, row in enumerate(self.cells):
+			if row:
+				if row[0] in self.index:
+					self.duplicates.add(row[0])
+				self.index.setdefault(row[0], position)
+
+	def value(self, row, column):
+		"""
+		Get one cell as a float.
+
+		Args:
+			row (str): The row label.
+			column (str): The column label.
+
+		Returns:
+			float
+
+		Raises:
+			KeyError: If the row or column is not in the table, or
+				the row label is not unique.
+		"""
+		if row in self.duplicates:
+			raise KeyError(f"row {row!r} is not unique")
+		cell = self.cells[self.index[row]][self.columns[column]]
+		try:
+			return float(cell)
+		except ValueError:
+			if cell.strip() in _na_values:
+				return np.nan
+			raise
+
+	@functools.cached_property
+	def frame(self):
+		"""pandas.DataFrame: The table as read by pandas."""
+		return pd.read_csv(io.StringIO(self.text), **self.reader_kwargs)
+
+
+def compile_getter(getter):
+	"""
+	Compile a getter into terms that can be looked up in an `IndexedTable`.
+
+	Args:
+		getter (emat.model.core_files.parsers.Getter): A getter made
+			from `loc` items, and sums and differences of them.
+
+	Returns:
+		List[Tuple[float, str, str]] or None:
+			The sign, row and column label of each term to sum, or
+			None if the getter cannot be compiled (e.g. it uses `iloc`
+			or slices), in which case it is used on the DataFrame.
+			Getters are looked into through the internals of the emat
+			parsers, so if those are not as expected (as in another
+			version of emat) nothing is compiled.
+	"""
+	loc_type = getattr(emat_parsers, '_Loc', None)
+	neg_loc_type = getattr(emat_parsers, '_NegLoc', None)
+	sum_type = getattr(emat_parsers, 'SumOfGetter', None)
+	if loc_type is not None and neg_loc_type is not None and isinstance(getter, (loc_type, neg_loc_type)):
+		item = getattr(getter, '_item', None)
+		if not isinstance(item, (tuple, list)) or len(item) != 2 or any(isinstance(i, slice) for i in item):
+			return None
+		sign = -1.0 if isinstance(getter, neg_loc_type) else 1.0
+		return [(sign, item[0], item[1])]
+	if sum_type is not None and isinstance(getter, sum_type):
+		parts = getattr(getter, '_parts', None)
+		if parts is None:
+			return None
+		terms = []
+		for part in parts:
+			part_terms = compile_getter(part)
+			if part_terms is None:
+				return None
+			terms.extend(part_terms)
+		return terms
+	return None
+
+
+class _SelectiveParser:
+	"""
+	Parser methods that get only the requested measures from data read once.
+	"""
+
+	def read(self, from_dir, measure_names=None):
+		"""
+		Read the performance measures.
+
+		Args:
+			from_dir (Path-like): The base directory from which to read the data.
+			measure_names (Collection[str], optional): Get only these
+				measures.  If not given, all the measures are read.
+
+		Returns:
+			Dict: The measures read from this file.
+		"""
+		return self.parse(self.load(from_dir), measure_names, from_dir)
+
+	def parse(self, data, measure_names=None, from_dir=None):
+		"""
+		Get the performance measures from data already read.
+
+		Args:
+			data: The data, as returned by `load`.
+			measure_names (Collection[str], optional): Get only these
+				measures.  If not given, all the measures are read.
+			from_dir (Path-like, optional): The directory the data was
+				read from, for error messages.
+
+		Returns:
+			Dict: The measures.
+		"""
+		result = {}
+		for measure_name in self.measure_getters:
+			if measure_names is not None and measure_name not in measure_names:
+				continue
+			try:
+				result[measure_name] = self._get(data, measure_name)
+			except Exception:
+				filename = os.path.join(from_dir or '', self.filename)
+				if self.handle_errors == 'nan':
+					_logger.exception(f"Error in reading {filename}")
+					result[measure_name] = np.nan
+				else:
+					_logger.error(f"Error in reading {filename} for {measure_name}")
+					raise
+		return result
+
+
+class CompiledTableParser(_SelectiveParser, TableParser):
+	"""
+	A TableParser that resolves `loc` getters through an index of the table.
+
+	The getters are compiled (see `compile_getter`) when the parser is
+	created.  Each time measures are read, the file is read once, into an
+	`IndexedTable`, and each compiled getter is a few dict lookups,
+	instead of a `DataFrame.loc` lookup.  Only the requested measures are
+	computed.  Getters that cannot be compiled are used on the equivalent
+	DataFrame, which is only built if one of them is requested.
+
+	Args:
+		filename (str): The name of the CSV file.
+		measure_getters (Mapping[str, Getter]): The getter for each measure.
+		handle_errors (str, default 'raise'): How to handle errors when
+			reading a table, one of {'raise', 'nan'}
+		**kwargs: Keyword arguments for `pandas.read_csv`; the table must
+			be read with `index_col=0` for the getters to be compiled.
+	"""
+
+	def __init__(self, filename, measure_getters, handle_errors='raise', **kwargs):
+		super().__init__(filename, measure_getters, pd.read_csv, handle_errors, **kwargs)
+		compilable = kwargs.get('index_col') == 0 and set(kwargs) <= {'index_col'}
+		self.compiled = {
+			name: compile_getter(getter) if compilable else None
+			for name, getter in measure_getters.items()
+		}
+
+	def load(self, from_dir):
+		"""
+		Read the table.
+
+		Args:
+			from_dir (Path-like): The base directory from which to read the data.
+
+		Returns:
+			IndexedTable
+		"""
+		f = os.path.join(from_dir, self.filename)
+		if not os.path.exists(f):
+			raise FileNotFoundError(f)
+		with open(f, 'rt', newline='') as fi:
+			return self.loads(fi.read())
+
+	def loads(self, text):
+		"""
+		Index the table from its text.
+
+		Args:
+			text (str): The CSV text.
+
+		Returns:
+			IndexedTable
+		"""
+		return IndexedTable(text, **self.reader_kwargs)
+
+	def _get(self, table, measure_name):
+		terms = self.compiled[measure_name]
+		if terms is None:
+			return self.measure_getters[measure_name](table.frame)
+		return sum(sign * table.value(row, column) for sign, row, column in terms)
+
+
+class CompiledMappingParser(_SelectiveParser, MappingParser):
+	"""
+	A MappingParser that reads JSON files without a YAML parser.
+
+	Only the requested measures are computed, and the mapping can
+	be given directly to `parse` when it is already in memory, such
+	as the measures just computed by `VERSPModel.post_process`.
+
+	Args:
+		filename (str): The name of the JSON (or YAML) file.
+		measure_getters (Mapping[str, Getter]): The getter for each measure.
+		handle_errors (str, default 'raise'): How to handle errors when
+			reading a file, one of {'raise', 'nan'}
+	"""
+
+	def __init__(self, filename, measure_getters, handle_errors='raise'):
+		super().__init__(filename, measure_getters, None, handle_errors)
+
+	def load(self, from_dir):
+		"""
+		Read the mapping.
+
+		Args:
+			from_dir (Path-like): The base directory from which to read the data.
+
+		Returns:
+			Mapping
+		"""
+		f = os.path.join(from_dir, self.filename)
+		if not os.path.exists(f):
+			raise FileNotFoundError(f)
+		with open(f, 'rt') as fi:
+			return self.loads(fi.read())
+
+	def loads(self, text):
+		"""
+		Read the mapping from its text.
+
+		Args:
+			text (str): The JSON (or YAML) text.
+
+		Returns:
+			Mapping
+		"""
+		try:
+			return json.loads(text)
+		except ValueError:
+			# JSON is (almost) a subset of YAML, which was read before.
+			import yaml
+			return yaml.safe_load(text)
+
+	def _get(self, data, measure_name):
+		return self.measure_getters[measure_name](data)
+
+
+_query_spec_name = re.compile(r'\bName\s*=\s*"([^"]+)"')
+_query_spec_function = re.compile(r'\bFunction\s*=\s*"([^"]*)"')
+_r_identifier = re.compile(r"[A-Za-z.][A-Za-z0-9._]*")
+
+def query_measure_name(spec_name):
+	"""
+	The row name of a query specification in the query results.
+
+	The query drops the "Ma" geography marker from each name, so that
+	e.g. "UrbanHhDvmt_Ma" is reported as "UrbanHhDvmt", and
+	"UrbanHhDvmt_MaAz" as "UrbanHhDvmt_Az".
+	"""
+	return re.sub(r"_Ma(?=[A-Z_]|$)", "_", spec_name).rstrip("_")
+
+
+def split_query_specs(text):
+	"""
+	Split the text of a `Query-Spec.R` file into its specifications.
+
+	The file defines a single list of specifications, each itself a
+	`list(...)`.  The text is split at the commas between them, skipping
+	over strings and comments, so a selection of the specifications can
+	be written back out with `join_query_specs`.
+
+	Args:
+		text (str): The text of the file.
+
+	Returns:
+		Tuple[str, List[str], str]:
+			The text before the first specification, the text of each
+			specification (with any comments before it), and the text
+			after the last.
+	"""
+	depth = 0
+	quote = None
+	comment = False
+	start = None
+	i = 0
+	while i < len(text):
+		c = text[i]
+		if comment:
+			comment = c != "\n"
+		elif quote:
+			if c == "\\":
+				i += 1
+			elif c == quote:
+				quote = None
+		elif c in "\"'":
+			quote = c
+		elif c == "#":
+			comment = True
+		elif c == "(":
+			depth += 1
+			if depth == 1:
+				start = i + 1
+		elif c == ")":
+			depth -= 1
+			if depth == 0:
+				return text[:start], _split_items(text[start:i]), text[i:]
+		i += 1
+	raise ValueError("no list of query specifications found")
+
+
+def _split_items(text):
+	"""Split the arguments of an R call at its top level commas."""
+	depth = 0
+	quote = None
+	comment = False
+	items = []
+	start = 0
+	i = 0
+	while i < len(text):
+		c = text[i]
+		if comment:
+			comment = c != "\n"
+		elif quote:
+			if c == "\\":
+				i += 1
+			elif c == quote:
+				quote = None
+		elif c in "\"'":
+			quote = c
+		elif c == "#":
+			comment = True
+		elif c == "(":
+			depth += 1
+		elif c == ")":
+			depth -= 1
+		elif c == "," and depth == 0:
+			items.append(text[start:i])
+			start = i + 1
+		i += 1
+	items.append(text[start:])
+	return [item for item in items if _query_spec_name.search(item)]
+
+
+def join_query_specs(head, specs, tail):
+	"""The text of a `Query-Spec.R` file with the given specifications."""
+	return head + ",".join(specs) + "\n" + tail
+
+
+def select_query_specs(text, measure_names):
+	"""
+	Select the query specifications needed for some query results.
+
+	Args:
+		text (str): The text of a `Query-Spec.R` file.
+		measure_names (Collection[str]): The names of the rows needed
+			in the query results (see `query_measure_name`).
+
+	Returns:
+		str or None:
+			The text of a `Query-Spec.R` file with just the specifications
+			giving these rows, and the specifications their `Function`s
+			use, or None if some of the rows are not given by any of the
+			specifications.
+	"""
+	head, specs, tail = split_query_specs(text)
+	names = [_query_spec_name.search(spec).group(1) for spec in specs]
+
+	# Specifications with `Breaks` give a row for each break, with
+	# the break name appended after a dot, e.g. "UrbanHhDvmtLowInc.min".
+	def lookup(mapping, name):
+		return mapping.get(name, mapping.get(name.rsplit('.', 1)[0]))
+
+	by_row = {query_measure_name(name): name for name in names}
+	by_name = {name: name for name in names}
+	missing = [m for m in measure_names if lookup(by_row, m) is None]
+	if missing:
+		_logger.warning(f"VERSPM QUERY no specification for {sorted(missing)}, running the full query")
+		return None
+	depends = {}
+	for name, spec in zip(names, specs):
+		function = _query_spec_function.search(spec)
+		depends[name] = {
+			lookup(by_name, token)
+			for token in (_r_identifier.findall(function.group(1)) if function else ())
+		} - {None}
+	needed = set()
+	pending = [lookup(by_row, m) for m in measure_names]
+	while pending:
+		name = pending.pop()
+		if name not in needed:
+			needed.add(name)
+			pending.extend(depends[name])
+	return join_query_specs(head, [s for n, s in zip(names, specs) if n in needed], tail)
+
+
+
+def read_run_parameters(model_path):
+	"""
+	Read the run parameters of a VisionEval model.
+
+	Args:
+		model_path (str): The model directory.
+
+	Returns:
+		dict
+	"""
+	with open(join_norm(model_path, 'defs', 'run_parameters.json'), 'rt') as f:
+		return json.load(f)
+
+
+_base_year_digests = {}
+
+def base_year_input_digests(model_path, base_year):
+	"""
+	Get a hash of the base year content of each model input file.
+
+	For input files with a `Year` column, only the header and the base
+	year rows are hashed; every other input or definition file (other
+	than the run parameters, which set the years to run) applies to all
+	years and is hashed entirely.
+
+	Args:
+		model_path (str): The model directory.
+		base_year (str or None): The base year, or None to hash
+			all the rows of every file.
+
+	Returns:
+		dict: The hash of each file, by path relative to `model_path`.
+	"""
+	digests = {}
+	for subdir in ('inputs', 'defs'):
+		for dirpath, dirnames, filenames in os.walk(join_norm(model_path, subdir)):
+			for filename in filenames:
+				full_path = os.path.join(dirpath, filename)
+				relpath = os.path.relpath(full_path, model_path).replace(os.sep, '/')
+				if relpath == 'defs/run_parameters.json':
+					continue
+				stat = os.stat(full_path)
+				cache_key = (os.path.realpath(full_path), stat.st_size, stat.st_mtime_ns, base_year)
+				if cache_key not in _base_year_digests:
+					h = hashlib.sha256()
+					if filename.endswith('.csv'):
+						with open(full_path, 'rt', newline='') as f:
+							rows = csv.reader(f)
+							header = next(rows, [])
+							h.update(repr(header).encode())
+							if 'Year' in header and base_year is not None:
+								year_col = header.index('Year')
+								rows = (row for row in rows if row[year_col] == str(base_year))
+							for row in rows:
+								h.update(repr(row).encode())
+					else:
+						with open(full_path, 'rb') as f:
+							h.update(f.read())
+					_base_year_digests[cache_key] = h.hexdigest()
+				digests[relpath] = _base_year_digests[cache_key]
+	return digests
+
+
+# The first module of VERSPM that reads each input file written by
+# `setup`, from the module specifications in VisionEval.  Every other
+# input or definition file is taken to be read by the first module (or
+# by `initializeModel`), so a change to it means a run from the start.
+verspm_input_modules = {
+	'inputs/azone_per_cap_inc.csv': 'PredictIncome',
+	'inputs/bzone_parking.csv': 'AssignParkingRestrictions',
+	'inputs/bzone_travel_demand_mgt.csv': 'AssignDemandManagement',
+	'inputs/marea_transit_service.csv': 'AssignTransitService',
+	'inputs/azone_lttrk_prop.csv': 'AssignVehicleType',
+	'inputs/azone_hh_veh_mean_age.csv': 'AssignVehicleAge',
+	'inputs/azone_hh_veh_own_taxes.csv': 'CalculateVehicleOwnCost',
+	'inputs/azone_prop_sov_dvmt_diverted.csv': 'DivertSovTravel',
+	'inputs/region_carsvc_powertrain_prop.csv': 'AssignHhVehiclePowertrain',
+	'inputs/marea_operations_deployment.csv': 'CalculateRoadPerformance',
+	'inputs/other_ops_effectiveness.csv': 'CalculateRoadPerformance',
+	'inputs/marea_speed_smooth_ecodrive.csv': 'CalculateMpgMpkwhAdjustments',
+	'inputs/azone_fuel_power_cost.csv': 'CalculateVehicleOperatingCost',
+	'inputs/region_prop_externalities_paid.csv': 'CalculateVehicleOperatingCost',
+	'inputs/region_comsvc_powertrain_prop.csv': 'CalculateComEnergyAndEmissions',
+	'inputs/marea_transit_powertrain_prop.csv': 'CalculatePtranEnergyAndEmissions',
+}
+
+
+def run_model_steps(script):
+	"""
+	Split a `run_model.R` script into the steps run for each year.
+
+	The steps are the statements in the body of the loop over the model
+	years: a single `runModule` call, or a nested loop (such as the
+	repeated travel performance modules), which is kept whole, as the
+	model can only be stopped and restarted between its iterations.
+
+	Args:
+		script (str): The text of the script.
+
+	Returns:
+		Tuple[str, List[Tuple[str, Tuple[str]]], str]:
+			The text before the steps (up to and including the start
+			of the year loop), the text and module names of each step,
+			and the text after the steps.
+	"""
+	loop = re.search(r"for\s*\(\s*Year\s+in\s+getYears\(\)\s*\)\s*\{[^\n]*\n", script)
+	if loop is None:
+		raise ValueError("cannot find the loop over model years in run_model.R")
+	head = script[:loop.end()]
+	steps = []
+	depth = 0
+	step = ''
+	lines = script[loop.end():].splitlines(keepends=True)
+	for n, line in enumerate(lines):
+		code = line.split('#', 1)[0]
+		if depth == 0 and code.strip().startswith('}'):
+			return head, steps, ''.join(lines[n:])
+		step += line
+		depth += code.count('{') - code.count('}')
+		if depth == 0 and code.strip():
+			steps.append((step, tuple(re.findall(r'runModule\(\s*"(\w+)"', step))))
+			step = ''
+	raise ValueError("cannot find the end of the loop over model years in run_model.R")
+
+
+def find_datastore(model_path, datastore_name='Datastore'):
+	"""
+	Find the datastore written by a VisionEval model run.
+
+	Args:
+		model_path (str): The model directory.
+		datastore_name (str, default 'Datastore'): The datastore name
+			given in the run parameters.
+
+	Returns:
+		str or None: The absolute path of the datastore, if found.
+	"""
+	for dirpath, dirnames, filenames in os.walk(model_path):
+		if datastore_name in dirnames:
+			return join_norm(dirpath, datastore_name)
+	return None
+
+
+class RunTimeoutError(subprocess.CalledProcessError):
+	"""
+	A model run exceeded its time limit, and was killed.
+
+	This is a `CalledProcessError`, so a timed out experiment is
+	handled like any other failed run.
+	"""
+
+	def __init__(self, returncode, cmd, timeout, output=None, stderr=None):
+		super().__init__(returncode, cmd, output, stderr)
+		self.timeout = timeout
+
+	def __str__(self):
+		return f"Command '{self.cmd}' timed out after {self.timeout} seconds, and was killed"
+
+
+# Lines of R output that report the progress of a model run: those
+# written by the `cat('run_model.R: ...')` calls in the model script,
+# and the start and end of each module by VisionEval.
+_progress_script = re.compile(rb"run_model\.R: *(.*?)\s*$")
+_progress_module = re.compile(
+	rb"(Start|Finish)\w* module '?([\w.]+)'? (?:from package '?[\w.]+'? )?for year '?([0-9]{4})'?",
+	re.IGNORECASE,
+)
+
+
+def parse_progress(line):
+	"""
+	Parse a line of R output that reports the progress of a model run.
+
+	Args:
+		line (bytes): A line of R output.
+
+	Returns:
+		dict or None:
+			For a line from the model script, a dict with `kind`
+			"script" and the `message`; for the start or finish of a
+			module, a dict with `kind` "module", the `action` ("start"
+			or "finish"), `module` and `year`; and otherwise None.
+	"""
+	match = _progress_module.search(line)
+	if match:
+		return dict(
+			kind='module',
+			action=match.group(1).decode().lower(),
+			module=match.group(2).decode(),
+			year=match.group(3).decode(),
+		)
+	match = _progress_script.search(line)
+	if match:
+		return dict(kind='script', message=match.group(1).decode(errors='replace'))
+	return None
+
+
+class RunLog:
+	"""
+	The output of an R run, streamed to log files as it is produced.
+
+	Each line of output is written to `stdout.log` or `stderr.log` in
+	the log directory straight away, so the logs of a long run can be
+	followed while it runs, and are complete even if it crashes or is
+	killed.  Only a bounded tail of each stream is kept in memory.
+
+	Args:
+		directory (str, optional): The directory for the log files.
+			If not given, no log files are written.
+		tail_bytes (int, default 65536): The (approximate) maximum
+			size of the tail of each stream kept in memory.
+		progress (callable, optional): A function called with the
+			dict from `parse_progress` for each line of output that
+			reports progress.  It may be called from a thread that
+			reads the output.
+		context (dict, optional): Extra items added to each dict
+			passed to `progress`.
+	"""
+
+	streams = ('stdout', 'stderr')
+
+	def __init__(self, directory=None, tail_bytes=65536, progress=None, context=None):
+		self.directory = directory
+		self.tail_bytes = tail_bytes
+		self.progress = progress
+		self.context = dict(context or {})
+		self._tails = {stream: collections.deque() for stream in self.streams}
+		self._tail_sizes = {stream: 0 for stream in self.streams}
+		self._files = {}
+		if directory is not None:
+			os.makedirs(directory, exist_ok=True)
+			for stream in self.streams:
+				self._files[stream] = open(join_norm(directory, f"{stream}.log"), 'wb')
+
+	def write(self, stream, line):
+		"""
+		Record a line of output.
+
+		Args:
+			stream (str): 'stdout' or 'stderr'.
+			line (bytes): The line, including its line ending.
+		"""
+		f = self._files.get(stream)
+		if f is not None:
+			f.write(line)
+			f.flush()
+		tail = self._tails[stream]
+		tail.append(line)
+		self._tail_sizes[stream] += len(line)
+		while self._tail_sizes[stream] > self.tail_bytes and len(tail) > 1:
+			self._tail_sizes[stream] -= len(tail.popleft())
+		if self.progress is not None:
+			event = parse_progress(line)
+			if event is not None:
+				event.update(self.context)
+				try:
+					self.progress(event)
+				except Exception:
+					_logger.exception("VERSPM RUN error in progress callback")
+
+	def tail(self, stream='stdout'):
+		"""
+		Get the tail of a stream kept in memory.
+
+		Args:
+			stream (str, default 'stdout'): 'stdout' or 'stderr'.
+
+		Returns:
+			bytes
+		"""
+		return b"".join(self._tails[stream])
+
+	def close(self):
+		"""Close the log files."""
+		while self._files:
+			_, f = self._files.popitem()
+			f.close()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		self.close()
+
+
+def _process_group_kwargs():
+	"""Arguments for `subprocess.Popen` that start a new process group."""
+	if platform.system() == 'Windows':
+		return dict(creationflags=subprocess.CREATE_NEW_PROCESS_GROUP)
+	return dict(start_new_session=True)
+
+
+def kill_process_tree(process):
+	"""
+	Kill a process started with `_process_group_kwargs`, and all its children.
+
+	The process is not reaped, so the caller can still wait for it.
+
+	Args:
+		process (subprocess.Popen): The process.
+	"""
+	_logger.warning(f"VERSPM killing process tree of pid {process.pid}")
+	if platform.system() == 'Windows':
+		subprocess.run(
+			['taskkill', '/F', '/T', '/PID', str(process.pid)],
+			stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+		)
+	else:
+		import signal
+		try:
+			os.killpg(process.pid, signal.SIGKILL)
+		except OSError:
+			process.kill()
+
+
+def run_child_process(args, cwd=None, log=None, timeout=None):
+	"""
+	Run a command, streaming its output and measuring its resource usage.
+
+	This works like `subprocess.run(args, cwd=cwd, capture_output=True)`,
+	except that the output is passed line by line to a `RunLog` as it is
+	produced, and only the tail of each stream kept by the `RunLog` is
+	returned.  The result also has a `usage` attribute, a dict giving
+	the time until the first line of output as `r_startup`, and (except
+	on Windows) the CPU seconds and peak resident memory in megabytes of
+	the child process as `child_cpu` and `child_max_rss_mb`.
+
+	Args:
+		args (List[str]): The command and its arguments.
+		cwd (str, optional): The working directory for the command.
+		log (RunLog, optional): Where to stream the output.  If not
+			given, the output is kept in memory only.
+		timeout (float, optional): Kill the command, and any processes
+			it started, if it runs for longer than this many seconds.
+
+	Returns:
+		subprocess.CompletedProcess:
+			The result, which also has a `timed_out` attribute.
+	"""
+	if log is None:
+		log = RunLog(tail_bytes=float('inf'))
+	start_time = time.perf_counter()
+	process = subprocess.Popen(
+		args, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+		**_process_group_kwargs(),
+	)
+	first_output = []
+	peak_rss = []
+
+	def read_stdout():
+		for line in process.stdout:
+			if not first_output:
+				first_output.append(time.perf_counter())
+			log.write('stdout', line)
+			# The peak memory reported by wait4 on Linux includes that
+			# of this process before the fork, so the child's own peak
+			# is sampled from /proc while it runs, when possible.
+			sample = process_usage(process.pid)
+			if sample:
+				peak_rss[:] = [sample['max_rss_mb']]
+
+	def read_stderr():
+		for line in process.stderr:
+			log.write('stderr', line)
+
+	readers = [
+		threading.Thread(target=read_stdout, daemon=True),
+		threading.Thread(target=read_stderr, daemon=True),
+	]
+	usage = {}
+
+	def wait():
+		if hasattr(os, 'wait4'):
+			_, status, rusage = os.wait4(process.pid, 0)
+			process.returncode = os.waitstatus_to_exitcode(status)
+			usage['child_cpu'] = rusage.ru_utime + rusage.ru_stime
+			if peak_rss:
+				usage['child_max_rss_mb'] = peak_rss[0]
+			elif platform.system() == 'Darwin':
+				usage['child_max_rss_mb'] = rusage.ru_maxrss / 2**20
+			else:
+				usage['child_max_rss_mb'] = rusage.ru_maxrss / 2**10
+		else:
+			process.wait()
+
+	# The child is waited for in a thread, so that it can be killed
+	# if it runs past the timeout, without reaping it (which would
+	# lose its resource usage) to check whether it is still running.
+	waiter = threading.Thread(target=wait, daemon=True)
+	for reader in readers:
+		reader.start()
+	waiter.start()
+	waiter.join(timeout)
+	timed_out = waiter.is_alive()
+	if timed_out:
+		kill_process_tree(process)
+		waiter.join()
+	for reader in readers:
+		# After a timeout, do not wait indefinitely for the output
+		# of any process that escaped the kill.
+		reader.join(10 if timed_out else None)
+	process.stdout.close()
+	process.stderr.close()
+
+	if first_output:
+		usage['r_startup'] = first_output[0] - start_time
+	result = subprocess.CompletedProcess(
+		args, process.returncode, log.tail('stdout'), log.tail('stderr'),
+	)
+	result.usage = usage
+	result.timed_out = timed_out
+	return result
+
+
+def timed_stage(name, reset=False):
+	"""
+	Decorate a VERSPModel method to record its metrics as a stage.
+
+	Args:
+		name (str): The stage name.
+		reset (bool, default False): Discard metrics from any
+			previous stages first; used for the first stage
+			of each experiment.
+	"""
+	def decorator(method):
+		@functools.wraps(method)
+		def wrapper(self, *args, **kwargs):
+			if reset:
+				self.stage_metrics = {}
+			with self.timing_stage(name):
+				return method(self, *args, **kwargs)
+		return wrapper
+	return decorator
+
+
+class VERSPModel(FilesCoreModel):
+	"""
+	A class for using the Vision Eval RSPM as a files core model.
+
+	Args:
+		db (emat.Database, optional):
+			An optional Database to store experiments and results.
+			This allows this module to store results in a persistent
+			manner across sessions.  If a `db` is not given, one is
+			created and initialized in the temporary directory
+			alongside the other model files, but it will be
+			deleted automatically when the Python session ends.
+		db_filename (str, default "verspm.db")
+			The filename used to create a database if no existing
+			database is given in `db`.
+		scope (emat.Scope, optional):
+			A YAML file that defines the scope for these model
+			runs. If not given, the default scope stored in this
+			package directly is used.
+	"""
+
+	def __init__(self, db=None, db_filename="verspm.db", scope=None):
+
+		# Make a temporary directory for this instance.  All the files
+		# for this instance are found relative to this directory, and
+		# the process working directory is not changed, so several
+		# instances can be used at once (e.g. in different threads).
+		self.master_directory = tempfile.TemporaryDirectory()
+		cwd = self.master_directory.name
+
+		# Housekeeping for this example:
+		# Also copy the CONFIG and SCOPE files
+		for i in ['model-config', 'scope']:
+			shutil.copy2(
+				join_norm(this_directory, 'verspm-emat-files', f"verspm-{i}.yml"),
+				join_norm(cwd, f"verspm-{i}.yml"),
+			)
+
+		if scope is None:
+			scope = Scope(join_norm(cwd, "verspm-scope.yml"))
+
+		# Initialize a new daatabase if none was given.
+		if db is None:
+			db_filename = join_norm(cwd, db_filename)
+			if os.path.exists(db_filename):
+				initialize = False
+			else:
+				initialize = True
+			db = SQLiteDB(
+				db_filename,
+				initialize=initialize,
+			)
+		if db is False: # explicitly use no DB
+			db = None
+		else:
+			if scope.name not in db.read_scope_names():
+				db.store_scope(scope)
+
+		# Initialize the super class (FilesCoreModel)
+		super().__init__(
+			configuration=join_norm(cwd, "verspm-model-config.yml"),
+			scope=scope,
+			db=db,
+			name='VERSPM',
+			local_directory = cwd,
+		)
+		if isinstance(db, SQLiteDB):
+			self._sqlitedb_path = db.database_path
+
+		# Metrics for each stage of the current experiment.
+		self.stage_metrics = {}
+
+		# An optional function called with the progress of each model
+		# run, see `RunLog`.
+		self.progress_callback = None
+
+		# The experiment whose stages are being recorded in the journal.
+		self._journal_experiment_id = None
+		self._journal_failed_stage = None
+		self._run_input_failure = False
+		# Whether the results of each experiment are committed to the
+		# database by another process, which then records the experiment
+		# as complete in the journal (as on local pool workers).
+		self._journal_on_commit = False
+
+		# Populate the model_path directory of the files-based model.
+		# Input files that setup never changes are shared with the
+		# source model instead of copied.
+		provision_model_directory(
+			join_norm(this_directory, 'VERSPM'),
+			join_norm(cwd, self.model_path),
+			writable=self._staged_filenames(),
+			link=self.config.get('provision_links', True),
+		)
+
+		# Ensure that R can be found.
+		r_lib = self.config['r_library_path']
+		with open(join_norm(cwd, self.model_path, '.Rprofile'), 'wt') as rprof:
+			rprof.write(f'.libPaths("{r_lib}")\n')
+
+		# Add parsers to instruct the load_measures function
+		# how to parse the outputs and get the measure values.
+
+		# ComputedMeasures.json
+		instructions = {}
+		for measure in scope.get_measures():
+			if measure.parser and measure.parser.get('file') == 'ComputedMeasures.json':
+				instructions[measure.name] = key[measure.parser.get('key')]
+		self.add_parser(
+			CompiledMappingParser(
+				"ComputedMeasures.json",
+				instructions,
+			)
+		)
+
+		# Query-Spec Measures
+		instructions = {}
+		for measure in scope.get_measures():
+			if measure.parser and measure.parser.get('file') == 'Measures_VERSPM_2010,2038_Marea=RVMPO.csv':
+				if measure.parser.get('loc'):
+					instructions[measure.name] = loc[(str(j) for j in measure.parser.get('loc'))]
+				elif measure.parser.get('eval'):
+					instructions[measure.name] = eval(measure.parser.get('eval'))
+		self.add_parser(
+			CompiledTableParser(
+				"Measures_VERSPM_2010,2038_Marea=RVMPO.csv",
+				instructions,
+				index_col=0,
+			)
+		)
+
+
+	@property
+	def scenario_inputs(self):
+		"""
+		ScenarioInputCache: The preloaded scenario input files.
+
+		The cache is shared by every model instance in this process,
+		and is not pickled, so each worker builds its own only once.
+		"""
+		return get_scenario_input_cache()
+
+	@timed_stage('setup', reset=True)
+	def setup(self, params: dict):
+		"""
+		Configure the core model with the experiment variable values.
+
+		This method is the place where the core model set up takes place,
+		including creating or modifying files as necessary to prepare
+		for a RSPM core model run.  When running experiments, this method
+		is called once for each core model experiment, where each experiment
+		is defined by a set of particular values for both the exogenous
+		uncertainties and the policy levers.  These values are passed to
+		the experiment only here, and not in the `run` method itself.
+		This facilitates debugging, as the `setup` method can potentially
+		be used without the `run` method, allowing the user to manually
+		inspect the prepared files and ensure they are correct before
+		actually running a potentially expensive model.
+
+		At the end of the `setup` method, a core model experiment should be
+		ready to run using the `run` method.
+
+		Args:
+			params (dict):
+				experiment variables including both exogenous
+				uncertainty and policy levers
+
+		Raises:
+			KeyError:
+				if a defined experiment variable is not supported
+				by the core model
+		"""
+		_logger.info("VERSPM SETUP...")
+
+		for p in self.scope.get_parameters():
+			if p.name not in params:
+				_logger.warning(f" - for {p.name} using default value {p.default}")
+				params[p.name] = p.default
+
+		super().setup(params)
+
+		# Check if we are using distributed multi-processing. If so,
+		# we'll need to copy some files into a local working directory,
+		# as otherwise changes in the files will over-write each other
+		# when different processes are working in a common directory at
+		# the same time.
+		try:
+			# First try to import the dask.distributed library
+			# and check if this code is running on a worker.
+			from dask.distributed import get_worker
+			worker = get_worker()
+		except (ValueError, ImportError):
+			# If the library is not available, or if the code is
+			# not running on a worker, then we are not running
+			# in multi-processing mode, and we can just use
+			# the main cwd as the working directory without
+			# copying anything.
+			pass
+		else:
+			# If we do find we are running this setup on a
+			# worker, then we want to set the local directory
+			# accordingly. We provision model files from the "master"
+			# working directory to the worker's local directory,
+			# if it is different (it should be).  This is done only
+			# once per worker, and the provisioned directory is then
+			# reused for every experiment on that worker, with setup
+			# re-writing only the input files that change.
+			if self.local_directory != worker.local_directory:
+
+				# Make the archive path absolute, so all archives
+				# go back to the original directory.
+				self.archive_path = os.path.abspath(self.resolved_archive_path)
+
+				source = join_norm(self.local_directory, self.model_path)
+				destination = join_norm(worker.local_directory, self.model_path)
+				if _provisioned_directories.get(destination) != source:
+					_logger.debug(f"DISTRIBUTED.PROVISION FROM {self.local_directory}")
+					_logger.debug(f"                        TO {worker.local_directory}")
+					provision_model_directory(
+						source,
+						destination,
+						writable=self._staged_filenames(),
+						link=self.config.get('provision_links', True),
+					)
+					_provisioned_directories[destination] = source
+				self.local_directory = worker.local_directory
+
+		# The process of manipulating each input file is broken out
+		# into discrete sub-methods, as each step is loosely independent
+		# and having separate methods makes this clearer.  Groups of
+		# input files that are already staged with the same content
+		# in this working directory are not re-written.
+		self.last_setup_changes = self._stage_inputs(params)
+		if self.preflight:
+			with self.timing_stage('preflight'):
+				try:
+					self.preflight_inputs()
+				except InputValidationError:
+					# Quarantined by `run_model`, as the same inputs
+					# would only fail again.
+					self._run_input_failure = True
+					raise
+		_logger.info(f"VERSPM SETUP complete, changed: {self.last_setup_changes}")
+
+	# Each group of input files manipulated in `setup`, given as the
+	# group name, the method that writes the group's files, the
+	# parameters the group depends on, and the scenario_inputs
+	# sub-directory (if any) that the group's files are built from.
+	_input_groups = (
+		('ModelParameters', '_manipulate_model_parameters_json', ('ValueOfTime',), None),
+		('Income', '_manipulate_income', ('Income',), 'I'),
+		('Bicycles', '_manipulate_bikes', ('Bicycles',), 'B'),
+		('LandUse', '_manipulate_land_use', ('LandUse',), 'L'),
+		('Transit', '_manipulate_transit', ('Transit',), 'T'),
+		('FuelCost', '_manipulate_fuel_cost', ('FuelCost', 'ElectricCost'), 'G'),
+		('TechMix', '_manipulate_technology_mix', ('TechMix',), 'F'),
+		('Parking', '_manipulate_parking', ('Parking',), 'P'),
+		('DemandManagement', '_manipulate_demand', ('DemandManagement',), 'D'),
+		('VehicleCharacteristics', '_manipulate_vehicle_characteristics', ('VehicleCharacteristics',), 'V'),
+		('DrivingEfficiency', '_manipulate_driving_efficiency', ('DrivingEfficiency',), 'E'),
+		('VehicleTravelCost', '_manipulate_vehicle_travel_cost', ('VehicleTravelCost',), 'C'),
+	)
+
+	# The file in the model directory that records what `setup` has
+	# staged there, so that unchanged input groups can be skipped.
+	_staged_ledger_filename = '.emat_staged.json'
+
+	@property
+	def incremental_setup(self):
+		"""
+		Bool: Skip re-writing input groups that are already staged with the same content.
+		"""
+		return self.config.get('incremental_setup', True)
+
+	@incremental_setup.setter
+	def incremental_setup(self, value):
+		self.config['incremental_setup'] = bool(value)
+
+	@property
+	def preflight(self):
+		"""
+		Bool: Check the staged input files at the end of `setup`.
+
+		When this is True (the default), every staged input file is
+		checked against a known good version of it before the model
+		is run (see `preflight_inputs`), so that an experiment with
+		malformed inputs fails in `setup`, and is quarantined, instead
+		of failing in VisionEval after R has started, or worse, running
+		to completion with nonsense inputs.
+		"""
+		return self.config.get('preflight', True)
+
+	@preflight.setter
+	def preflight(self, value):
+		self.config['preflight'] = bool(value)
+
+	@property
+	def preflight_tolerance(self):
+		"""
+		float: The tolerance of proportion bounds and sums in `preflight_inputs`.
+		"""
+		return self.config.get('preflight_tolerance', 1e-3)
+
+	@preflight_tolerance.setter
+	def preflight_tolerance(self, value):
+		self.config['preflight_tolerance'] = float(value)
+
+	def _staged_filenames(self):
+		"""
+		The files in the model directory that `setup` may re-write.
+
+		Returns:
+			Set[str]: Paths relative to the model directory.
+		"""
+		staged = {'defs/model_parameters.json'}
+		staged.update(
+			f"inputs/{filename}"
+			for filename in self.scenario_inputs.staged_filenames()
+		)
+		return staged
+
+	def preflight_inputs(self):
+		"""
+		Check the staged input files before running the model.
+
+		Each staged input file of the base model must be present, and each
+		staged input file is checked against the form of the base
+		model version of it, or of a categorical drop-in version if
+		it has no base version (see `input_schema` and `validate_input`):
+		its columns, years, and zones from `defs/geo.csv`, that its
+		values are finite, and that its proportions are between 0 and 1
+		and add up to 1 where they do in the reference.  The values in
+		`defs/model_parameters.json` must be finite numbers.  Files that
+		have not changed since they last passed are not checked again.
+
+		Raises:
+			InputValidationError: If any problems are found, listing them all.
+		"""
+		model_path = join_norm(self.local_directory, self.model_path)
+		problems = []
+		checked = 0
+		geo = None
+		for relative in sorted(self._staged_filenames()):
+			filename = join_norm(model_path, relative)
+			try:
+				stat = os.stat(filename)
+			except FileNotFoundError:
+				# Categorical drop-in files with no base version are
+				# removed when not in use; VisionEval reports any that
+				# a module needs.  Files of the base model are always
+				# needed.
+				if (
+						relative == 'defs/model_parameters.json'
+						or self.scenario_inputs.base_input(os.path.basename(relative)) is not None
+				):
+					problems.append(f"{relative}: missing")
+				continue
+			key = (filename, stat.st_size, stat.st_mtime_ns)
+			if _validated_inputs.get(filename) == key:
+				continue
+			with open(filename, 'rb') as f:
+				content = f.read()
+			checked += 1
+			if relative == 'defs/model_parameters.json':
+				found = self._preflight_model_parameters(relative, content)
+			else:
+				name = os.path.basename(relative)
+				reference = self.scenario_inputs.reference_input(name)
+				if reference is None:
+					continue
+				schema_key = (name, hashlib.sha1(reference).hexdigest())
+				if schema_key not in _input_schemas:
+					_input_schemas[schema_key] = input_schema(reference)
+				if geo is None:
+					geo = read_geo(model_path)
+				found = validate_input(
+					name, content, _input_schemas[schema_key], geo,
+					tolerance=self.preflight_tolerance,
+				)
+			if found:
+				problems.extend(found)
+				_validated_inputs.pop(filename, None)
+			else:
+				_validated_inputs[filename] = key
+		if problems:
+			_logger.error(f"VERSPM PREFLIGHT failed: {len(problems)} problems in staged inputs")
+			raise InputValidationError(problems)
+		_logger.info(f"VERSPM PREFLIGHT passed, checked {checked} files")
+
+	@staticmethod
+	def _preflight_model_parameters(relative, content):
+		"""
+		Check that each value in `defs/model_parameters.json` is a finite number.
+
+		Returns:
+			List[str]: A description of each problem found.
+		"""
+		try:
+			parameters = json.loads(content)
+		except ValueError as err:
+			return [f"{relative}: cannot be read: {err}"]
+		problems = []
+		for parameter in parameters:
+			try:
+				value = float(parameter.get('VALUE'))
+			except (TypeError, ValueError):
+				value = np.nan
+			if not np.isfinite(value):
+				problems.append(f"{relative}: {parameter.get('NAME')} = {parameter.get('VALUE')!r} is not a finite number")
+		return problems
+
+	def _input_group_fingerprint(self, group, params, param_names, ve_scenario_dir):
+		"""
+		Hash everything that determines the content of an input group.
+
+		Args:
+			group (str): The input group name.
+			params (dict): The parameters for this experiment.
+			param_names (Collection[str]): The parameters this group depends on.
+			ve_scenario_dir (str or None): The scenario_inputs group, if any.
+
+		Returns:
+			str
+		"""
+		h = hashlib.sha256()
+		h.update(group.encode())
+		for p in param_names:
+			h.update(f"|{p}={params[p]}".encode())
+		if ve_scenario_dir is not None:
+			h.update(self.scenario_inputs.fingerprint(ve_scenario_dir).encode())
+		return h.hexdigest()
+
+	def _stage_inputs(self, params):
+		"""
+		Write the input files for each input group that has changed.
+
+		A ledger in the model directory records the fingerprint of each
+		staged input group, along with the size and modification time of
+		the files written for it.  A group is skipped when its fingerprint
+		is unchanged and its files have not been touched since.
+
+		Args:
+			params (dict):
+				The parameters for this experiment, including both
+				exogenous uncertainties and policy levers.
+
+		Returns:
+			List[str]: The names of the input groups that were written.
+		"""
+		model_path = self.resolved_model_path
+		ledger_filename = join_norm(model_path, self._staged_ledger_filename)
+		ledger = {}
+		if self.incremental_setup and os.path.exists(ledger_filename):
+			try:
+				with open(ledger_filename, 'rt') as f:
+					ledger = json.load(f)
+			except ValueError:
+				_logger.warning(f"ignoring unreadable staging ledger {ledger_filename}")
+
+		def file_stat(filename):
+			try:
+				st = os.stat(join_norm(model_path, filename))
+			except FileNotFoundError:
+				return None
+			return [st.st_size, st.st_mtime_ns]
+
+		changed = []
+		for group, method, param_names, ve_scenario_dir in self._input_groups:
+			fingerprint = self._input_group_fingerprint(group, params, param_names, ve_scenario_dir)
+			prior = ledger.get(group)
+			if prior and prior['fingerprint'] == fingerprint and all(
+				file_stat(filename) == stat for filename, stat in prior['files'].items()
+			):
+				_logger.debug(f"VERSPM SETUP {group} unchanged")
+				continue
+			with self.timing_stage(f"setup.{group}"):
+				written = getattr(self, method)(params)
+			files = {}
+			for out_filename in written:
+				filename = os.path.relpath(out_filename, model_path)
+				files[filename] = file_stat(filename)
+			ledger[group] = dict(fingerprint=fingerprint, files=files)
+			changed.append(group)
+
+		with open(ledger_filename, 'wt') as f:
+			json.dump(ledger, f, indent=1)
+		return changed
+
+	def _manipulate_model_parameters_json(self, params):
+		"""
+		Prepare the model_parameters input file based on the existing file.
+
+		Args:
+			params (dict):
+				The parameters for this experiment, including both
+				exogenous uncertainties and policy levers.
+
+		Returns:
+			List[str]: The staged files that were written.
+		"""
+
+		# load the text of the first demo input file
+		with open(join_norm(self.local_directory, self.model_path, 'defs', 'model_parameters.json'), 'rt') as f:
+			y = json.load(f)
+
+		y[0]['VALUE'] = str(params['ValueOfTime'])
+
+		# write the manipulated text back out to the first demo input file
+		out_filename = join_norm(self.local_directory, self.model_path, 'defs', 'model_parameters.json')
+		with open(out_filename, 'wt') as f:
+			json.dump(y, f)
+		return [out_filename]
+
+	def _manipulate_income(self, params):
+		"""
+		Prepare the income input file based on a template file.
+
+		Args:
+			params (dict):
+				The parameters for this experiment, including both
+				exogenous uncertainties and policy levers.
+
+		Returns:
+			List[str]: The staged files that were written.
+		"""
+
+		computed_params = {}
+		computed_params['HHIncomePC'] = int(params['Income'])
+		computed_params['GQIncomePC'] = int(params['Income']*3/13)
+
+		y = self.scenario_inputs.template('I', 'azone_per_cap_inc.csv.template')
+
+		for n in computed_params.keys():
+			y = y.replace(
+				f"__EMAT_PROVIDES_{n}__",  # the token to replace
+				str(computed_params[n])  # the value to replace it with (as a string)
+			)
+
+		out_filename = join_norm(
+			self.resolved_model_path, 'inputs', 'azone_per_cap_inc.csv'
+		)
+		_logger.debug(f"writing updates to: {out_filename}")
+		with open(out_filename, 'wt') as f:
+			f.write(y)
+		return [out_filename]
+
+	def _manipulate_bikes(self, params):
+		"""
+		Prepare the biking input file based on a template file.
+
+		Args:
+			params (dict):
+				The parameters for this experiment, including both
+				exogenous uncertainties and policy levers.
+
+		Returns:
+			List[str]: The staged files that were written.
+		"""
+
+		computed_params = {}
+		computed_params['BikeDiversion'] = params['Bicycles']
+
+		y = self.scenario_inputs.template('B', 'azone_prop_sov_dvmt_diverted.csv.template')
+
+		for n in computed_params.keys():
+			y = y.replace(
+				f"__EMAT_PROVIDES_{n}__",  # the token to replace
+				f"{computed_params[n]:.3f}"  # the value to replace it with (as a string)
+			)
+
+		out_filename = join_norm(
+			self.resolved_model_path, 'inputs', 'azone_prop_sov_dvmt_diverted.csv'
+		)
+		_logger.debug(f"writing updates to: {out_filename}")
+		with open(out_filename, 'wt') as f:
+			f.write(y)
+		return [out_filename]
+
+	def _manipulate_by_categorical_drop_in(self, params, cat_param, cat_mapping, ve_scenario_dir):
+		"""
+		Copy in the relevant input files.
+
+		Any file that is supplied by some other option of the same
+		categorical parameter but not by the selected option is reset
+		to the base model version, so that model directories reused
+		across experiments do not keep files from an earlier option.
+
+		Args:
+			params (dict):
+				The parameters for this experiment, including both
+				exogenous uncertainties and policy levers.
+
+		Returns:
+			List[str]: The staged files that were written.
+		"""
+		scenario_dir = cat_mapping.get(params[cat_param])
+		drop_in = dict(self.scenario_inputs.drop_in(ve_scenario_dir, scenario_dir))
+		for other_dir in set(cat_mapping.values()) - {scenario_dir}:
+			for filename in self.scenario_inputs.drop_in(ve_scenario_dir, other_dir):
+				if filename not in drop_in:
+					drop_in[filename] = self.scenario_inputs.base_input(filename)
+		written = []
+		for filename, content in drop_in.items():
+			out_filename = join_norm(self.resolved_model_path, 'inputs', filename)
+			if content is None:
+				if os.path.exists(out_filename):
+					os.remove(out_filename)
+				continue
+			with open(out_filename, 'wb') as f:
+				f.write(content)
+			written.append(out_filename)
+		return written
+
+	def _manipulate_land_use(self, params):
+		"""
+		Copy in the relevant the land use input files.
+
+		Args:
+			params (dict):
+				The parameters for this experiment, including both
+				exogenous uncertainties and policy levers.
+
+		Returns:
+			List[str]: The staged files that were written.
+		"""
+		cat_mapping = {
+			'base': '1',
+			'growth': '2',
+		}
+		return self._manipulate_by_categorical_drop_in(params, 'LandUse', cat_mapping, 'L')
+
+	def _manipulate_vehicle_travel_cost(self, params):
+		cat_mapping = {
+			'base': '1',
+			'steady ownership cost': '2',
+			'pay-per-mile insurance and higher cost': '3',
+		}
+		return self._manipulate_by_categorical_drop_in(params, 'VehicleTravelCost', cat_mapping, 'C')
+
+	def _manipulate_transit(self, params):
+		"""
+		Prepare the income input file based on a template file.
+
+		Args:
+			params (dict):
+				The parameters for this experiment, including both
+				exogenous uncertainties and policy levers.
+
+		Returns:
+			List[str]: The staged files that were written.
+		"""
+
+		computed_params = {}
+		computed_params['DRRevMi'] = params['Transit'] * 2381994.664
+		computed_params['MBRevMi'] = params['Transit'] * 3580237.203
+
+		y = self.scenario_inputs.template('T', 'marea_transit_service.csv.template')
+
+		for n in computed_params.keys():
+			y = y.replace(
+				f"__EMAT_PROVIDES_{n}__",  # the token to replace
+				f"{computed_params[n]:.3f}",  # the value to replace it with (as a string)
+			)
+
+		out_filename = join_norm(
+			self.resolved_model_path, 'inputs', 'marea_transit_service.csv'
+		)
+		_logger.debug(f"writing updates to: {out_filename}")
+		with open(out_filename, 'wt') as f:
+			f.write(y)
+		return [out_filename]
+
+	def _manipulate_fuel_cost(self, params):
+		"""
+		Prepare the fuel and electric input file based on a template file.
+
+		Args:
+			params (dict):
+				The parameters for this experiment, including both
+				exogenous uncertainties and policy levers.
+
+		Returns:
+			List[str]: The staged files that were written.
+		"""
+
+		computed_params = {}
+		computed_params['FuelCost'] = params['FuelCost']
+		computed_params['ElectricCost'] = params['ElectricCost']
+
+		y = self.scenario_inputs.template('G', 'azone_fuel_power_cost.csv.template')
+
+		for n in computed_params.keys():
+			y = y.replace(
+				f"__EMAT_PROVIDES_{n}__",  # the token to replace
+				f"{computed_params[n]:.3f}",  # the value to replace it with (as a string)
+			)
+
+		out_filename = join_norm(
+			self.resolved_model_path, 'inputs', 'azone_fuel_power_cost.csv'
+		)
+		_logger.debug(f"writing updates to: {out_filename}")
+		with open(out_filename, 'wt') as f:
+			f.write(y)
+		return [out_filename]
+
+	def _manipulate_technology_mix(self, params, ):
+		return self._manipulate_by_mixture(params, 'TechMix', 'F',)
+
+	def _manipulate_parking(self, params, ):
+		return self._manipulate_by_mixture(params, 'Parking', 'P',)
+
+	def _manipulate_demand(self, params, ):
+		return self._manipulate_by_mixture(params, 'DemandManagement', 'D',)
+
+	def _manipulate_vehicle_characteristics(self, params, ):
+		return self._manipulate_by_mixture(params, 'VehicleCharacteristics', 'V',)
+
+	def _manipulate_driving_efficiency(self, params, ):
+		return self._manipulate_by_mixture(params, 'DrivingEfficiency', 'E',)
+
+	def _manipulate_by_mixture(self, params, weight_param, ve_scenario_dir, no_mix_cols=('Year', 'Geo',)):
+		"""
+		Write a linearly interpolated mixture of two sets of input files.
+
+		Args:
+			params (dict):
+				The parameters for this experiment, including both
+				exogenous uncertainties and policy levers.
+			weight_param (str):
+				The name of the parameter giving the weight on the
+				"2" variant of the input files.
+			ve_scenario_dir (str):
+				The scenario group, e.g. 'F'.
+			no_mix_cols (Collection[str]):
+				Columns that are never mixed.
+
+		Returns:
+			List[str]: The staged files that were written.
+		"""
+		weight_2 = params[weight_param]
+		store = self.mixture_store
+		written = []
+		for pair in self.scenario_inputs.mixture(ve_scenario_dir, no_mix_cols):
+			out_filename = join_norm(
+				self.resolved_model_path, 'inputs', pair.filename
+			)
+			stored = store.read(ve_scenario_dir, weight_2, pair.filename) if store else None
+			if stored is not None:
+				with open(out_filename, 'wb') as f:
+					f.write(stored)
+			else:
+				pair.blend(weight_2).to_csv(out_filename, index=False, float_format="%.5f")
+			written.append(out_filename)
+		return written
+
+	# The input groups written by `_manipulate_by_mixture`.
+	_mixture_groups = (
+		'TechMix', 'Parking', 'DemandManagement',
+		'VehicleCharacteristics', 'DrivingEfficiency',
+	)
+
+	@property
+	def mixture_store(self):
+		"""
+		MixtureStore or None: Pre-rendered mixture input files, if prepared.
+
+		See `prepare_mixtures`.
+		"""
+		directory = self.config.get('mixture_store')
+		if directory and os.path.isdir(directory):
+			if directory not in _mixture_stores:
+				_mixture_stores[directory] = MixtureStore(directory)
+			return _mixture_stores[directory]
+		return None
+
+	def prepare_mixtures(self, design):
+		"""
+		Pre-render the mixture input files for a whole design.
+
+		For each mixture lever, the mixed input files for every distinct
+		value of the lever in the design are computed together as one
+		NumPy operation, and written to a `MixtureStore` in the local
+		directory, which `setup` then copies from.  The store location is
+		kept in the model configuration, so that it is also used by
+		worker processes that share this file system.
+
+		Args:
+			design (pandas.DataFrame): The design of experiments.
+
+		Returns:
+			MixtureStore
+		"""
+		directory = self.config.get('mixture_store')
+		if not directory:
+			directory = join_norm(self.local_directory, 'mixture_store')
+			self.config['mixture_store'] = directory
+		if directory not in _mixture_stores:
+			_mixture_stores[directory] = MixtureStore(directory)
+		store = _mixture_stores[directory]
+		defaults = {p.name: p.default for p in self.scope.get_parameters()}
+		for group, method, param_names, ve_scenario_dir in self._input_groups:
+			if group not in self._mixture_groups:
+				continue
+			weight_param = param_names[0]
+			if weight_param in design.columns:
+				weights = design[weight_param]
+			else:
+				weights = [defaults[weight_param]]
+			n = store.stage(
+				self.scenario_inputs.mixture(ve_scenario_dir),
+				ve_scenario_dir,
+				weights,
+			)
+			_logger.debug(f"VERSPM MIXTURES staged {n} mixtures for {group}")
+		return store
+
+
+	def run(self):
+		"""
+		Run the core model.
+
+		This method is the place where the RSPM core model run takes place.
+		Note that this method takes no arguments; all the input
+		exogenous uncertainties and policy levers are delivered to the
+		core model in the `setup` method, which will be executed prior
+		to calling this method. This facilitates debugging, as the `setup`
+		method can potentially be used without the `run` method, allowing
+		the user to manually inspect the prepared files and ensure they
+		are correct before actually running a potentially expensive model.
+		When running experiments, this method is called once for each core
+		model experiment, after the `setup` method completes.
+
+		Raises:
+		    UserWarning: If model is not properly setup
+		"""
+		_logger.info("VERSPM RUN ...")
+		self._computed_measures = (None, None)
+
+		# When reusing the base year, the model script loads a
+		# datastore that already has the base year results, and
+		# only the future years are simulated.
+		base_datastore = None
+		if self.reuse_base_year:
+			with self.timing_stage('base_year'):
+				base_datastore = self._prepare_base_year()
+		# When restarting from a snapshot, the model script loads a
+		# datastore that already has the results of the modules before
+		# the first one with changed inputs, and only runs the rest.
+		load_datastore, first_step = base_datastore, 0
+		if self.partial_rerun:
+			with self.timing_stage('snapshot'):
+				load_datastore, first_step = self._prepare_snapshot(base_datastore)
+		self._write_run_model_script(
+			join_norm(self.local_directory, self.model_path),
+			load_datastore,
+			first_step=first_step,
+			skip_base_year=base_datastore is not None,
+		)
+
+		# The R output is streamed to `stdout.log` and `stderr.log` in
+		# the output directory, so it is archived with the outputs.
+		# A failed run is retried (see `run_retries`), unless it failed
+		# because of its inputs, as it would only fail again.
+		n_attempts = 1 + max(self.run_retries, 0)
+		for attempt in range(1, n_attempts + 1):
+			with self.timing_stage('r_run'):
+				self.last_run_result = self._run_r(
+					join_norm(self.local_directory, self.model_path),
+					log_directory=join_norm(self.local_directory, self.model_path, 'output'),
+				)
+			self._record_r_usage(self.last_run_result)
+			returncode = self.last_run_result.returncode
+			if not returncode:
+				self.journal_event('r_run', 'done', attempt=True)
+				break
+			if self._is_input_failure(self.last_run_result):
+				self._run_input_failure = True
+				self.journal_event('r_run', 'failed', 'input failure', attempt=True)
+				_logger.error("VERSPM RUN failed because of its inputs, not retrying")
+				break
+			if attempt == n_attempts:
+				self.journal_event('r_run', 'failed', f"return code {returncode}", attempt=True)
+				break
+			delay = self.retry_backoff * 2 ** (attempt - 1)
+			self.journal_event('r_run', 'retry', f"return code {returncode}", attempt=True)
+			_logger.warning(
+				f"VERSPM RUN failed with return code {returncode}, "
+				f"retrying in {delay} seconds (attempt {attempt + 1} of {n_attempts})"
+			)
+			time.sleep(delay)
+
+		if self.last_run_result.timed_out:
+			raise RunTimeoutError(
+				self.last_run_result.returncode,
+				self.last_run_result.args,
+				self.r_timeout,
+				self.last_run_result.stdout,
+				self.last_run_result.stderr,
+			)
+		if self.last_run_result.returncode:
+			raise subprocess.CalledProcessError(
+				self.last_run_result.returncode,
+				self.last_run_result.args,
+				self.last_run_result.stdout,
+				self.last_run_result.stderr,
+			)
+
+		# VisionEval Version 2 appends timestamps to output filenames,
+		# but because we're running in a temporary directory, we can
+		# strip them down to standard filenames.
+		import re, glob
+		renamer = re.compile(r"(.*)_202[0-9]-[0-9]+-[0-9]+_[0-9]+(\.csv)")
+		_logger.debug("VERSPM RUN renaming files")
+		with self.timing_stage('rename'):
+			for outfile in glob.glob(join_norm(self.local_directory, self.model_path, 'output', '*.csv')):
+				_logger.debug(f"VERSPM RUN renaming: {outfile}")
+				if renamer.match(outfile):
+					newname = renamer.sub(r"\1\2", outfile)
+					_logger.debug(f"     to: {newname}")
+					os.rename(outfile, newname)
+
+		_logger.info("VERSPM RUN complete")
+
+	def _run_r(self, model_path, extract=True, log_directory=None):
+		"""
+		Run a VisionEval model in R.
+
+		Args:
+			model_path (str): The absolute path of the model directory.
+			extract (bool, default True): Extract the datastore tables
+				and query the measures after running the model.
+			log_directory (str, optional): Stream the R output to log
+				files in this directory.
+
+		Returns:
+			subprocess.CompletedProcess:
+				The result, with only the tail of the R output (see
+				`r_log_tail_bytes`), and a `timed_out` attribute that
+				is True if the run was killed after `r_timeout`.
+		"""
+		log = RunLog(
+			log_directory,
+			tail_bytes=self.r_log_tail_bytes,
+			progress=self.progress_callback,
+			context=dict(run_id=getattr(self, 'run_id', None), model_path=model_path),
+		)
+		# Unless a full extract is wanted, only the outputs needed for
+		# the measures in the scope are written.
+		fields = query_file = None
+		if extract and not self.full_extract:
+			fields, rows = self.extraction_plan()
+			if rows is not None:
+				query_file = self._write_query_specs(model_path, rows) if rows else False
+		with self._memory_admission(model_path) as reservation, log:
+			if self.use_r_session:
+				# Run the model in a long-lived R process that already has
+				# VisionEval loaded, instead of starting a new one.
+				session = get_r_session(
+					self.config['r_runtime_path'],
+					self.config['r_library_path'],
+					max_runs=self.r_session_max_runs,
+				)
+				result = session.run_model(
+					model_path, extract=extract, log=log, timeout=self.r_timeout,
+					fields=fields, query_file=query_file,
+				)
+			else:
+				result = self._run_rscript(
+					model_path, extract=extract, log=log, timeout=self.r_timeout,
+					fields=fields, query_file=query_file,
+				)
+			reservation.observe(getattr(result, 'usage', {}).get('child_max_rss_mb'))
+		result.log_directory = log_directory
+		result.memory_wait = reservation.waited
+		return result
+
+	def _memory_admission(self, model_path):
+		"""
+		Wait for memory to run the model, if `memory_governor` is on.
+
+		Returns:
+			A context manager yielding a `MemoryReservation`.
+		"""
+		if not self.memory_governor:
+			return contextlib.nullcontext(MemoryReservation())
+		governor = MemoryGovernor(
+			self.memory_ledger,
+			budget_mb=self.memory_budget_mb,
+			initial_mb=self.r_memory_mb,
+		)
+		return governor.admit(label=model_path)
+
+	@property
+	def memory_governor(self):
+		"""
+		Bool: Admit model runs only while they are expected to fit in memory.
+
+		When this is on, each model run on a host waits until the runs
+		already in progress there, whether in this process, in local
+		pool workers or in dask workers, leave room for it in
+		`memory_budget_mb`, based on the peak memory observed for recent
+		runs (see `MemoryGovernor`).  This stops a design run with many
+		workers from running the host out of memory.
+
+		This is off by default, unless a `memory_budget_mb` is set.
+		"""
+		return self.config.get('memory_governor', self.memory_budget_mb is not None)
+
+	@memory_governor.setter
+	def memory_governor(self, value):
+		self.config['memory_governor'] = bool(value)
+
+	@property
+	def memory_budget_mb(self):
+		"""
+		float: The memory that concurrent model runs on a host may use, in megabytes.
+
+		Setting this turns on the `memory_governor`, unless it has been
+		turned off explicitly.  Defaults to 80% of the memory of the host.
+		"""
+		return self.config.get('memory_budget_mb', None)
+
+	@memory_budget_mb.setter
+	def memory_budget_mb(self, value):
+		self.config['memory_budget_mb'] = None if value is None else float(value)
+
+	@property
+	def r_memory_mb(self):
+		"""
+		float: The memory expected for a model run before any have been observed, in megabytes.
+		"""
+		return self.config.get('r_memory_mb', 2048)
+
+	@r_memory_mb.setter
+	def r_memory_mb(self, value):
+		self.config['r_memory_mb'] = float(value)
+
+	@property
+	def memory_ledger(self):
+		"""
+		str: The ledger of memory reserved by model runs on this host.
+
+		This must be on a host-local file system, and shared by all the
+		workers on the host.  Defaults to `verspm_memory_governor.db` in
+		the temporary directory.
+		"""
+		return self.config.get(
+			'memory_ledger',
+			os.path.join(tempfile.gettempdir(), 'verspm_memory_governor.db'),
+		)
+
+	@memory_ledger.setter
+	def memory_ledger(self, value):
+		self.config['memory_ledger'] = value
+
+	@property
+	def full_extract(self):
+		"""
+		Bool: Extract all the outputs of the model after each run.
+
+		By default, only the datastore fields and query specifications
+		needed for the measures in the scope are extracted after each
+		run (see `extraction_plan`), which cuts the files written, and
+		archived, for each run.  Set this to True (or set `full_extract`
+		in the configuration) to extract every datastore table and run
+		the full query, e.g. for debugging.
+
+		The archives of runs made without a full extract hold only the
+		outputs needed for the measures in the scope at the time, so
+		`reprocess_archives` cannot compute measures added to the scope
+		later from them.  Set this to True when the archives are meant
+		to be reprocessed for new measures.
+		"""
+		return self.config.get('full_extract', False)
+
+	@full_extract.setter
+	def full_extract(self, value):
+		self.config['full_extract'] = bool(value)
+
+	# The query results file, and its specifications.
+	_query_results_filename = "Measures_VERSPM_2010,2038_Marea=RVMPO.csv"
+	_query_specs_filename = "Query-Spec.R"
+	_selected_query_specs_filename = "Query-Spec-EMAT.R"
+
+	def extraction_plan(self):
+		"""
+		Plan the outputs to extract from the datastore after each run.
+
+		The outputs are planned from the parsers of the measures in the
+		scope: the datastore fields read by `post_process`, if any of
+		the computed measures are in the scope, and the rows of the
+		query results read by the other measures.
+
+		Returns:
+			Tuple[List[str] or None, Set[str] or None]:
+				The datastore fields to extract, each as
+				"<Group>/<Table>/<Name>", and the rows needed from the
+				query results.  Either is None if everything is needed,
+				as when a measure is read with a getter that cannot be
+				resolved to particular rows, or from some other file.
+		"""
+		measure_names = set(self.scope.get_measure_names())
+		fields = []
+		rows = set()
+		for parser in self._parsers:
+			if not measure_names.intersection(parser.measure_getters):
+				continue
+			if parser.filename == 'ComputedMeasures.json':
+				fields.extend(f"2038/Marea/{name}" for name in _marea_columns)
+				fields.extend(f"2038/Household/{name}" for name in _household_columns)
+			elif parser.filename == self._query_results_filename and rows is not None:
+				for measure_name in measure_names.intersection(parser.measure_getters):
+					terms = getattr(parser, 'compiled', {}).get(measure_name)
+					if terms is None:
+						rows = None
+						break
+					rows.update(row for _, row, _ in terms)
+			else:
+				return None, None
+		return fields, rows
+
+	def _write_query_specs(self, model_path, rows):
+		"""
+		Write the query specifications needed for some rows of the results.
+
+		Args:
+			model_path (str): The model directory.
+			rows (Collection[str]): The rows needed from the query results.
+
+		Returns:
+			str or None:
+				The file with the selected specifications, or None if the
+				full query is needed.
+		"""
+		with open(join_norm(model_path, self._query_specs_filename), 'rt') as f:
+			text = select_query_specs(f.read(), rows)
+		if text is None:
+			return None
+		filename = join_norm(model_path, self._selected_query_specs_filename)
+		with open(filename, 'wt') as f:
+			f.write(text)
+		return filename
+
+	@property
+	def r_timeout(self):
+		"""
+		float: Kill a model run, and every process it started, after this many seconds.
+
+		A run that is killed fails like any other, with a `RunTimeoutError`,
+		so a stuck run does not hold up a worker indefinitely.  If None
+		(the default), runs are never killed.
+		"""
+		return self.config.get('r_timeout', None)
+
+	@r_timeout.setter
+	def r_timeout(self, value):
+		self.config['r_timeout'] = None if value is None else float(value)
+
+	@property
+	def r_log_tail_bytes(self):
+		"""
+		int: The size of the tail of the R output kept in memory for `last_run_logs`.
+
+		The complete output is streamed to `stdout.log` and `stderr.log`
+		in the model output directory.
+		"""
+		return self.config.get('r_log_tail_bytes', 65536)
+
+	@r_log_tail_bytes.setter
+	def r_log_tail_bytes(self, value):
+		self.config['r_log_tail_bytes'] = int(value)
+
+	@property
+	def reuse_base_year(self):
+		"""
+		Bool: Load base year results from a saved datastore instead of re-running them.
+
+		None of the levers or uncertainties in this model change the base
+		year rows of the input files, so the base year results are the
+		same for every experiment.  When this is True, the base year is
+		run once (in a `base_year` directory alongside the model files)
+		and its datastore is saved.  Each experiment then loads that
+		datastore with `initializeModel(LoadDatastore=TRUE, ...)` and
+		simulates only the future years.
+
+		As a safety check, the base year inputs of every experiment are
+		compared to those of the saved base: an experiment whose base
+		year inputs differ gets a base year run of its own, which is
+		then saved for any later experiments with the same base year
+		inputs.
+		"""
+		return self.config.get('reuse_base_year', False)
+
+	@reuse_base_year.setter
+	def reuse_base_year(self, value):
+		self.config['reuse_base_year'] = bool(value)
+
+	def _write_run_model_script(self, model_path, load_datastore=None, *, first_step=0, last_step=None, skip_base_year=None):
+		"""
+		Write the `run_model.R` script into a model directory.
+
+		Args:
+			model_path (str): The absolute path of the model directory.
+			load_datastore (str, optional): The path of a datastore to
+				load, with the base year results (see `reuse_base_year`)
+				or the results of the steps before `first_step` (see
+				`partial_rerun`).  If not given, the script starts with
+				a new datastore.
+			first_step, last_step (int, optional): Run only these steps
+				of the script for each year (see `run_model_steps`), by
+				default all of them.
+			skip_base_year (bool, optional): Run only the years after the
+				base year.  Defaults to True if `load_datastore` is given.
+		"""
+		with open(join_norm(this_directory, 'VERSPM', 'run_model.R'), 'rt') as f:
+			script = f.read()
+		if skip_base_year is None:
+			skip_base_year = load_datastore is not None
+		if first_step or last_step is not None:
+			head, steps, tail = run_model_steps(script)
+			script = head + ''.join(text for text, modules in steps[first_step:last_step]) + tail
+		replacements = []
+		if load_datastore is not None:
+			replacements.extend((
+				(r"LoadDatastore\s*=\s*FALSE", "LoadDatastore = TRUE"),
+				(r"DatastoreName\s*=\s*NULL", f'DatastoreName = "{load_datastore}"'),
+			))
+		if skip_base_year:
+			base_year = read_run_parameters(model_path)['BaseYear']
+			replacements.append(
+				(r"for\s*\(\s*Year\s+in\s+getYears\(\)\s*\)", f'for(Year in setdiff(getYears(), "{base_year}"))'),
+			)
+		for pattern, replacement in replacements:
+			script, n = re.subn(pattern, lambda m: replacement, script)
+			if n != 1:
+				raise ValueError(f"cannot modify run_model.R to load a datastore, no match for {pattern}")
+		filename = join_norm(model_path, 'run_model.R')
+		if os.path.exists(filename):
+			with open(filename, 'rt') as f:
+				if f.read() == script:
+					return
+		with open(filename, 'wt') as f:
+			f.write(script)
+
+	def _copy_staged_model(self, copy_path):
+		"""
+		Provision a copy of the model with the inputs currently staged.
+
+		Args:
+			copy_path (str): The absolute path of the new model directory.
+		"""
+		model_path = join_norm(self.local_directory, self.model_path)
+		staged_filenames = self._staged_filenames()
+		provision_model_directory(
+			join_norm(this_directory, 'VERSPM'),
+			copy_path,
+			writable=staged_filenames,
+			link=self.config.get('provision_links', True),
+		)
+		for filename in staged_filenames:
+			staged = join_norm(model_path, filename)
+			if os.path.exists(staged):
+				shutil.copy2(staged, join_norm(copy_path, filename))
+			elif os.path.exists(join_norm(copy_path, filename)):
+				os.remove(join_norm(copy_path, filename))
+
+	# The directory, alongside the model files, where base year
+	# model runs are saved when `reuse_base_year` is True.
+	_base_year_directory = 'base_year'
+
+	def _prepare_base_year(self):
+		"""
+		Get a saved base year datastore that matches the staged inputs.
+
+		If there is no saved base year run whose base year inputs match
+		those currently staged in the model directory, one is run now.
+
+		Returns:
+			str or None:
+				The path of the base year datastore, or None if the
+				base year run failed, in which case the experiment
+				should run all years.
+		"""
+		model_path = join_norm(self.local_directory, self.model_path)
+		run_parameters = read_run_parameters(model_path)
+		base_year = run_parameters['BaseYear']
+		digests = base_year_input_digests(model_path, base_year)
+		key = hashlib.sha256(json.dumps(digests, sort_keys=True).encode()).hexdigest()
+		base_root = join_norm(self.local_directory, self._base_year_directory)
+		base_path = join_norm(base_root, key[:16])
+		ledger_filename = join_norm(base_path, 'base_year.json')
+
+		if os.path.exists(ledger_filename):
+			with open(ledger_filename, 'rt') as f:
+				ledger = json.load(f)
+			mismatched = sorted(
+				name for name in set(digests) | set(ledger['inputs'])
+				if digests.get(name) != ledger['inputs'].get(name)
+			)
+			if not mismatched:
+				return ledger['datastore']
+			_logger.error(
+				f"VERSPM BASE YEAR inputs do not match the saved base year in {base_path}: "
+				f"{', '.join(mismatched)}, running all years"
+			)
+			return None
+
+		if os.path.isdir(base_root):
+			for other in os.listdir(base_root):
+				other_ledger = join_norm(base_root, other, 'base_year.json')
+				if os.path.exists(other_ledger):
+					with open(other_ledger, 'rt') as f:
+						other_inputs = json.load(f)['inputs']
+					mismatched = sorted(
+						name for name in set(digests) | set(other_inputs)
+						if digests.get(name) != other_inputs.get(name)
+					)
+					_logger.warning(
+						f"VERSPM BASE YEAR inputs differ from saved base {other} in: {', '.join(mismatched)}"
+					)
+
+		_logger.info(f"VERSPM BASE YEAR running {base_year} into {base_path}")
+		if os.path.exists(base_path):
+			shutil.rmtree(base_path)
+		base_model_path = join_norm(base_path, self.model_path)
+		self._copy_staged_model(base_model_path)
+		base_run_parameters = dict(run_parameters)
+		base_run_parameters['Years'] = [base_year]
+		run_parameters_filename = join_norm(base_model_path, 'defs', 'run_parameters.json')
+		os.unlink(run_parameters_filename)  # may be a hard link to the source model
+		with open(run_parameters_filename, 'wt') as f:
+			json.dump(base_run_parameters, f, indent=2)
+		self._write_run_model_script(base_model_path)
+		result = self._run_r(base_model_path, extract=False, log_directory=base_path)
+		datastore = find_datastore(base_model_path, run_parameters.get('DatastoreName', 'Datastore'))
+		if result.returncode or datastore is None:
+			_logger.error(f"VERSPM BASE YEAR run failed, running all years, see {base_path}")
+			return None
+		with open(ledger_filename, 'wt') as f:
+			json.dump({'datastore': datastore, 'inputs': digests}, f, indent=2)
+		return datastore
+
+	@property
+	def partial_rerun(self):
+		"""
+		Bool: Restart each run from a saved datastore taken before the first module with changed inputs.
+
+		Some levers only feed the late modules of the model: the fuel and
+		electricity costs and the driving efficiency inputs are read first
+		by the travel performance modules, and the technology mix by the
+		powertrain modules.  When this is True, the datastore of each run
+		is saved just before each of the `snapshot_modules`, and a later
+		run whose inputs to the modules before a snapshot are all the same
+		(see `input_modules`) loads that snapshot, and runs only the
+		modules from there on, so experiments that differ only in late
+		levers skip the household, land use and vehicle models.
+
+		Snapshots are taken by running the model in segments (in a
+		`snapshots` directory alongside the model files), which costs
+		an extra R run for each segment when no snapshot matches, so
+		this only pays off for designs that hold the early levers and
+		uncertainties fixed across many experiments.
+
+		The segments split the loop over the model years, so a run made
+		of segments runs each segment for every year before the next
+		segment, which is only the same as the full run when there is
+		one year to run.  This therefore only applies along with
+		`reuse_base_year`, when the base year is loaded from its saved
+		datastore and a single future year is run; otherwise every
+		run is a full run.
+		"""
+		return self.config.get('partial_rerun', False)
+
+	@partial_rerun.setter
+	def partial_rerun(self, value):
+		self.config['partial_rerun'] = bool(value)
+
+	@property
+	def snapshot_modules(self):
+		"""
+		List[str]: The modules before which the datastore is saved, when `partial_rerun` is True.
+
+		A module inside a loop (such as `CalculateVehicleOperatingCost`)
+		stands for the start of that loop.
+		"""
+		return list(self.config.get(
+			'snapshot_modules',
+			['AssignHhVehiclePowertrain', 'CalculateRoadDvmt'],
+		))
+
+	@snapshot_modules.setter
+	def snapshot_modules(self, value):
+		self.config['snapshot_modules'] = list(value)
+
+	@property
+	def input_modules(self):
+		"""
+		Dict[str,str]: The first module to read each input file.
+
+		The keys are paths relative to the model directory.  The defaults
+		(`verspm_input_modules`) are updated with the `input_modules` in
+		the configuration.  Files not listed are taken to be read by the
+		first module of the model.
+		"""
+		input_modules = dict(verspm_input_modules)
+		input_modules.update(self.config.get('input_modules', {}))
+		return input_modules
+
+	# The directory, alongside the model files, where the segment runs
+	# that save datastore snapshots are kept when `partial_rerun` is True.
+	_snapshot_directory = 'snapshots'
+
+	def _prepare_snapshot(self, base_datastore=None):
+		"""
+		Get the latest saved datastore snapshot that matches the staged inputs.
+
+		Snapshots are only used when a single year is run (see
+		`partial_rerun`).  They are looked for at each of the
+		`snapshot_modules`, from the last one back.  Any snapshots after
+		the one found (or all of them, if none is found) are then taken
+		now, by running the model up to each of them in turn.
+
+		Args:
+			base_datastore (str, optional): The base year datastore, if
+				the base year results are reused.
+
+		Returns:
+			Tuple[str or None, int]:
+				The datastore to load (or `base_datastore` if there is
+				no snapshot), and the step of `run_model.R` to start at.
+		"""
+		model_path = join_norm(self.local_directory, self.model_path)
+		run_parameters = read_run_parameters(model_path)
+		# Segments of the loop over years only give the same results as
+		# the full script when a single year is run (see `partial_rerun`).
+		years = [str(year) for year in run_parameters.get('Years', [])]
+		if base_datastore is not None:
+			years = [year for year in years if year != str(run_parameters.get('BaseYear'))]
+		if len(years) != 1:
+			_logger.warning(
+				f"VERSPM SNAPSHOT not used, {len(years)} years to run "
+				f"({'the base year run failed' if self.reuse_base_year else 'reuse_base_year is off'})"
+			)
+			return base_datastore, 0
+		with open(join_norm(this_directory, 'VERSPM', 'run_model.R'), 'rt') as f:
+			head, steps, tail = run_model_steps(f.read())
+		step_of_module = {
+			module: n for n, (text, modules) in enumerate(steps) for module in modules
+		}
+		unknown = [m for m in self.snapshot_modules if m not in step_of_module]
+		if unknown:
+			_logger.warning(f"VERSPM SNAPSHOT modules not in run_model.R: {', '.join(unknown)}")
+		points = sorted({step_of_module[m] for m in self.snapshot_modules if m in step_of_module} - {0})
+		if not points:
+			return base_datastore, 0
+
+		digests = base_year_input_digests(model_path, None)
+		input_modules = self.input_modules
+		first_steps = {
+			name: step_of_module.get(input_modules.get(name), 0)
+			for name in digests
+		}
+
+		def snapshot_key(point):
+			# Everything that determines the datastore before a step.
+			upstream = dict(
+				script=head + ''.join(text for text, modules in steps[:point]),
+				inputs={name: digests[name] for name in digests if first_steps[name] < point},
+				run_parameters=run_parameters,
+				base_datastore=base_datastore,
+			)
+			return hashlib.sha256(json.dumps(upstream, sort_keys=True).encode()).hexdigest()
+
+		snapshot_root = join_norm(self.local_directory, self._snapshot_directory)
+		datastore, start = base_datastore, 0
+		for point in reversed(points):
+			ledger_filename = join_norm(snapshot_root, snapshot_key(point)[:16], 'snapshot.json')
+			if os.path.exists(ledger_filename):
+				with open(ledger_filename, 'rt') as f:
+					datastore = json.load(f)['datastore']
+				start = point
+				_logger.info(f"VERSPM SNAPSHOT starting at {steps[point][1][0]} from {datastore}")
+				break
+
+		for point in points:
+			if point <= start:
+				continue
+			snapshot_path = join_norm(snapshot_root, snapshot_key(point)[:16])
+			_logger.info(f"VERSPM SNAPSHOT running up to {steps[point][1][0]} into {snapshot_path}")
+			if os.path.exists(snapshot_path):
+				shutil.rmtree(snapshot_path)
+			snapshot_model_path = join_norm(snapshot_path, self.model_path)
+			self._copy_staged_model(snapshot_model_path)
+			self._write_run_model_script(
+				snapshot_model_path,
+				datastore,
+				first_step=start,
+				last_step=point,
+				skip_base_year=base_datastore is not None,
+			)
+			result = self._run_r(snapshot_model_path, extract=False, log_directory=snapshot_path)
+			snapshot = find_datastore(snapshot_model_path, run_parameters.get('DatastoreName', 'Datastore'))
+			if result.returncode or snapshot is None:
+				_logger.error(f"VERSPM SNAPSHOT run failed, see {snapshot_path}")
+				break
+			with open(join_norm(snapshot_path, 'snapshot.json'), 'wt') as f:
+				json.dump({'datastore': snapshot, 'step': point, 'module': steps[point][1][0]}, f, indent=2)
+			datastore, start = snapshot, point
+		return datastore, start
+
+	@property
+	def use_r_session(self):
+		"""
+		Bool: Run the model in a persistent R session instead of a new `Rscript` process.
+		"""
+		return self.config.get('r_session', False)
+
+	@use_r_session.setter
+	def use_r_session(self, value):
+		self.config['r_session'] = bool(value)
+
+	@property
+	def r_session_max_runs(self):
+		"""
+		int: Restart the persistent R session after this many model runs.
+		"""
+		return self.config.get('r_session_max_runs', 25)
+
+	@r_session_max_runs.setter
+	def r_session_max_runs(self, value):
+		self.config['r_session_max_runs'] = int(value)
+
+	def _run_rscript(self, model_path=None, extract=True, log=None, timeout=None, fields=None, query_file=None):
+		"""
+		Run the model in a new `Rscript` process.
+
+		Args:
+			model_path (str, optional): The absolute path of the model
+				directory.  Defaults to the model directory of this instance.
+			extract (bool, default True): Extract the datastore tables
+				and query the measures after running the model.
+			log (RunLog, optional): Where to stream the R output.
+			timeout (float, optional): Kill `Rscript`, and any processes
+				it started, after this many seconds.
+			fields (Collection[str], optional): Extract only these
+				datastore fields, see `RSession.run_model`.
+			query_file (str or False, optional): Run only the query
+				specifications in this file, see `RSession.run_model`.
+
+		Returns:
+			subprocess.CompletedProcess
+		"""
+		if model_path is None:
+			model_path = join_norm(self.local_directory, self.model_path)
+
+		# This demo uses the `Rscript` command line tool to run R
+		# programmatically.
+		cmd = rscript_command()
+
+		# Write a small script that will run the model under VisionEval 2.0
+		with open(join_norm(self.local_directory, "verspm_runner.R"), "wt") as r_script:
+			r_script.write(f"""
+			require(visioneval)
+			source("{join_norm(self.config['r_runtime_path'], 'VisionEval.R')}", chdir = TRUE)
+			thismodel <- openModel("{model_path}")
+			thismodel$run()
+			""")
+			if extract:
+				if fields is None:
+					r_script.write("""
+			thismodel$extract()
+			""")
+				elif fields:
+					r_script.write(_r_extract_fields.format())
+					r_script.write(f"""
+			emat_extract(thismodel, c({', '.join(json.dumps(f) for f in fields)}))
+			""")
+				if query_file is None:
+					r_script.write("""
+			thismodel$query(Geography=c(Type='Marea',Value='RVMPO'))
+			""")
+				elif query_file:
+					r_script.write(f"""
+			thismodel$query(FileName="{query_file}", Geography=c(Type='Marea',Value='RVMPO'))
+			""")
+
+		# Ensure that R paths are set correctly.
+		r_lib = self.config['r_library_path']
+		with open(join_norm(self.local_directory, '.Rprofile'), 'wt') as rprof:
+			rprof.write(f'.libPaths("{r_lib}")\n')
+
+		# The subprocess.run command runs a command line tool. The
+		# name of the command line tool, plus all the command line arguments
+		# for the tool, are given as a list of strings, not one string.
+		# The `cwd` argument sets the current working directory from which the
+		# command line tool is launched.  Both stdout and stderr from the
+		# command line tool are streamed to the log, and their tails are
+		# available in the result to facilitate debugging.
+		return run_child_process(
+			[cmd, 'verspm_runner.R'],
+			cwd=self.local_directory,
+			log=log,
+			timeout=timeout,
+		)
+
+	# The configuration settings that can change the results of a
+	# model run, and so are part of the key for memoized results.
+	_memo_config_keys = ('model_source', 'r_library_path', 'r_runtime_path')
+
+	# The database table that holds memoized results.
+	_memo_table = 'verspm_memo'
+
+	@property
+	def memoize(self):
+		"""
+		bool: Whether to reuse results from identical experiments.
+
+		When this is True and the model has a SQLiteDB, each completed
+		run is recorded (in a `verspm_memo` table of the database) under
+		a key made from its normalized parameters, the `model_fingerprint`
+		and the definitions of the measures in the scope (see `memo_key`).
+		Any later experiment with the same key, in any scope with the same
+		measures stored in the same database, gets the recorded measures
+		(or measures loaded from the archived outputs) instead of running
+		the model again.  This only applies when `allow_short_circuit`
+		is also True.  It is off by default.
+		"""
+		return self.config.get('memoize', False)
+
+	@memoize.setter
+	def memoize(self, value):
+		self.config['memoize'] = bool(value)
+
+	@property
+	def model_fingerprint(self):
+		"""
+		str: A hash of the model files, scenario inputs and configuration.
+
+		This covers every file in the VERSPM model directory and the
+		scenario_inputs directory distributed with this module, and
+		the configuration settings that can change model results.
+		"""
+		trees = (
+			join_norm(this_directory, 'VERSPM'),
+			self.scenario_inputs.directory,
+		)
+		h = hashlib.sha256()
+		for tree in trees:
+			if tree not in _tree_fingerprints:
+				_tree_fingerprints[tree] = fingerprint_tree(tree)
+			h.update(_tree_fingerprints[tree].encode())
+		config = {k: self.config.get(k) for k in self._memo_config_keys}
+		h.update(json.dumps(config, sort_keys=True, default=str).encode())
+		return h.hexdigest()
+
+	def normalized_params(self, params):
+		"""
+		Get the complete and normalized parameters for an experiment.
+
+		Parameters missing from `params` take their default values,
+		as in `setup`, and each value is cast to the type of its
+		parameter, so that equivalent experiments compare equal.
+
+		Args:
+			params (dict): The experiment parameters.
+
+		Returns:
+			dict
+		"""
+		normalized = {}
+		for p in self.scope.get_parameters():
+			value = params.get(p.name, p.default)
+			if p.dtype == 'real':
+				value = float(value)
+			elif p.dtype == 'int':
+				value = int(value)
+			elif p.dtype == 'bool':
+				value = bool(value)
+			else:
+				value = str(value)
+			normalized[p.name] = value
+		return normalized
+
+	def measure_specs(self):
+		"""
+		Get the definitions of the measures in the scope.
+
+		Returns:
+			Dict[str, dict]: The parser specification of each measure.
+		"""
+		return {
+			measure.name: measure.parser
+			for measure in self.scope.get_measures()
+		}
+
+	def memo_key(self, params):
+		"""
+		Get the key for memoized results of an experiment.
+
+		The key covers the `model_fingerprint`, the normalized parameters,
+		and the `measure_specs`, so scopes that define measures of the
+		same name differently do not share memoized results.
+
+		Args:
+			params (dict): The experiment parameters.
+
+		Returns:
+			str
+		"""
+		h = hashlib.sha256(self.model_fingerprint.encode())
+		h.update(json.dumps(self.normalized_params(params), sort_keys=True).encode())
+		h.update(json.dumps(self.measure_specs(), sort_keys=True, default=str).encode())
+		return h.hexdigest()
+
+	def _memo_connection(self, db=None):
+		"""
+		Get the sqlite3 connection holding memoized results, if any.
+		"""
+		if db is None:
+			db = getattr(self, 'db', None)
+		if not self.memoize or not isinstance(db, SQLiteDB):
+			return None
+		# The table is created only once for each connection.
+		if not db.readonly and getattr(db, '_verspm_memo_conn', None) is not db.conn:
+			with db.conn:
+				db.conn.execute(
+					f"CREATE TABLE IF NOT EXISTS {self._memo_table} ("
+					"memo_key TEXT PRIMARY KEY, "
+					"scope_name TEXT, "
+					"experiment_id INTEGER, "
+					"run_id TEXT, "
+					"archive_path TEXT, "
+					"measures TEXT)"
+				)
+			db._verspm_memo_conn = db.conn
+		return db.conn
+
+	def recall_measures(self, params, measure_names=None, db=None):
+		"""
+		Get memoized measures for an experiment.
+
+		Measures that were not recorded with the memoized run (e.g.
+		measures that were unavailable then) are loaded from the archived
+		outputs of that run, if they are available.
+
+		Args:
+			params (dict): The experiment parameters.
+			measure_names (Collection[str], optional): The measures
+				to get.  Defaults to all measures in the scope.
+			db (SQLiteDB, optional): The database holding memoized
+				results.  Defaults to the database of this model.
+
+		Returns:
+			dict or None:
+				The measures, or None if there are no memoized
+				results that include every requested measure.
+		"""
+		conn = self._memo_connection(db)
+		if conn is None:
+			return None
+		if measure_names is None:
+			measure_names = self.scope.get_measure_names()
+		try:
+			row = conn.execute(
+				f"SELECT archive_path, measures FROM {self._memo_table} WHERE memo_key = ?",
+				(self.memo_key(params),),
+			).fetchone()
+		except sqlite3.OperationalError:
+			# A read-only database without the memo table.
+			return None
+		if row is None:
+			return None
+		archive_path, measures = row
+		measures = json.loads(measures)
+		missing = [name for name in measure_names if name not in measures]
+		if missing and archive_path:
+			try:
+				measures.update(self.measures_from_archive(archive_path, missing))
+			except Exception as err:
+				_logger.warning(f"VERSPM MEMO cannot load measures from {archive_path}: {err!r}")
+				return None
+		if any(name not in measures for name in measure_names):
+			return None
+		return {name: measures[name] for name in measure_names}
 
-		# Initialize a new daatabase if none was given.
+	def _memo_record(self, params, experiment_id, run_id, measures, db=None):
+		"""
+		Record the measures from a completed run for later reuse.
+		"""
 		if db is None:
-			if os.path.exists(db_filename):
-				initialize = False
-			else:
-				initialize = True
-			db = SQLiteDB(
-				db_filename,
-				initialize=initialize,
+			db = self.db
+		conn = self._memo_connection(db)
+		if conn is None or db.readonly:
+			return
+		if isinstance(db, _SpoolingDB):
+			db.pending.append(dict(
+				kind='memo',
+				table=self._memo_table,
+				row=self._memo_row(params, experiment_id, run_id, measures),
+			))
+			return
+		with conn:
+			conn.execute(
+				f"INSERT OR REPLACE INTO {self._memo_table} VALUES (?,?,?,?,?,?)",
+				self._memo_row(params, experiment_id, run_id, measures),
 			)
-		if db is False: # explicitly use no DB
-			db = None
-		else:
-			if scope.name not in db.read_scope_names():
-				db.store_scope(scope)
 
-		# Initialize the super class (FilesCoreModel)
-		super().__init__(
-			configuration=join_norm(cwd, "verspm-model-config.yml"),
-			scope=scope,
-			db=db,
-			name='VERSPM',
-			local_directory = cwd,
+	def _memo_row(self, params, experiment_id, run_id, measures):
+		"""
+		The row of the memo table recording the measures from a completed run.
+		"""
+		archive_path = None
+		if experiment_id is not None:
+			try:
+				archive_path = os.path.abspath(
+					self.get_experiment_archive_path(experiment_id, run_id=run_id)
+				)
+			except MissingArchivePathError:
+				pass
+		return (
+			self.memo_key(params),
+			self.scope.name,
+			None if experiment_id is None else int(experiment_id),
+			str(run_id) if run_id is not None else None,
+			archive_path,
+			json.dumps({k: float(v) for k, v in measures.items()}),
 		)
-		if isinstance(db, SQLiteDB):
-			self._sqlitedb_path = db.database_path
 
-		# Populate the model_path directory of the files-based model.
-		copy_tree(
-			join_norm(this_directory, 'VERSPM'),
-			join_norm(cwd, self.model_path),
-		)
+	def measures_from_archive(self, archive_path, measure_names=None, strict=False):
+		"""
+		Compute measures from the archived outputs of a model run.
 
-		# Ensure that R can be found.
-		r_lib = self.config['r_library_path']
-		with open(join_norm(cwd, self.model_path, '.Rprofile'), 'wt') as rprof:
-			rprof.write(f'.libPaths("{r_lib}")\n')
+		The archived outputs are read where they are, streaming each
+		needed file out of `run_archive.zip` (or the blob store) without
+		extracting it, and only the files needed for the requested measures are read.  The
+		post-processed measures are computed afresh from the archived
+		tables, so measures added to (or changed in) `post_process`
+		after the run are available.
 
-		# Add parsers to instruct the load_measures function
-		# how to parse the outputs and get the measure values.
+		Args:
+			archive_path (str): The experiment archive directory.
+			measure_names (Collection[str], optional): The measures
+				to get.  Defaults to all measures in the scope.
+			strict (bool, default False): Raise an error when an output
+				needed for a measure was not archived, instead of warning
+				and leaving out the measure.
 
-		# ComputedMeasures.json
-		instructions = {}
-		for measure in scope.get_measures():
-			if measure.parser and measure.parser.get('file') == 'ComputedMeasures.json':
-				instructions[measure.name] = key[measure.parser.get('key')]
-		self.add_parser(
-			MappingParser(
-				"ComputedMeasures.json",
-				instructions,
-			)
-		)
+		Returns:
+			dict: The measure values by name.
 
-		# Query-Spec Measures
-		instructions = {}
-		for measure in scope.get_measures():
-			if measure.parser and measure.parser.get('file') == 'Measures_VERSPM_2010,2038_Marea=RVMPO.csv':
-				if measure.parser.get('loc'):
-					instructions[measure.name] = loc[(str(j) for j in measure.parser.get('loc'))]
-				elif measure.parser.get('eval'):
-					instructions[measure.name] = eval(measure.parser.get('eval'))
-		self.add_parser(
-			TableParser(
-				"Measures_VERSPM_2010,2038_Marea=RVMPO.csv",
-				instructions,
-				index_col=0,
-			)
-		)
+		Raises:
+			FileNotFoundError: If the archive has no outputs.
+			UnarchivedOutputError: If `strict` and an output needed
+				for a measure is not in the archive.
+		"""
+		requested = None if measure_names is None else set(measure_names)
+		results = {}
+		with ArchivedOutputs(archive_path, self.rel_output_path) as outputs:
+			for parser in self._parsers:
+				names = [
+					name for name in parser.measure_names
+					if requested is None or name in requested
+				]
+				if not names:
+					continue
+				try:
+					if parser.filename == 'ComputedMeasures.json':
+						data = json.loads(json.dumps(self._compute_measures(
+							outputs.read_table('Marea_2038_1.csv', _marea_columns),
+							outputs.read_table('Household_2038_1.csv', _household_columns),
+						)))
+					else:
+						data = parser.loads(outputs.read_text(parser.filename))
+					results.update(parser.parse(data, names, archive_path))
+				except FileNotFoundError as err:
+					if strict:
+						raise UnarchivedOutputError(names, err) from err
+					for name in names:
+						warnings.warn(f'{name} unavailable, {err} not found')
+		return results
 
+	def archived_experiments(self, archive_root=None):
+		"""
+		Find the archived runs of experiments in this scope.
 
-	def setup(self, params: dict):
+		Args:
+			archive_root (str, optional): The archive directory, holding
+				a `scp_<scope name>` directory.  Defaults to the archive
+				path of this model.
+
+		Returns:
+			pandas.DataFrame:
+				The `run_id` and `archive_path` of each archived run,
+				indexed by experiment id.  When an experiment has been
+				archived more than once, only the latest run is given.
 		"""
-		Configure the core model with the experiment variable values.
+		import glob
+		if archive_root is None:
+			archive_root = self.resolved_archive_path
+		pattern = re.compile(r"^exp_([0-9]+)(?:_(.+))?$")
+		runs = {}
+		for path in glob.glob(os.path.join(archive_root, f"scp_{self.scope.name}", "exp_*")):
+			match = pattern.match(os.path.basename(path))
+			if not match or not os.path.isdir(path):
+				continue
+			experiment_id = int(match.group(1))
+			mtime = os.path.getmtime(path)
+			if experiment_id not in runs or mtime > runs[experiment_id][0]:
+				runs[experiment_id] = (mtime, match.group(2), os.path.abspath(path))
+		return pd.DataFrame(
+			[dict(run_id=run_id, archive_path=path) for _, run_id, path in runs.values()],
+			index=pd.Index(list(runs), name='experiment'),
+			columns=['run_id', 'archive_path'],
+		).sort_index()
 
-		This method is the place where the core model set up takes place,
-		including creating or modifying files as necessary to prepare
-		for a RSPM core model run.  When running experiments, this method
-		is called once for each core model experiment, where each experiment
-		is defined by a set of particular values for both the exogenous
-		uncertainties and the policy levers.  These values are passed to
-		the experiment only here, and not in the `run` method itself.
-		This facilitates debugging, as the `setup` method can potentially
-		be used without the `run` method, allowing the user to manually
-		inspect the prepared files and ensure they are correct before
-		actually running a potentially expensive model.
+	def reprocess_archives(
+			self,
+			experiment_ids=None,
+			measure_names=None,
+			*,
+			archive_root=None,
+			n_workers=None,
+			db=None,
+	):
+		"""
+		Compute measures for many archived model runs, without re-running the model.
 
-		At the end of the `setup` method, a core model experiment should be
-		ready to run using the `run` method.
+		This is the way to add a new measure to a completed set of model
+		runs.  Each archive is read in place (see `measures_from_archive`),
+		and the archives are shared out across a local process pool.  The
+		measures are then written to the database together.
+
+		A new measure can only be computed from archives of runs that
+		extracted the outputs it needs, so runs meant to be reprocessed
+		this way should be made with `full_extract` set to True.  If an
+		archive lacks an output needed for a requested measure, an error
+		is raised rather than leaving the measure missing.
 
 		Args:
-			params (dict):
-				experiment variables including both exogenous
-				uncertainty and policy levers
+			experiment_ids (Collection[int] or pandas.DataFrame, optional):
+				The experiments to reprocess, or a design whose index gives
+				the experiment ids.  Defaults to every archived experiment
+				in this scope.
+			measure_names (Collection[str], optional): The measures to
+				compute.  Defaults to all measures in the scope.
+			archive_root (str, optional): The archive directory.  Defaults
+				to the archive path of this model.
+			n_workers (int, optional): The number of local worker
+				processes.  If not given, the archives are reprocessed
+				in this process.
+			db (Database, optional): The database to write the measures
+				to.  Defaults to the database of this model.  Set to
+				False to not write the measures.
+
+		Returns:
+			pandas.DataFrame:
+				The measures, indexed by experiment id.  Experiments
+				whose archives could not be read are omitted.
 
 		Raises:
-			KeyError:
-				if a defined experiment variable is not supported
-				by the core model
+			UnarchivedOutputError: If any archive lacks an output needed
+				for the requested measures; no measures are written.
 		"""
-		_logger.info("VERSPM SETUP...")
+		from concurrent.futures import ProcessPoolExecutor
+		if db is None:
+			db = self.db
+		archived = self.archived_experiments(archive_root)
+		if isinstance(experiment_ids, pd.DataFrame):
+			experiment_ids = experiment_ids.index
+		if experiment_ids is not None:
+			experiment_ids = [int(i) for i in experiment_ids]
+			missing = sorted(set(experiment_ids) - set(archived.index))
+			if missing:
+				_logger.warning(f"VERSPM REPROCESS no archive for experiments {missing}")
+			archived = archived.loc[[i for i in experiment_ids if i in archived.index]]
+		if measure_names is not None:
+			measure_names = list(measure_names)
 
-		for p in self.scope.get_parameters():
-			if p.name not in params:
-				_logger.warning(f" - for {p.name} using default value {p.default}")
-				params[p.name] = p.default
+		tasks = list(archived['archive_path'].items())
+		_logger.info(f"VERSPM REPROCESS {len(tasks)} archives")
+		if n_workers is None:
+			results = _reprocess_archives(self, tasks, measure_names)
+		else:
+			n_blocks = max(min(n_workers * self._schedule_blocks_per_worker, len(tasks)), 1)
+			edges = np.linspace(0, len(tasks), n_blocks + 1).round().astype(int)
+			with ProcessPoolExecutor(
+					max_workers=n_workers,
+					initializer=_local_worker_init,
+					initargs=(
+						self.scope,
+						dict(self.config),
+						os.path.abspath(self.resolved_archive_path),
+					),
+			) as pool:
+				futures = [
+					pool.submit(_reprocess_worker_run, tasks[a:b], measure_names)
+					for a, b in zip(edges[:-1], edges[1:])
+				]
+				results = [result for future in futures for result in future.result()]
 
-		super().setup(params)
+		unextracted = {
+			experiment_id: missing
+			for experiment_id, _, _, missing in results
+			if missing
+		}
+		if unextracted:
+			first = min(unextracted)
+			_logger.error(
+				f"VERSPM REPROCESS archives of experiments {sorted(unextracted)} "
+				f"lack outputs, run with full_extract to archive them"
+			)
+			measure_names, missing = unextracted[first]
+			raise UnarchivedOutputError(measure_names, f"{missing} of experiment {first}")
 
-		# Check if we are using distributed multi-processing. If so,
-		# we'll need to copy some files into a local working directory,
-		# as otherwise changes in the files will over-write each other
-		# when different processes are working in a common directory at
-		# the same time.
+		measures = {}
+		for experiment_id, outcomes, error, _ in results:
+			if error:
+				_logger.error(f"VERSPM REPROCESS experiment {experiment_id}: {error}")
+			else:
+				measures[experiment_id] = outcomes
+		m_df = pd.DataFrame.from_dict(measures, orient='index')
+		m_df.index.name = 'experiment'
+		if db and not db.readonly and not m_df.empty:
+			run_ids = archived.loc[m_df.index, 'run_id']
+			known = run_ids.notna()
+			if known.any():
+				db.write_experiment_measures(
+					self.scope.name, 0, m_df[known.to_numpy()], list(run_ids[known]),
+				)
+			if not known.all():
+				db.write_experiment_measures(self.scope.name, 0, m_df[~known.to_numpy()])
+		return m_df
+
+	def run_model(self, scenario, policy):
+		"""
+		Runs an experiment through core model.
+
+		This extends the standard `run_model` with memoization (see
+		`memoize`).  An experiment that has no stored measures of its
+		own, but is identical to one already run, gets a copy of the
+		memoized measures in the database without running the model.
+
+		Each stage of the experiment is also recorded in the journal
+		(see `journal`).  An experiment is recorded as complete only
+		once its measures are stored.  An experiment that fails because
+		of its inputs, either in `setup` or in the model's own checks of
+		its inputs, is quarantined: its measures are all NaN, it is
+		recorded as quarantined, and it is not run again by
+		`resume_experiments`.  Errors in `setup` are quarantined whether
+		the journal is on or not, so one experiment with bad inputs
+		does not stop a whole design.
+
+		The `stage_metrics` of the experiment are stored in the database
+		along with its measures (see `read_stage_metrics`).
+
+		Args:
+			scenario (Scenario): A dict-like object that
+				has key-value pairs for each uncertainty.
+			policy (Policy): A dict-like object that
+				has key-value pairs for each lever.
+		"""
+		# On the workers of `run_experiments` with an evaluator, the
+		# results are sent to the result sink instead of being written
+		# to the database directly (see `batch_result_writes`).
+		spool = self.config.get('result_spool')
+		db = getattr(self, 'db', None)
+		if spool and isinstance(db, SQLiteDB) and not isinstance(db, _SpoolingDB) and not db.readonly:
+			self.db = _SpoolingDB(db, spool)
+			# Each experiment gets a run id of its own, as with the local
+			# pool; it is recorded in the database along with the results.
+			self.run_id = uuid.uuid1()
+			try:
+				return self.run_model(scenario, policy)
+			finally:
+				self.db.flush()
+				self.db = db
+
+		experiment_id = policy.get('_experiment_id_', None)
+		if experiment_id is None:
+			experiment_id = scenario.get('_experiment_id_', None)
+		db = getattr(self, 'db', None)
+		if not experiment_id and self.journal and isinstance(db, SQLiteDB):
+			params = {**scenario, **policy}
+			params.pop('_experiment_id_', None)
+			with warnings.catch_warnings():
+				warnings.simplefilter("ignore", category=MissingIdWarning)
+				experiment_id = db.read_experiment_id(self.scope.name, params)
+		self._journal_experiment_id = experiment_id if (self.journal and experiment_id) else None
+		self._journal_failed_stage = None
+		self._run_input_failure = False
+		self.stage_metrics = {}
+		self.journal_event('experiment', 'started')
 		try:
-			# First try to import the dask.distributed library
-			# and check if this code is running on a worker.
-			from dask.distributed import get_worker
-			worker = get_worker()
-		except (ValueError, ImportError):
-			# If the library is not available, or if the code is
-			# not running on a worker, then we are not running
-			# in multi-processing mode, and we can just use
-			# the main cwd as the working directory without
-			# copying anything.
-			pass
+			# The standard `run_model` catches the errors of the stages
+			# after `setup`, and reports them in `comment_on_run`, but
+			# not the errors of `setup`, which are quarantined here.
+			self._run_model_memoized(scenario, policy)
+		except Exception as err:
+			if self._journal_failed_stage != 'setup' and not isinstance(err, InputValidationError):
+				self.journal_event('experiment', 'failed', repr(err))
+				raise
+			_logger.error(f"VERSPM QUARANTINE experiment {experiment_id}, setup failed: {err!r}")
+			self.outcomes_output = {name: np.nan for name in self.scope.get_measure_names()}
+			self.comment_on_run = f"QUARANTINED EXPERIMENT {experiment_id}: {err!r}"
+			self.journal_event('experiment', 'quarantined', repr(err))
 		else:
-			# If we do find we are running this setup on a
-			# worker, then we want to set the local directory
-			# accordingly. We copy model files from the "master"
-			# working directory to the worker's local directory,
-			# if it is different (it should be). Depending
-			# on how large your core model is, you may or may
-			# not want to be copying the whole thing.
-			if self.local_directory != worker.local_directory:
+			if self.comment_on_run is None:
+				# An experiment is complete only once its results are
+				# committed; when that is done elsewhere, it is recorded
+				# there (see `ResultSink`).
+				if self._journal_experiment_id is None:
+					pass
+				elif isinstance(getattr(self, 'db', None), _SpoolingDB):
+					self.journal_event('experiment', 'ran')
+					self.db.pending.append(dict(
+						kind='journal',
+						path=self.journal_path,
+						experiment_id=int(experiment_id),
+						run_id=str(self.run_id),
+						status='complete',
+					))
+				elif self._journal_on_commit:
+					self.journal_event('experiment', 'ran')
+				else:
+					self.journal_event('experiment', 'complete')
+			elif self._run_input_failure:
+				_logger.error(f"VERSPM QUARANTINE experiment {experiment_id}: {self.comment_on_run}")
+				self.journal_event('experiment', 'quarantined', self.comment_on_run)
+			else:
+				self.journal_event('experiment', 'failed', self.comment_on_run)
+		finally:
+			self._journal_experiment_id = None
+		self._store_stage_metrics(experiment_id, getattr(self, 'run_id', None), self.stage_metrics)
 
-				# Make the archive path absolute, so all archives
-				# go back to the original directory.
-				self.archive_path = os.path.abspath(self.resolved_archive_path)
+	def _run_model_memoized(self, scenario, policy):
+		"""
+		Run an experiment, or get its measures from an identical one.
+		"""
+		db = getattr(self, 'db', None)
+		if not self.allow_short_circuit or self._memo_connection() is None:
+			return super().run_model(scenario, policy)
 
-				_logger.debug(f"DISTRIBUTED.COPY FROM {self.local_directory}")
-				_logger.debug(f"                   TO {worker.local_directory}")
-				copy_tree(
-					join_norm(self.local_directory, self.model_path),
-					join_norm(worker.local_directory, self.model_path),
+		params = {}
+		params.update(scenario)
+		params.update(policy)
+		experiment_id = params.pop('_experiment_id_', None)
+		if experiment_id is None:
+			with warnings.catch_warnings():
+				warnings.simplefilter("ignore", category=MissingIdWarning)
+				experiment_id = db.read_experiment_id(self.scope.name, params)
+		if experiment_id is not None:
+			precomputed = db.read_experiment_measures(
+				self.scope, design_name=None, experiment_id=experiment_id,
+			)
+			if not precomputed.empty:
+				# The standard short circuit applies.
+				return super().run_model(scenario, policy)
+
+		measures = self.recall_measures(params)
+		if measures is not None:
+			self.comment_on_run = None
+			self.outcomes_output = measures
+			if experiment_id is not None and not db.readonly:
+				db.write_experiment_measures(
+					self.scope.name, 0, pd.DataFrame(measures, index=[experiment_id]),
 				)
-				self.local_directory = worker.local_directory
+			self.log(f"memoized experiment_id {experiment_id}")
+			return
 
-		# The process of manipulating each input file is broken out
-		# into discrete sub-methods, as each step is loosely independent
-		# and having separate methods makes this clearer.
-		self._manipulate_model_parameters_json(params)
-		self._manipulate_income(params)
-		self._manipulate_bikes(params)
-		self._manipulate_land_use(params)
-		self._manipulate_transit(params)
-		self._manipulate_fuel_cost(params)
-		self._manipulate_technology_mix(params)
-		self._manipulate_parking(params)
-		self._manipulate_demand(params)
-		self._manipulate_vehicle_characteristics(params)
-		self._manipulate_driving_efficiency(params)
-		self._manipulate_vehicle_travel_cost(params)
-		_logger.info("VERSPM SETUP complete")
+		super().run_model(scenario, policy)
+		if self.comment_on_run is None and experiment_id is not None:
+			self._memo_record(params, experiment_id, getattr(self, 'run_id', None), self.outcomes_output)
 
-	def _manipulate_model_parameters_json(self, params):
+	@property
+	def schedule_experiments(self):
 		"""
-		Prepare the model_parameters input file based on the existing file.
+		Bool: Run experiments that share input values in sequence.
+
+		When this is True (the default), `run_experiments` does not run
+		a design in row order, but in an order that keeps experiments
+		sharing the same levels of categorical levers (and other input
+		values) together, and gives each worker of a local pool runs of
+		such experiments (see `schedule`).  Each worker then re-writes
+		fewer input files in `setup`, and can reuse its base year run.
+		The results are the same, and are still returned in the order
+		of the design, by experiment id.
+		"""
+		return self.config.get('schedule', True)
+
+	@schedule_experiments.setter
+	def schedule_experiments(self, value):
+		self.config['schedule'] = bool(value)
+
+	# The number of blocks of experiments given to each local pool
+	# worker; more blocks balance the load better when some workers
+	# are faster than others, fewer give more reuse of staged inputs.
+	_schedule_blocks_per_worker = 4
+
+	def schedule(self, experiments, n_blocks=1):
+		"""
+		Order experiments so that those sharing input values run in sequence.
 
 		Args:
-			params (dict):
-				The parameters for this experiment, including both
-				exogenous uncertainties and policy levers.
+			experiments (Mapping[int, dict]): The parameters of each
+				experiment, by experiment id.
+			n_blocks (int, default 1): The number of contiguous blocks
+				to cut the ordered experiments into.
+
+		Returns:
+			List[List[int]]: The experiment ids in each block.
 		"""
+		return schedule_experiments(
+			experiments,
+			[param_names for _, _, param_names, _ in self._input_groups],
+			n_blocks,
+		)
 
-		# load the text of the first demo input file
-		with open(join_norm(self.local_directory, self.model_path, 'defs', 'model_parameters.json'), 'rt') as f:
-			y = json.load(f)
+	@property
+	def journal(self):
+		"""
+		Bool: Record the state of each experiment in a journal.
 
-		y[0]['VALUE'] = str(params['ValueOfTime'])
+		The journal is a SQLite database (`verspm_journal.db`) in the scope
+		directory of the archive path, so it is shared by all the workers
+		writing to the same archive, and it survives the crash of any of
+		them, or of the process driving them.  Each stage of each
+		experiment (`setup`, `r_run`, `post_process`, `load_measures` and
+		`archive`) is recorded as it completes or fails, along with the
+		state of the experiment as a whole, which is one of "started",
+		"ran" (its results are not yet stored in the database), "complete",
+		"failed" or "quarantined".  See `journal_states` and
+		`resume_experiments`.
+		"""
+		return self.config.get('journal', True)
 
-		# write the manipulated text back out to the first demo input file
-		with open(join_norm(self.local_directory, self.model_path, 'defs', 'model_parameters.json'), 'wt') as f:
-			json.dump(y, f)
+	@journal.setter
+	def journal(self, value):
+		self.config['journal'] = bool(value)
 
-	def _manipulate_income(self, params):
+	@property
+	def run_retries(self):
 		"""
-		Prepare the income input file based on a template file.
+		int: The number of times to retry a failed model run.
 
-		Args:
-			params (dict):
-				The parameters for this experiment, including both
-				exogenous uncertainties and policy levers.
+		A run that fails because of its inputs (see `_input_failure_patterns`)
+		is not retried.
 		"""
+		return self.config.get('run_retries', 2)
 
-		computed_params = {}
-		computed_params['HHIncomePC'] = int(params['Income'])
-		computed_params['GQIncomePC'] = int(params['Income']*3/13)
+	@run_retries.setter
+	def run_retries(self, value):
+		self.config['run_retries'] = int(value)
 
-		with open(scenario_input('I','azone_per_cap_inc.csv.template'), 'rt') as f:
-			y = f.read()
+	@property
+	def retry_backoff(self):
+		"""
+		float: The seconds to wait before the first retry of a failed run, doubled for each further retry.
+		"""
+		return self.config.get('retry_backoff', 5.0)
 
-		for n in computed_params.keys():
-			y = y.replace(
-				f"__EMAT_PROVIDES_{n}__",  # the token to replace
-				str(computed_params[n])  # the value to replace it with (as a string)
-			)
+	@retry_backoff.setter
+	def retry_backoff(self, value):
+		self.config['retry_backoff'] = float(value)
 
-		out_filename = join_norm(
-			self.resolved_model_path, 'inputs', 'azone_per_cap_inc.csv'
-		)
-		_logger.debug(f"writing updates to: {out_filename}")
-		with open(out_filename, 'wt') as f:
-			f.write(y)
+	# The stages of an experiment recorded in the journal by
+	# `timing_stage`; model runs are recorded by `run`.
+	_journal_stages = ('setup', 'post_process', 'load_measures', 'archive')
 
-	def _manipulate_bikes(self, params):
+	_journal_filename = 'verspm_journal.db'
+
+	# Messages in the R output that show a run failed because of its
+	# inputs, as found by VisionEval's checks of the input files.
+	_input_failure_patterns = (
+		re.compile(rb"input files? (?:has|have|contains?) errors", re.IGNORECASE),
+		re.compile(rb"errors? in (?:the )?input files?", re.IGNORECASE),
+		re.compile(rb"input files? (?:is|are) missing", re.IGNORECASE),
+		re.compile(rb"missing input files?", re.IGNORECASE),
+	)
+
+	def _is_input_failure(self, result):
 		"""
-		Prepare the biking input file based on a template file.
+		Whether a failed R run failed because of its inputs.
 
 		Args:
-			params (dict):
-				The parameters for this experiment, including both
-				exogenous uncertainties and policy levers.
+			result (subprocess.CompletedProcess): The result of `_run_r`.
+
+		Returns:
+			bool
 		"""
+		if getattr(result, 'timed_out', False):
+			return False
+		output = (result.stdout or b"") + (result.stderr or b"")
+		return any(pattern.search(output) for pattern in self._input_failure_patterns)
 
-		computed_params = {}
-		computed_params['BikeDiversion'] = params['Bicycles']
+	@property
+	def journal_path(self):
+		"""str: The journal database file."""
+		return join_norm(
+			os.path.abspath(self.resolved_archive_path),
+			f"scp_{self.scope.name}",
+			self._journal_filename,
+		)
 
-		with open(scenario_input('B','azone_prop_sov_dvmt_diverted.csv.template'), 'rt') as f:
-			y = f.read()
+	def _journal_connection(self):
+		"""
+		Get the sqlite3 connection to the journal, for this process and thread.
+		"""
+		return open_journal(self.journal_path)
 
-		for n in computed_params.keys():
-			y = y.replace(
-				f"__EMAT_PROVIDES_{n}__",  # the token to replace
-				f"{computed_params[n]:.3f}"  # the value to replace it with (as a string)
-			)
+	def journal_event(self, stage, status, error=None, attempt=False):
+		"""
+		Record a stage of the current experiment in the journal.
 
-		out_filename = join_norm(
-			self.resolved_model_path, 'inputs', 'azone_prop_sov_dvmt_diverted.csv'
+		Nothing is recorded if the journal is off, or if no experiment
+		is being run by `run_model`.
+
+		Args:
+			stage (str): The stage, or 'experiment' for the state of
+				the experiment as a whole.
+			status (str): The status of the stage.
+			error (str, optional): A description of the failure.
+			attempt (bool, default False): Count this as an attempt
+				to run the model.
+		"""
+		experiment_id = self._journal_experiment_id
+		if experiment_id is None:
+			return
+		record_journal_event(
+			self.journal_path, experiment_id, getattr(self, 'run_id', None),
+			stage, status, error=error, attempt=attempt,
 		)
-		_logger.debug(f"writing updates to: {out_filename}")
-		with open(out_filename, 'wt') as f:
-			f.write(y)
 
-	def _manipulate_by_categorical_drop_in(self, params, cat_param, cat_mapping, ve_scenario_dir):
+	def journal_states(self):
 		"""
-		Copy in the relevant input files.
+		Read the state of each experiment from the journal.
+
+		Returns:
+			pandas.DataFrame:
+				The `status` of each experiment, the last of its stages
+				recorded (as "<stage>:<status>"), the run id, the number of
+				model run `attempts`, the last `error`, and the time it
+				was `updated`, indexed by experiment id.
+		"""
+		columns = ['run_id', 'stage', 'status', 'attempts', 'error', 'updated']
+		if not os.path.exists(self.journal_path):
+			return pd.DataFrame(columns=columns, index=pd.Index([], name='experiment'))
+		states = pd.read_sql_query(
+			f"SELECT experiment_id AS experiment, {', '.join(columns)} FROM experiments",
+			self._journal_connection(),
+			index_col='experiment',
+		)
+		return states.sort_index()
+
+	def resume_experiments(
+			self,
+			design=None,
+			*,
+			design_name=None,
+			db=None,
+			n_workers=None,
+			executor='process',
+			retry_quarantined=False,
+	):
+		"""
+		Run the experiments of a design that have not yet been completed.
+
+		The journal is used to find the experiments of the design that
+		have already been completed (or quarantined), and only the rest
+		are run, with `run_experiments`.  Experiments recorded as complete
+		whose measures are missing from the database are also run again.  This is the way to pick up a
+		design after the process running it (or one of its workers)
+		has died.  The measures of the experiments completed earlier
+		are read from the database if one is available, and otherwise
+		from their archives.
 
 		Args:
-			params (dict):
-				The parameters for this experiment, including both
-				exogenous uncertainties and policy levers.
+			design (pandas.DataFrame, optional): The design of experiments,
+				with experiment ids as its index.
+			design_name (str, optional): The name of a design of experiments
+				to load from the database, used only if `design` is None.
+			db (Database, optional): The database to use for loading and saving experiments.
+				If none is given, the default database for this model is used.
+			n_workers (int, optional): The number of local workers,
+				see `run_experiments`.
+			executor ({'process', 'thread'}, default 'process'): The kind
+				of local workers, see `run_experiments`.
+			retry_quarantined (bool, default False): Also run again the
+				experiments that were quarantined.
+
+		Returns:
+			pandas.DataFrame:
+				A DataFrame that contains all uncertainties, levers, and measures
+				for the experiments.
 		"""
-		scenario_dir = cat_mapping.get(params[cat_param])
-		for i in os.scandir(scenario_input(ve_scenario_dir,scenario_dir)):
-			if i.is_file():
-				shutil.copyfile(
-					scenario_input(ve_scenario_dir,scenario_dir,i.name),
-					join_norm(self.resolved_model_path, 'inputs', i.name)
+		from emat.experiment.experimental_design import ExperimentalDesign
+		if isinstance(design, str) and design_name is None:
+			design_name, design = design, None
+		if db is None:
+			db = self.db
+		if design is None:
+			if design_name is None:
+				raise ValueError("must give design_name or design")
+			if not db:
+				raise ValueError(f'cannot load design "{design_name}", there is no db')
+			design = db.read_experiment_parameters(self.scope.name, design_name)
+		if design.index.name != 'experiment':
+			raise ValueError("the design must be indexed by experiment id")
+
+		states = self.journal_states()
+		finished = {'complete'} if retry_quarantined else {'complete', 'quarantined'}
+		finished = states.index[states['status'].isin(finished)]
+		stored = None
+		if db:
+			stored = db.read_experiment_measures(self.scope.name)
+			if 'run' in stored.index.names:
+				stored = stored.reset_index('run', drop=True)
+			stored = stored[~stored.index.duplicated(keep='last')]
+			# Experiments recorded as complete, but with no stored
+			# measures (e.g. lost in a crash before they were written),
+			# are run again.
+			lost = states.index[
+				(states['status'] == 'complete') & ~states.index.isin(stored.index)
+			]
+			if len(lost):
+				_logger.warning(
+					f"VERSPM RESUME {len(lost)} complete experiments have no stored measures, running them again"
 				)
+				finished = finished.difference(lost)
+		done = design.index[design.index.isin(finished)]
+		pending = design.loc[~design.index.isin(finished)]
+		_logger.info(
+			f"VERSPM RESUME {len(done)} experiments finished, {len(pending)} to run"
+		)
 
-	def _manipulate_land_use(self, params):
+		measures = []
+		complete = [
+			i for i in done
+			if states.loc[i, 'status'] == 'complete'
+		]
+		if complete:
+			if stored is not None:
+				measures.append(stored.loc[stored.index.isin(complete)])
+			else:
+				measures.append(self.reprocess_archives(complete, db=False))
+		if not pending.empty:
+			ran = self.run_experiments(
+				pending, db=db, n_workers=n_workers, executor=executor,
+			)
+			measure_names = [name for name in self.scope.get_measure_names() if name in ran.columns]
+			measures.append(ran[measure_names])
+
+		parameters = design[[c for c in design.columns if c not in self.scope.get_measure_names()]]
+		if measures:
+			outcomes = pd.concat(measures, sort=False)
+			outcomes = outcomes[~outcomes.index.duplicated(keep='last')]
+			result = parameters.join(outcomes)
+		else:
+			result = parameters
+		result = ExperimentalDesign(self.ensure_dtypes(result))
+		result.scope = self.scope
+		result.design_name = getattr(design, 'design_name', design_name)
+		result.sampler_name = getattr(design, 'sampler_name', None)
+		return result
+
+	@property
+	def batch_result_writes(self):
 		"""
-		Copy in the relevant the land use input files.
+		Bool: Write the results of parallel runs to the database in batches.
 
-		Args:
-			params (dict):
-				The parameters for this experiment, including both
-				exogenous uncertainties and policy levers.
+		When this is True (the default), the results of experiments run
+		on a local pool, or by an evaluator such as a dask cluster, are
+		written to a `SQLiteDB` by a single writer thread in this process
+		(see `ResultSink`), which commits them in batches of up to
+		`result_batch_size` records, at least every `result_flush_seconds`.
+		Dask workers send their results through a spool directory next to
+		the database, so they never wait on its lock.  Experiments run
+		sequentially in this process, or by an asynchronous evaluator,
+		still write their results directly.
 		"""
-		cat_mapping = {
-			'base': '1',
-			'growth': '2',
-		}
-		return self._manipulate_by_categorical_drop_in(params, 'LandUse', cat_mapping, 'L')
+		return self.config.get('batch_result_writes', True)
 
-	def _manipulate_vehicle_travel_cost(self, params):
-		cat_mapping = {
-			'base': '1',
-			'steady ownership cost': '2',
-			'pay-per-mile insurance and higher cost': '3',
-		}
-		return self._manipulate_by_categorical_drop_in(params, 'VehicleTravelCost', cat_mapping, 'C')
+	@batch_result_writes.setter
+	def batch_result_writes(self, value):
+		self.config['batch_result_writes'] = bool(value)
 
-	def _manipulate_transit(self, params):
+	@property
+	def result_batch_size(self):
 		"""
-		Prepare the income input file based on a template file.
+		int: Write results to the database when this many records are waiting.
+		"""
+		return self.config.get('result_batch_size', 100)
 
-		Args:
-			params (dict):
-				The parameters for this experiment, including both
-				exogenous uncertainties and policy levers.
+	@result_batch_size.setter
+	def result_batch_size(self, value):
+		self.config['result_batch_size'] = int(value)
+
+	@property
+	def result_flush_seconds(self):
 		"""
+		float: Write results to the database when the oldest waiting record is this old.
+		"""
+		return self.config.get('result_flush_seconds', 2.0)
 
-		computed_params = {}
-		computed_params['DRRevMi'] = params['Transit'] * 2381994.664
-		computed_params['MBRevMi'] = params['Transit'] * 3580237.203
+	@result_flush_seconds.setter
+	def result_flush_seconds(self, value):
+		self.config['result_flush_seconds'] = float(value)
 
-		with open(scenario_input('T','marea_transit_service.csv.template'), 'rt') as f:
-			y = f.read()
+	def _result_sink(self, db, spool=False):
+		"""
+		Create a sink for results written to a database.
 
-		for n in computed_params.keys():
-			y = y.replace(
-				f"__EMAT_PROVIDES_{n}__",  # the token to replace
-				f"{computed_params[n]:.3f}",  # the value to replace it with (as a string)
-			)
+		Args:
+			db (Database): The database.
+			spool (bool, default False): Collect results from other
+				processes through a new spool directory next to the
+				database.
 
-		out_filename = join_norm(
-			self.resolved_model_path, 'inputs', 'marea_transit_service.csv'
+		Returns:
+			ResultSink or None:
+				The sink, not yet started, or None if results should
+				be written directly (see `batch_result_writes`).
+		"""
+		if (
+				not self.batch_result_writes
+				or not isinstance(db, SQLiteDB)
+				or db.readonly
+				or not os.path.isfile(db.database_path)
+		):
+			return None
+		spool_path = None
+		if spool:
+			database_path = os.path.abspath(db.database_path)
+			spool_path = tempfile.mkdtemp(
+				prefix=f".{os.path.basename(database_path)}-results-",
+				dir=os.path.dirname(database_path),
+			)
+		return ResultSink(
+			db.database_path,
+			self.scope.name,
+			batch_size=self.result_batch_size,
+			flush_seconds=self.result_flush_seconds,
+			spool=spool_path,
 		)
-		_logger.debug(f"writing updates to: {out_filename}")
-		with open(out_filename, 'wt') as f:
-			f.write(y)
 
-	def _manipulate_fuel_cost(self, params):
+	def _result_records(self, experiment_id, run_id, params, outcomes, comment, memo=False, metrics=None):
 		"""
-		Prepare the fuel and electric input file based on a template file.
+		The records for a `ResultSink` of a finished experiment.
+
+		A successful experiment is also recorded as complete in the
+		journal, if it is on, once its results are written.
 
 		Args:
-			params (dict):
-				The parameters for this experiment, including both
-				exogenous uncertainties and policy levers.
-		"""
+			experiment_id (int): The experiment id.
+			run_id (UUID): The run id.
+			params (dict): The experiment parameters.
+			outcomes (dict): The measures.
+			comment (str): The comment on the run, None if successful.
+			memo (bool, default False): Also memoize the measures.
+			metrics (dict, optional): The stage metrics of the run.
 
-		computed_params = {}
-		computed_params['FuelCost'] = params['FuelCost']
-		computed_params['ElectricCost'] = params['ElectricCost']
+		Returns:
+			List[dict]
+		"""
+		records = []
+		if metrics:
+			records.append(dict(
+				kind='metrics',
+				table=self._stage_metrics_table,
+				row=self._stage_metrics_row(experiment_id, run_id, metrics),
+			))
+		if comment:
+			return records + [dict(kind='status', experiment_id=experiment_id, run_id=run_id, status="FAILED")]
+		records += [
+			dict(kind='measures', experiment_id=experiment_id, run_id=run_id, measures=outcomes, source=0),
+			dict(kind='status', experiment_id=experiment_id, run_id=run_id, status="COMPLETE"),
+		]
+		if memo:
+			records.append(dict(
+				kind='memo',
+				table=self._memo_table,
+				row=self._memo_row(params, experiment_id, run_id, outcomes),
+			))
+		if self.journal:
+			records.append(dict(
+				kind='journal',
+				path=self.journal_path,
+				experiment_id=int(experiment_id),
+				run_id=None if run_id is None else str(run_id),
+				status='complete',
+			))
+		return records
 
-		with open(scenario_input('G','azone_fuel_power_cost.csv.template'), 'rt') as f:
-			y = f.read()
+	def run_experiments(
+			self,
+			design=None,
+			evaluator=None,
+			*,
+			design_name=None,
+			db=None,
+			allow_short_circuit=None,
+			n_workers=None,
+			executor='process',
+	):
+		"""
+		Runs a design of combined experiments using this model.
 
-		for n in computed_params.keys():
-			y = y.replace(
-				f"__EMAT_PROVIDES_{n}__",  # the token to replace
-				f"{computed_params[n]:.3f}",  # the value to replace it with (as a string)
-			)
+		This extends the standard `run_experiments` with a local
+		process pool, which can run several experiments at once on
+		a single machine without a dask scheduler.  Each worker
+		process gets its own copy of the model files, and runs
+		every step for each experiment (setup, run, post-processing
+		and archiving) independently.  Results are written to the
+		database in this process as the experiments finish, in batches
+		(see `batch_result_writes`).
 
-		out_filename = join_norm(
-			self.resolved_model_path, 'inputs', 'azone_fuel_power_cost.csv'
-		)
-		_logger.debug(f"writing updates to: {out_filename}")
-		with open(out_filename, 'wt') as f:
-			f.write(y)
+		However the experiments are run, the mixture input files for
+		the whole design are first rendered together (see
+		`prepare_mixtures`), so that `setup` only needs to copy them,
+		and (unless `schedule_experiments` is False) experiments that
+		share input values are run in sequence.
 
-	def _manipulate_technology_mix(self, params, ):
-		return self._manipulate_by_mixture(params, 'TechMix', 'F',)
+		Args:
+			design (pandas.DataFrame, optional): experiment definitions
+				given as a DataFrame, where each exogenous uncertainty and
+				policy levers is given as a column, and each row is an experiment.
+			evaluator (emat.workbench.Evaluator, optional): Optionally give an
+				evaluator instance.  If given, `n_workers` is ignored and the
+				experiments are run by this evaluator.
+			design_name (str, optional): The name of a design of experiments to
+				load from the database.  This design is only used if
+				`design` is None.
+			db (Database, optional): The database to use for loading and saving experiments.
+				If none is given, the default database for this model is used.
+				Set to False to explicitly not use the default database.
+			allow_short_circuit (bool, optional): Skip experiments that
+				already have results stored in the database.
+			n_workers (int, optional): The number of local worker processes.
+				If not given, experiments are run as usual by the
+				`evaluator` (by default, sequentially in this process).
+			executor ({'process', 'thread'}, default 'process'): Run the local
+				workers as processes, or as threads in this process.  As
+				the model itself runs in R subprocesses, threads can keep
+				as many model runs going as processes can, without the
+				memory cost of a Python process for each worker; but the
+				setup and post-processing for each experiment is then
+				subject to the Python global interpreter lock.  Only
+				thread workers report to the `progress_callback`.
 
-	def _manipulate_parking(self, params, ):
-		return self._manipulate_by_mixture(params, 'Parking', 'P',)
+		Returns:
+			pandas.DataFrame:
+				A DataFrame that contains all uncertainties, levers, and measures
+				for the experiments.
+		"""
+		if n_workers is None or evaluator is not None:
+			if isinstance(design, pd.DataFrame) and len(design) > 1:
+				self.prepare_mixtures(design)
+				if (
+						self.schedule_experiments
+						and evaluator is None
+						and design.index.name == 'experiment'
+				):
+					# The experiment ids are already set, so the design
+					# can be run in any order, and the results are then
+					# returned in the original order.
+					ordered = design.loc[self.schedule(design.to_dict(orient='index'))[0]]
+					for attr in ('design_name', 'sampler_name', 'scope'):
+						if hasattr(design, attr):
+							setattr(ordered, attr, getattr(design, attr))
+					result = super().run_experiments(
+						design=ordered,
+						design_name=design_name,
+						db=db,
+						allow_short_circuit=allow_short_circuit,
+					)
+					return result.loc[design.index]
+			# With an evaluator (such as a dask cluster), each worker
+			# sends its results to a single writer here, instead of
+			# writing them to the database itself.
+			sink = None
+			if evaluator is not None and not getattr(evaluator, 'asynchronous', False):
+				sink = self._result_sink(self.db if db is None else db, spool=True)
+				# The memo and stage metrics tables are created before
+				# the workers need them.
+				if sink is not None:
+					self._memo_connection(self.db if db is None else db)
+					self._stage_metrics_connection(self.db if db is None else db)
+			if sink is None:
+				return super().run_experiments(
+					design=design,
+					evaluator=evaluator,
+					design_name=design_name,
+					db=db,
+					allow_short_circuit=allow_short_circuit,
+				)
+			with sink:
+				self.config['result_spool'] = sink.spool
+				try:
+					return super().run_experiments(
+						design=design,
+						evaluator=evaluator,
+						design_name=design_name,
+						db=db,
+						allow_short_circuit=allow_short_circuit,
+					)
+				finally:
+					del self.config['result_spool']
 
-	def _manipulate_demand(self, params, ):
-		return self._manipulate_by_mixture(params, 'DemandManagement', 'D',)
+		from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+		from emat.experiment.experimental_design import ExperimentalDesign
 
-	def _manipulate_vehicle_characteristics(self, params, ):
-		return self._manipulate_by_mixture(params, 'VehicleCharacteristics', 'V',)
+		# catch user gives only a design, not experiment_parameters
+		if isinstance(design, str) and design_name is None:
+			design_name, design = design, None
+		if design_name is None and design is None:
+			raise ValueError("must give design_name or design")
+		if db is None:
+			db = self.db
+		if design_name is not None and design is None:
+			if not db:
+				raise ValueError(f'cannot load design "{design_name}", there is no db')
+			design = db.read_experiment_parameters(self.scope.name, design_name)
+		if design.empty:
+			raise ValueError("no experiments available")
+		if allow_short_circuit is None:
+			allow_short_circuit = self.allow_short_circuit
 
-	def _manipulate_driving_efficiency(self, params, ):
-		return self._manipulate_by_mixture(params, 'DrivingEfficiency', 'E',)
+		param_names = [
+			i for i in self.scope.get_parameter_names() if i in design.columns
+		]
+		experiments = {}
+		experiment_ids = []
+		for n, row in enumerate(design[param_names].itertuples(index=False)):
+			params = dict(zip(param_names, row))
+			if design.index.name == 'experiment':
+				experiment_id = design.index[n]
+			elif db:
+				experiment_id = db.get_experiment_id(self.scope.name, params)
+			else:
+				experiment_id = n + 1
+			experiments[experiment_id] = params
+			experiment_ids.append(experiment_id)
 
-	def _manipulate_by_mixture(self, params, weight_param, ve_scenario_dir, no_mix_cols=('Year', 'Geo',)):
+		measures = {}
+		if db and allow_short_circuit:
+			for experiment_id in list(experiments):
+				precomputed = db.read_experiment_measures(
+					self.scope, design_name=None, experiment_id=experiment_id,
+				)
+				if not precomputed.empty:
+					measures[experiment_id] = dict(precomputed.iloc[0])
+					experiments.pop(experiment_id)
+					self.log(f"short circuit experiment_id {experiment_id}")
 
-		weight_2 = params[weight_param]
-		weight_1 = 1.0-weight_2
-
-		# Gather list of all files in directory "1", and confirm they
-		# are also in directory "2"
-		filenames = []
-		for i in os.scandir(scenario_input(ve_scenario_dir,'1')):
-			if i.is_file():
-				filenames.append(i.name)
-				f2 = scenario_input(ve_scenario_dir,'2', i.name)
-				if not os.path.exists(f2):
-					raise FileNotFoundError(f2)
+			for experiment_id in list(experiments):
+				memoized = self.recall_measures(experiments[experiment_id], db=db)
+				if memoized is not None:
+					measures[experiment_id] = memoized
+					experiments.pop(experiment_id)
+					if not db.readonly:
+						db.write_experiment_measures(
+							self.scope.name, 0, pd.DataFrame(memoized, index=[experiment_id]),
+						)
+					self.log(f"memoized experiment_id {experiment_id}")
 
-		for filename in filenames:
-			df1 = pd.read_csv(scenario_input(ve_scenario_dir,'1',filename))
-			df2 = pd.read_csv(scenario_input(ve_scenario_dir,'2',filename))
-
-			float_mix_cols = list(df1.select_dtypes('float').columns)
-			for j in no_mix_cols:
-				if j in float_mix_cols:
-					float_mix_cols.remove(j)
-
-			if float_mix_cols:
-				df1_float = df1[float_mix_cols]
-				df2_float = df2[float_mix_cols]
-				df1[float_mix_cols] = df1_float * weight_1 + df2_float * weight_2
-
-			int_mix_cols = list(df1.select_dtypes('int').columns)
-			for j in no_mix_cols:
-				if j in int_mix_cols:
-					int_mix_cols.remove(j)
-
-			if int_mix_cols:
-				df1_int = df1[int_mix_cols]
-				df2_int = df2[int_mix_cols]
-				df_int_mix = df1_int * weight_1 + df2_int * weight_2
-				df1[int_mix_cols] = np.round(df_int_mix).astype(int)
+		# Mixture input files are rendered for all the experiments
+		# together, before the workers start.
+		if experiments:
+			self.prepare_mixtures(pd.DataFrame(list(experiments.values())))
 
-			out_filename = join_norm(
-				self.resolved_model_path, 'inputs', filename
+		n_total = len(experiments)
+		_logger.info(f"VERSPM LOCAL POOL running {n_total} experiments on {n_workers} {executor} workers")
+		# Each worker runs a block of experiments at a time, but sends
+		# back the result of each experiment on this queue as soon as it
+		# finishes, so results are stored as they arrive.
+		if executor == 'process':
+			import multiprocessing
+			results = multiprocessing.Queue()
+			pool = ProcessPoolExecutor(
+				max_workers=n_workers,
+				initializer=_local_worker_init,
+				initargs=(
+					self.scope,
+					dict(self.config),
+					os.path.abspath(self.resolved_archive_path),
+					results,
+				),
 			)
-			df1.to_csv(out_filename, index=False, float_format="%.5f")
+			def submit(block):
+				return pool.submit(_local_worker_run, block)
+		elif executor == 'thread':
+			# Each thread checks out its own model instance, with its
+			# own model files, for each block of experiments.
+			results = queue.Queue()
+			pool = ThreadPoolExecutor(max_workers=n_workers)
+			thread_models = queue.Queue()
+			for _ in range(min(n_workers, max(n_total, 1))):
+				thread_model = _local_worker_model_for(
+					self.scope,
+					dict(self.config),
+					os.path.abspath(self.resolved_archive_path),
+				)
+				thread_model.progress_callback = self.progress_callback
+				thread_models.put(thread_model)
+			def submit(block):
+				return pool.submit(_thread_worker_run, thread_models, results, block)
+		else:
+			raise ValueError(f"executor must be 'process' or 'thread', not {executor!r}")
 
+		if self.schedule_experiments:
+			# Experiments sharing input values are run in sequence, in
+			# a few blocks for each worker, so each worker can reuse
+			# the inputs already staged for the previous experiment.
+			blocks = self.schedule(experiments, n_workers * self._schedule_blocks_per_worker)
+		else:
+			blocks = [[experiment_id] for experiment_id in experiments]
 
-	def run(self):
-		"""
-		Run the core model.
+		# The run ids are allocated here, as the workers have no
+		# database, and sent to the workers with the experiments.
+		if db and not db.readonly:
+			run_ids = {
+				experiment_id: db.new_run_id(self.scope.name, experiment_id=experiment_id)[0]
+				for experiment_id in experiments
+			}
+		else:
+			run_ids = {experiment_id: uuid.uuid1() for experiment_id in experiments}
 
-		This method is the place where the RSPM core model run takes place.
-		Note that this method takes no arguments; all the input
-		exogenous uncertainties and policy levers are delivered to the
-		core model in the `setup` method, which will be executed prior
-		to calling this method. This facilitates debugging, as the `setup`
-		method can potentially be used without the `run` method, allowing
-		the user to manually inspect the prepared files and ensure they
-		are correct before actually running a potentially expensive model.
-		When running experiments, this method is called once for each core
-		model experiment, after the `setup` method completes.
+		# Results are written to the database by a single writer
+		# thread, in batches, as the experiments finish.
+		sink = self._result_sink(db)
+		if sink is not None:
+			memo_results = allow_short_circuit and self._memo_connection(db) is not None
+			self._stage_metrics_connection(db)
 
-		Raises:
-		    UserWarning: If model is not properly setup
+		try:
+			with pool:
+				futures = [
+					submit([
+						(experiment_id, experiments[experiment_id], run_ids[experiment_id])
+						for experiment_id in block
+					])
+					for block in blocks
+				]
+				# The writer thread is only started once the worker
+				# processes have been forked.
+				if sink is not None:
+					sink.start()
+				completed = _pool_results(results, futures, n_total)
+				for n_done, (experiment_id, run_id, outcomes, comment, metrics) in enumerate(completed, start=1):
+					measures[experiment_id] = outcomes
+					if comment:
+						_logger.error(f"VERSPM LOCAL POOL {comment}")
+					if sink is not None:
+						sink.put(self._result_records(
+							experiment_id, run_id, experiments[experiment_id], outcomes, comment,
+							memo=memo_results, metrics=metrics,
+						))
+					else:
+						self._store_stage_metrics(experiment_id, run_id, metrics, db=db)
+						if db and not db.readonly:
+							if comment:
+								db.existing_run_id(run_id, self.scope.name, experiment_id=experiment_id)
+								db.write_experiment_run_status(self.scope.name, run_id, experiment_id, "FAILED")
+							else:
+								db.write_experiment_measures(
+									self.scope.name, 0,
+									pd.DataFrame(outcomes, index=[experiment_id]),
+									[run_id],
+								)
+								db.write_experiment_run_status(self.scope.name, run_id, experiment_id, "COMPLETE")
+								if allow_short_circuit:
+									self._memo_record(experiments[experiment_id], experiment_id, run_id, outcomes, db=db)
+						if self.journal and not comment:
+							record_journal_event(
+								self.journal_path, experiment_id, run_id, 'experiment', 'complete',
+							)
+					_logger.info(f"VERSPM LOCAL POOL {n_done}/{n_total} complete, experiment_id {experiment_id}")
+		finally:
+			if sink is not None:
+				sink.close()
+			if executor == 'thread':
+				while not thread_models.empty():
+					thread_models.get().master_directory.cleanup()
+				# Shut down the R sessions of the finished pool threads.
+				alive = {t.ident for t in threading.enumerate()}
+				for k in list(_r_sessions):
+					if k[2] not in alive:
+						_r_sessions.pop(k).close()
+
+		outcomes = pd.DataFrame(
+			[measures.get(experiment_id, {}) for experiment_id in experiment_ids],
+			index=design.index,
+		)
+		result = pd.concat([design, outcomes], axis=1, sort=False)
+		result = ExperimentalDesign(self.ensure_dtypes(result))
+		result.scope = self.scope
+		result.design_name = getattr(design, 'design_name', design_name)
+		result.sampler_name = getattr(design, 'sampler_name', None)
+		return result
+
+	def adaptive_experiments(
+			self,
+			n_initial=None,
+			*,
+			target_score=0.9,
+			batch_size=None,
+			max_experiments=None,
+			n_candidates=None,
+			measure_names=None,
+			cv=5,
+			regressor=None,
+			design_name='adaptive',
+			random_seed=1234,
+			db=None,
+			n_workers=None,
+			executor='process',
+	):
 		"""
-		_logger.info("VERSPM RUN ...")
+		Run experiments chosen one batch at a time to train a metamodel.
 
-		# This demo uses the `Rscript` command line tool to run R
-		# programmatically.  On Windows, the tool also includes `.exe`.
-		if platform.system() == 'Windows':
-			cmd = 'Rscript.exe'
-		else:
-			cmd = 'Rscript'
+		Instead of running a large design of experiments fixed up front,
+		this runs a small initial design, fits a metamodel to the results,
+		and then repeatedly picks the next batch of experiments from a
+		large pool of candidates, where the metamodel is most uncertain
+		(weighting each measure by how poorly it is fit so far) and
+		furthest from the experiments already run.  This stops when the
+		cross-validation score of every measure reaches `target_score`,
+		or when `max_experiments` have been run.
 
-		# Write a small script that will run the model under VisionEval 2.0
-		with open(join_norm(self.local_directory, "verspm_runner.R"), "wt") as r_script:
-			r_script.write(f"""
-			require(visioneval)
-			source("{join_norm(self.config['r_runtime_path'], 'VisionEval.R')}", chdir = TRUE)
-			thismodel <- openModel("{join_norm(self.local_directory, self.model_path)}")
-			thismodel$run()
-			thismodel$extract()
-			thismodel$query(Geography=c(Type='Marea',Value='RVMPO'))
-			""")
+		Failed experiments (with no measures) are left out of the
+		metamodel, and measures that are missing for some experiments,
+		or do not vary across experiments, do not count against the
+		target.
 
-		# Ensure that R paths are set correctly.
-		r_lib = self.config['r_library_path']
-		with open(join_norm(self.local_directory, '.Rprofile'), 'wt') as rprof:
-			rprof.write(f'.libPaths("{r_lib}")\n')
+		Args:
+			n_initial (int, optional): The number of experiments in the
+				initial design, by default two per uncertainty and lever.
+			target_score (float, default 0.9): The cross-validation score
+				(R-squared) each measure must reach.
+			batch_size (int, optional): The number of experiments picked
+				in each batch, by default `n_workers` (or 1), so each
+				batch keeps the worker pool busy.
+			max_experiments (int, optional): The most experiments to run
+				in total, by default ten per uncertainty and lever (the
+				size of the default design of experiments).
+			n_candidates (int, optional): The number of candidates drawn
+				(with a Latin hypercube) to pick each batch from, by default
+				100 per experiment in the batch, and at least 1000.
+			measure_names (Collection[str], optional): The measures to
+				fit the metamodel to, by default all the measures in
+				the scope.
+			cv (int, default 5): The number of cross-validation folds (fewer
+				while there are fewer than twice as many experiments).
+			regressor (Estimator, optional): The metamodel regressor, by
+				default `adaptive_regressor()`.  The uncertainty of the
+				metamodel is found with `metamodel_uncertainty`.
+			design_name (str, default 'adaptive'): The name for the
+				design of experiments in the database.
+			random_seed (int, default 1234): The random seed for the
+				initial design and candidates.
+			db (Database, optional): The database to use for saving experiments.
+				If none is given, the default database for this model is used.
+				Set to False to explicitly not use the default database.
+			n_workers (int, optional): The number of local workers,
+				see `run_experiments`.
+			executor ({'process', 'thread'}, default 'process'): The kind
+				of local workers, see `run_experiments`.
 
-		# The subprocess.run command runs a command line tool. The
-		# name of the command line tool, plus all the command line arguments
-		# for the tool, are given as a list of strings, not one string.
-		# The `cwd` argument sets the current working directory from which the
-		# command line tool is launched.  Setting `capture_output` to True
-		# will capture both stdout and stderr from the command line tool, and
-		# make these available in the result to facilitate debugging.
-		self.last_run_result = subprocess.run(
-			[cmd, 'verspm_runner.R'],
-			cwd=self.local_directory,
-			capture_output=True,
-		)
-		if self.last_run_result.returncode:
-			raise subprocess.CalledProcessError(
-				self.last_run_result.returncode,
-				self.last_run_result.args,
-				self.last_run_result.stdout,
-				self.last_run_result.stderr,
+		Returns:
+			Tuple[pandas.DataFrame, emat.PythonCoreModel, pandas.DataFrame]:
+				All the experiments run, with their measures; the last
+				metamodel fit; and the cross-validation score of each
+				measure after each batch, indexed by the number of
+				experiments run.
+		"""
+		from emat.model.meta_model import create_metamodel
+		from emat.experiment.experimental_design import ExperimentalDesign
+		if db is None:
+			db = self.db
+		n_factors = len(self.scope.get_uncertainties()) + len(self.scope.get_levers())
+		if n_initial is None:
+			n_initial = 2 * n_factors
+		if batch_size is None:
+			batch_size = n_workers or 1
+		if max_experiments is None:
+			max_experiments = 10 * n_factors
+		if n_candidates is None:
+			n_candidates = max(100 * batch_size, 1000)
+		if measure_names is None:
+			measure_names = self.scope.get_measure_names()
+		measure_names = list(measure_names)
+
+		def run(design):
+			if db:
+				design.index = db.write_experiment_parameters(self.scope.name, design_name, design)
+			else:
+				start = 1 if not batches else int(batches[-1].index.max()) + 1
+				design.index = pd.RangeIndex(start, start + len(design))
+			design.index.name = 'experiment'
+			batches.append(self.run_experiments(design, db=db, n_workers=n_workers, executor=executor))
+
+		batches = []
+		run(self.design_experiments(n_samples=n_initial, random_seed=random_seed, db=False))
+		scores = []
+		iteration = 0
+		while True:
+			experiments = pd.concat(batches)
+			measured = [m for m in measure_names if m in experiments.columns]
+			fit = experiments.dropna(subset=measured, how='all')
+			varying = [
+				m for m in measured
+				if fit[m].notna().all() and fit[m].std() > 0
+			]
+			if not varying:
+				raise ValueError("none of the measures vary across the experiments run")
+			metamodel = create_metamodel(
+				self.scope,
+				fit,
+				include_measures=varying,
+				random_state=random_seed,
+				suppress_converge_warnings=True,
+				regressor=regressor if regressor is not None else adaptive_regressor(random_seed),
 			)
-		else:
-			with open(join_norm(self.local_directory, self.model_path, 'output', 'stdout.log'), 'wb') as slog:
-				slog.write(self.last_run_result.stdout)
+			score = metamodel.function.cross_val_scores(
+				cv=max(min(cv, len(fit) // 2), 2), return_type='raw', use_cache=False,
+			).fillna(0)
+			score.name = len(experiments)
+			scores.append(score)
+			worst = score.idxmin()
+			_logger.info(
+				f"VERSPM ADAPTIVE {len(experiments)} experiments, "
+				f"lowest cross-validation score {score[worst]:.4f} for {worst}"
+			)
+			if score.min() >= target_score:
+				_logger.info(f"VERSPM ADAPTIVE reached target score {target_score}")
+				break
+			n_next = min(batch_size, max_experiments - len(experiments))
+			if n_next <= 0:
+				_logger.info(f"VERSPM ADAPTIVE stopped at {len(experiments)} experiments")
+				break
 
-		# VisionEval Version 2 appends timestamps to output filenames,
-		# but because we're running in a temporary directory, we can
-		# strip them down to standard filenames.
-		import re, glob
-		renamer = re.compile(r"(.*)_202[0-9]-[0-9]+-[0-9]+_[0-9]+(\.csv)")
-		_logger.debug("VERSPM RUN renaming files")
-		for outfile in glob.glob(join_norm(self.local_directory, self.model_path, 'output', '*.csv')):
-			_logger.debug(f"VERSPM RUN renaming: {outfile}")
-			if renamer.match(outfile):
-				newname = renamer.sub(r"\1\2", outfile)
-				_logger.debug(f"     to: {newname}")
-				os.rename(outfile, newname)
+			# Each measure contributes its predictive standard deviation,
+			# relative to its spread in the experiments so far, weighted
+			# by how far its score falls short of the target.
+			iteration += 1
+			candidates = self.design_experiments(
+				n_samples=n_candidates, random_seed=random_seed + iteration, db=False,
+			)
+			uncertainty = metamodel_uncertainty(metamodel, candidates)
+			spread = metamodel.function.output_sample.std().replace(0, 1)
+			weight = (target_score - score).clip(lower=0) / spread
+			value = uncertainty[weight.index] @ weight
+			picks = pick_batch(
+				value,
+				metamodel.function.preprocess_raw_input(candidates, to_type=np.float64),
+				metamodel.function.preprocess_raw_input(experiments, to_type=np.float64),
+				n_next,
+			)
+			run(candidates.iloc[picks].copy())
 
-		_logger.info("VERSPM RUN complete")
+		result = ExperimentalDesign(self.ensure_dtypes(experiments))
+		result.scope = self.scope
+		result.design_name = design_name
+		result.sampler_name = 'adaptive'
+		return result, metamodel, pd.DataFrame(scores).rename_axis('experiments')
 
 	def last_run_logs(self, output=None):
 		"""
 		Display the logs from the last run.
+
+		Only the tail of each log is kept in memory (see `r_log_tail_bytes`);
+		the complete logs are in the log directory reported at the end.
 		"""
 		if output is None:
 			output = print
@@ -580,9 +4860,12 @@ class VERSPModel(FilesCoreModel):
 			if last_run_result.stderr:
 				output("=== STDERR ===")
 				to_out(last_run_result.stderr)
+			if getattr(last_run_result, 'log_directory', None):
+				output(f"=== COMPLETE LOGS IN {last_run_result.log_directory} ===")
 			output("=== END OF LOG ===")
 
 
+	@timed_stage('post_process')
 	def post_process(self, params=None, measure_names=None, output_path=None):
 		"""
 		Runs post processors associated with particular performance measures.
@@ -617,8 +4900,8 @@ class VERSPModel(FilesCoreModel):
 				method may also be called on archived model results, allowing
 				it to run to generate only a subset of (probably new) performance
 				measures based on these archived runs. In this demo, the
-				the argument is optional; if not given, all measures will be
-				post-processed.
+				the argument is optional; if not given, all measures in the
+				scope will be post-processed.
 			output_path (str, optional):
 				Path to model outputs.  If this is not given (typical for the
 				initial run of core model experiments) then the local/default
@@ -637,43 +4920,78 @@ class VERSPModel(FilesCoreModel):
 
 		if output_path is None:
 			output_path = join_norm(self.local_directory, self.model_path, self.rel_output_path)
-		marea_2038 = pd.read_csv(
+		self._computed_measures = (None, None)
+
+		# All the computed measures are written together, so they are
+		# only skipped if none of them is requested.  By default the
+		# measures are those in the scope, as only the outputs these
+		# need are extracted after each run (see `extraction_plan`).
+		if measure_names is None:
+			measure_names = self.scope.get_measure_names()
+		computed_names = {
+			name
+			for parser in self._parsers
+			if parser.filename == 'ComputedMeasures.json'
+			for name in parser.measure_names
+		}
+		if not computed_names.intersection(measure_names):
+			return
+
+		# Only the columns actually used below are read, with
+		# explicit dtypes, as these tables can be large.
+		marea_2038 = read_output_table(
 			join_norm(output_path, 'Marea_2038_1.csv'),
+			_marea_columns,
 		)
-		household_2038 = pd.read_csv(
+		household_2038 = read_output_table(
 			join_norm(output_path, 'Household_2038_1.csv'),
+			_household_columns,
 		)
+		result = self._compute_measures(marea_2038, household_2038)
+
+		with open(join_norm(output_path, 'ComputedMeasures.json'), 'wt') as out:
+			json.dump(result, out)
+		# Keep the measures, so `load_measures` need not read them back.
+		self._computed_measures = (join_norm(output_path), json.loads(json.dumps(result)))
+
+	def _compute_measures(self, marea_2038, household_2038):
+		"""
+		Compute the post-processed measures from the output tables.
+
+		Args:
+			marea_2038 (pandas.DataFrame): The `_marea_columns` of
+				the 2038 Marea table.
+			household_2038 (pandas.DataFrame): The `_household_columns`
+				of the 2038 Household table.
+
+		Returns:
+			dict
+		"""
+		deflators = read_deflators(join_norm(self.resolved_model_path, 'defs', 'deflators.csv'))
+
+		# Compute every column total in one pass over each table.
+		hh_totals = household_2038.sum()
+		marea_totals = marea_2038.sum()
 
-		population = household_2038['HhSize'].sum()
+		population = hh_totals['HhSize']
 		GHGReduction = 0
-		DVMTPerCapita = household_2038['Dvmt'].sum() / population
-		WalkTravelPerCapita = household_2038['WalkTrips'].sum() / population
-		AirPollutionEm = household_2038['DailyCO2e'].sum()
+		DVMTPerCapita = hh_totals['Dvmt'] / population
+		WalkTravelPerCapita = hh_totals['WalkTrips'] / population
+		AirPollutionEm = hh_totals['DailyCO2e']
 		FuelUse = (
-			household_2038['DailyGGE'].sum()
-			+ marea_2038['ComSvcUrbanGGE'].sum()
-			+ marea_2038['ComSvcNonUrbanGGE'].sum()
+			hh_totals['DailyGGE']
+			+ marea_totals['ComSvcUrbanGGE']
+			+ marea_totals['ComSvcNonUrbanGGE']
 		) * 365
 		TruckDelay = 0
 		OperationCost = household_2038['AveVehCostPM'] * household_2038['Dvmt']
 		TotalCost = household_2038['OwnCost']+OperationCost
-		VehicleCost = TotalCost.sum()/household_2038['Income'].sum() * 100
-
-		def deflateCurrency(values, FromYear, ToYear):
-			deflators_df = pd.read_csv(join_norm(self.model_path, 'defs', 'deflators.csv'))
-			deflators_df.index = deflators_df['Year'].astype(str)
-			FromYear = str(FromYear)
-			ToYear = str(ToYear)
-			if FromYear not in deflators_df.index:
-				raise KeyError(f"invalid FromYear {FromYear}")
-			if ToYear not in deflators_df.index:
-				raise KeyError(f"invalid ToYear {ToYear}")
-			return values * deflators_df.loc[ToYear, 'Value'] / deflators_df.loc[FromYear, 'Value']
+		VehicleCost = TotalCost.sum()/hh_totals['Income'] * 100
 
 		BaseYear = 2010
-		Income2005 = deflateCurrency(household_2038['Income'], BaseYear, "2005")
+		Income2005 = deflate_currency(household_2038['Income'], deflators, BaseYear, "2005")
 		IsLowIncome = Income2005 < 20000
-		VehicleCostLow = TotalCost[IsLowIncome].sum()/household_2038[IsLowIncome]['Income'].sum() * 100
+		VehicleCostLow = TotalCost[IsLowIncome].sum()/household_2038['Income'][IsLowIncome].sum() * 100
 
 		result = dict(
 			GHGReduction=GHGReduction,
@@ -685,15 +5003,64 @@ class VERSPModel(FilesCoreModel):
 			VehicleCost=VehicleCost,
 			VehicleCostLow=VehicleCostLow,
 		)
+		return result
 
-		with open(join_norm(output_path, 'ComputedMeasures.json'), 'wt') as out:
-			json.dump(result, out)
 
+	@property
+	def archive_format(self):
+		"""
+		str: The format for archived outputs, one of 'zip', 'parquet' or 'blobs'.
+		"""
+		return self.config.get('archive_format', 'zip')
+
+	@archive_format.setter
+	def archive_format(self, value):
+		if value not in ('zip', 'parquet', 'blobs'):
+			raise ValueError(f"archive_format must be 'zip', 'parquet' or 'blobs', not {value!r}")
+		self.config['archive_format'] = value
+
+	@property
+	def blob_store_path(self):
+		"""
+		str: The blob store for the 'blobs' archive format.
+
+		By default this is a `blobs` directory beside the experiment
+		archives of the scope, but it can be set (as `blob_store_path`
+		in the configuration) to share one store between scopes.
+		"""
+		path = self.config.get('blob_store_path')
+		if path is None:
+			return join_norm(
+				os.path.abspath(self.resolved_archive_path),
+				f"scp_{self.scope.name}",
+				'blobs',
+			)
+		return os.path.abspath(path)
+
+	@blob_store_path.setter
+	def blob_store_path(self, value):
+		self.config['blob_store_path'] = value
 
 	def archive(self, params, model_results_path=None, experiment_id=None):
 		"""
 		Copies model outputs to archive location.
 
+		By default the outputs are stored in a zip file.  If the
+		`archive_format` is 'parquet', the outputs are instead stored
+		in an output directory within the archive location, with each
+		datastore table as a Parquet file (see `archive_output_tables`).
+		That directory can be given directly as the `output_path` to
+		`post_process`, or loaded with `load_archived_measures`.  If
+		the `archive_format` is 'blobs', each output file is stored
+		once in the `blob_store_path`, shared by all the experiments,
+		and the archive location gets only a manifest of the files
+		(see `archive_output_blobs`).  Whatever the format, the
+		archived outputs can be read with `ArchivedOutputs`.
+
+		The metrics for each stage of the experiment (see `stage_metrics`),
+		including archiving itself, are also written to the archive
+		location, as `stage_metrics.json`.
+
 		Args:
 			params (dict):
 				Dictionary of experiment variables
@@ -712,6 +5079,335 @@ class VERSPModel(FilesCoreModel):
 				if db is not None:
 					experiment_id = db.get_experiment_id(self.scope.name, None, params)
 			model_results_path = self.get_experiment_archive_path(experiment_id)
+		with self.timing_stage('archive'):
+			self._archive_outputs(model_results_path)
+		os.makedirs(model_results_path, exist_ok=True)
+		with open(os.path.join(model_results_path, self._stage_metrics_filename), 'wt') as f:
+			json.dump(
+				dict(
+					experiment_id=None if experiment_id is None else int(experiment_id),
+					run_id=str(getattr(self, 'run_id', None)),
+					stages=self.stage_metrics,
+				),
+				f, indent=1,
+			)
+
+	# The file in each experiment archive that records stage metrics.
+	_stage_metrics_filename = 'stage_metrics.json'
+
+	@contextlib.contextmanager
+	def timing_stage(self, name):
+		"""
+		Record the metrics of a stage of the current experiment.
+
+		The wall time, the CPU time of the thread running the stage
+		(so that stages run at once by other threads, as with the
+		thread executor of `run_experiments`, are not counted), and
+		the running peak resident memory of this process, i.e. the
+		peak since the process started, not just during the stage, are
+		recorded in `stage_metrics` under the stage name when the stage
+		ends, as `wall`, `cpu` and `running_peak_rss_mb`.  The main stages
+		are also recorded in the journal.
+
+		Args:
+			name (str): The stage name.
+		"""
+		start_wall = time.perf_counter()
+		start_cpu = time.thread_time()
+		try:
+			yield
+		except BaseException as err:
+			if name in self._journal_stages:
+				self._journal_failed_stage = name
+				self.journal_event(name, 'failed', repr(err))
+			raise
+		else:
+			if name in self._journal_stages:
+				self.journal_event(name, 'done')
+		finally:
+			self.stage_metrics[name] = dict(
+				wall=time.perf_counter() - start_wall,
+				cpu=time.thread_time() - start_cpu,
+				running_peak_rss_mb=max_rss_mb(),
+			)
+
+	def _record_r_usage(self, result):
+		"""
+		Add the usage reported for an R run to the stage metrics.
+
+		Args:
+			result (subprocess.CompletedProcess): The result of `_run_r`.
+		"""
+		usage = dict(getattr(result, 'usage', {}))
+		startup = usage.pop('r_startup', None)
+		self.stage_metrics['r_run'].update(usage)
+		memory_wait = getattr(result, 'memory_wait', 0)
+		if memory_wait:
+			self.stage_metrics['memory_wait'] = dict(wall=memory_wait)
+		if startup is not None:
+			self.stage_metrics['r_startup'] = dict(wall=startup)
+
+	@timed_stage('load_measures')
+	def load_measures(self, measure_names=None, *, rel_output_path=None, abs_output_path=None):
+		"""
+		Import selected measures from the core model.
+
+		This works like the standard `load_measures`, with the time spent
+		in the parsers recorded in `stage_metrics`, but each parser reads
+		its file only if one of its measures is requested, and computes
+		only the requested measures.  The computed measures from the last
+		`post_process` of the same output directory are used from memory
+		instead of being read back from `ComputedMeasures.json`.
+
+		Args:
+			measure_names (Collection[str], optional):
+				Names of measures to load.  If not given, all
+				measures in the scope are loaded.
+			rel_output_path, abs_output_path (str, optional):
+				Path to model outputs.  If this is not given, the
+				default output directory is used.
+
+		Returns:
+			dict: The measure values by name.
+		"""
+		if rel_output_path is not None and abs_output_path is not None:
+			raise ValueError("cannot give both `rel_output_path` and `abs_output_path`")
+		elif abs_output_path is not None:
+			output_path = abs_output_path
+		else:
+			output_path = join_norm(self.resolved_model_path, rel_output_path or self.rel_output_path)
+		if not os.path.isdir(output_path):
+			raise NotADirectoryError(output_path)
+
+		requested = None if measure_names is None else set(measure_names)
+		computed_path, computed = getattr(self, '_computed_measures', (None, None))
+		results = {}
+		for parser in self._parsers:
+			names = [
+				name for name in parser.measure_names
+				if requested is None or name in requested
+			]
+			if not names:
+				continue
+			try:
+				if not hasattr(parser, 'parse'):
+					measures = parser.read(output_path)
+				elif parser.filename == 'ComputedMeasures.json' and computed_path == join_norm(output_path):
+					measures = parser.parse(computed, names, output_path)
+				else:
+					measures = parser.read(output_path, names)
+			except FileNotFoundError as err:
+				for name in names:
+					warnings.warn(f'{name} unavailable, {err} not found')
+			else:
+				for k, v in measures.items():
+					if requested is None or k in requested:
+						results[k] = v
+
+		# Also assign to outcomes_output instead of returning, for ema_workbench compatibility
+		self.outcomes_output = results
+		return results
+
+	# The database table that holds the stage metrics of each run.
+	_stage_metrics_table = 'verspm_stage_metrics'
+
+	def _stage_metrics_connection(self, db=None):
+		"""
+		Get the sqlite3 connection to store stage metrics in, if any.
+		"""
+		if db is None:
+			db = getattr(self, 'db', None)
+		if not isinstance(db, SQLiteDB) or db.readonly:
+			return None
+		# The table is created only once for each connection.
+		if getattr(db, '_verspm_stage_metrics_conn', None) is not db.conn:
+			with db.conn:
+				db.conn.execute(
+					f"CREATE TABLE IF NOT EXISTS {self._stage_metrics_table} ("
+					"scope_name TEXT, "
+					"experiment_id INTEGER, "
+					"run_id TEXT, "
+					"metrics TEXT, "
+					"PRIMARY KEY (scope_name, experiment_id, run_id))"
+				)
+			db._verspm_stage_metrics_conn = db.conn
+		return db.conn
+
+	def _stage_metrics_row(self, experiment_id, run_id, metrics):
+		"""
+		The row of the stage metrics table recording the metrics of a run.
+		"""
+		return (
+			self.scope.name,
+			int(experiment_id),
+			str(run_id),
+			json.dumps(metrics, default=float),
+		)
+
+	def _store_stage_metrics(self, experiment_id, run_id, metrics, db=None):
+		"""
+		Store the stage metrics of a run in the database, if there is one.
+		"""
+		if db is None:
+			db = getattr(self, 'db', None)
+		if experiment_id is None or not metrics:
+			return
+		if isinstance(db, _SpoolingDB):
+			db.pending.append(dict(
+				kind='metrics',
+				table=self._stage_metrics_table,
+				row=self._stage_metrics_row(experiment_id, run_id, metrics),
+			))
+			return
+		conn = self._stage_metrics_connection(db)
+		if conn is None:
+			return
+		row = self._stage_metrics_row(experiment_id, run_id, metrics)
+		with conn:
+			conn.execute(
+				f"INSERT OR REPLACE INTO {self._stage_metrics_table} VALUES (?,?,?,?)",
+				row,
+			)
+
+	def read_stage_metrics(self, experiment_ids=None, db=None):
+		"""
+		Read the stage metrics recorded for experiments.
+
+		The metrics stored in the database are read first, and then
+		those in the experiment archives, for any runs not in the
+		database.
+
+		Args:
+			experiment_ids (Collection[int] or pandas.DataFrame, optional):
+				The experiments to read, or a design whose index gives
+				the experiment ids.  Defaults to every experiment in
+				this scope.
+			db (SQLiteDB, optional): The database to read from.
+				Defaults to the database of this model.
+
+		Returns:
+			pandas.DataFrame:
+				One row for each stage of each run, with the experiment
+				id, run id and stage name, and the metrics as columns.
+				Times are in seconds and memory in megabytes.
+		"""
+		import glob
+		if isinstance(experiment_ids, pd.DataFrame):
+			experiment_ids = experiment_ids.index
+		if experiment_ids is not None:
+			experiment_ids = set(int(i) for i in experiment_ids)
+		records = {}
+		if db is None:
+			db = getattr(self, 'db', None)
+		if isinstance(db, SQLiteDB):
+			try:
+				stored = db.conn.execute(
+					f"SELECT experiment_id, run_id, metrics FROM {self._stage_metrics_table} "
+					"WHERE scope_name = ?",
+					(self.scope.name,),
+				).fetchall()
+			except sqlite3.OperationalError:
+				# No stage metrics have been stored in this database.
+				stored = []
+			for experiment_id, run_id, metrics in stored:
+				records[(experiment_id, run_id)] = dict(
+					experiment_id=experiment_id, run_id=run_id, stages=json.loads(metrics),
+				)
+		pattern = os.path.join(
+			self.resolved_archive_path,
+			f"scp_{self.scope.name}",
+			"exp_*",
+			self._stage_metrics_filename,
+		)
+		for filename in sorted(glob.glob(pattern)):
+			with open(filename, 'rt') as f:
+				record = json.load(f)
+			records.setdefault((record['experiment_id'], record['run_id']), record)
+		rows = []
+		for record in records.values():
+			if experiment_ids is not None and record['experiment_id'] not in experiment_ids:
+				continue
+			for stage, metrics in record['stages'].items():
+				metrics = dict(metrics)
+				# Archives written before the name made clear that this
+				# is the peak of the process so far.
+				if 'max_rss_mb' in metrics:
+					metrics['running_peak_rss_mb'] = metrics.pop('max_rss_mb')
+				rows.append(dict(
+					experiment_id=record['experiment_id'],
+					run_id=record['run_id'],
+					stage=stage,
+					**metrics,
+				))
+		return pd.DataFrame(rows)
+
+	def stage_metrics_summary(self, experiment_ids=None):
+		"""
+		Summarize the stage metrics recorded across experiments.
+
+		Args:
+			experiment_ids (Collection[int] or pandas.DataFrame, optional):
+				The experiments to summarize, or a design whose index
+				gives the experiment ids.  Defaults to every archived
+				experiment in this scope.
+
+		Returns:
+			pandas.DataFrame:
+				For each stage (rows), the number of runs and the mean,
+				median, maximum and total wall time, the mean CPU time,
+				the largest running peak memory of this process, and
+				the mean CPU time and largest peak memory of the R
+				process where recorded.
+		"""
+		metrics = self.read_stage_metrics(experiment_ids)
+		if metrics.empty:
+			return pd.DataFrame()
+		for column in ('cpu', 'running_peak_rss_mb', 'child_cpu', 'child_max_rss_mb'):
+			if column not in metrics:
+				metrics[column] = np.nan
+		grouped = metrics.groupby('stage', sort=False)
+		summary = pd.DataFrame({
+			'runs': grouped['wall'].count(),
+			'wall_mean': grouped['wall'].mean(),
+			'wall_median': grouped['wall'].median(),
+			'wall_max': grouped['wall'].max(),
+			'wall_total': grouped['wall'].sum(),
+			'cpu_mean': grouped['cpu'].mean(),
+			'running_peak_rss_mb': grouped['running_peak_rss_mb'].max(),
+			'child_cpu_mean': grouped['child_cpu'].mean(),
+			'child_max_rss_mb': grouped['child_max_rss_mb'].max(),
+		})
+		return summary.dropna(axis=1, how='all')
+
+	def _archive_outputs(self, model_results_path):
+		"""
+		Copy model outputs to an archive location, in the `archive_format`.
+		"""
+		if self.archive_format == 'blobs':
+			_logger.info(
+				f"VERSPM ARCHIVE\n"
+				f" from: {join_norm(self.local_directory, self.model_path, self.rel_output_path)}\n"
+				f"   to: {self.blob_store_path}"
+			)
+			archive_output_blobs(
+				join_norm(self.local_directory, self.model_path, self.rel_output_path),
+				model_results_path,
+				self.blob_store_path,
+				self.rel_output_path,
+			)
+			return
+		if self.archive_format == 'parquet':
+			archive_output_path = join_norm(model_results_path, self.rel_output_path)
+			_logger.info(
+				f"VERSPM ARCHIVE\n"
+				f" from: {join_norm(self.local_directory, self.model_path, self.rel_output_path)}\n"
+				f"   to: {archive_output_path}"
+			)
+			archive_output_tables(
+				join_norm(self.local_directory, self.model_path, self.rel_output_path),
+				archive_output_path,
+			)
+			return
 		zipname = os.path.join(model_results_path, 'run_archive')
 		_logger.info(
 			f"VERSPM ARCHIVE\n"
@@ -724,3 +5420,120 @@ class VERSPModel(FilesCoreModel):
 			base_dir=self.rel_output_path,
 		)
 
+
+def pick_batch(value, candidates, existing, batch_size):
+	"""
+	Pick a batch of candidate experiments with high value and spread.
+
+	Candidates are picked one at a time, each maximizing its value
+	times its distance to the nearest experiment already run or
+	picked, so the batch does not pile up in the single region of
+	the input space where the value is highest.
+
+	Args:
+		value (array-like): The value of running each candidate,
+			e.g. the uncertainty of the metamodel.
+		candidates (array-like): The (numeric) inputs of the candidates.
+		existing (array-like): The (numeric) inputs of the experiments
+			already run.
+		batch_size (int): The number of candidates to pick.
+
+	Returns:
+		List[int]: The positions of the picked candidates.
+	"""
+	candidates = np.asarray(candidates, dtype=float)
+	existing = np.asarray(existing, dtype=float)
+	value = np.asarray(value, dtype=float)
+	lo = np.minimum(candidates.min(axis=0), existing.min(axis=0))
+	span = np.maximum(candidates.max(axis=0), existing.max(axis=0)) - lo
+	span[span == 0] = 1
+	candidates = (candidates - lo) / span
+	existing = (existing - lo) / span
+	distance = np.full(len(candidates), np.inf)
+	for chunk in np.array_split(existing, max(len(existing) // 256, 1)):
+		distance = np.minimum(
+			distance,
+			np.sqrt(((candidates[:, None, :] - chunk[None, :, :]) ** 2).sum(axis=2)).min(axis=1),
+		)
+	picks = []
+	for _ in range(min(batch_size, len(candidates))):
+		score = np.where(np.isfinite(value), value, 0) * distance
+		score[picks] = -np.inf
+		pick = int(np.argmax(score))
+		picks.append(pick)
+		distance = np.minimum(distance, np.sqrt(((candidates - candidates[pick]) ** 2).sum(axis=1)))
+	return picks
+
+
+def _adaptive_kernel(n_features):
+	"""An anisotropic RBF kernel, with a little noise to keep the fit smooth."""
+	from sklearn.gaussian_process.kernels import RBF, ConstantKernel, WhiteKernel
+	return ConstantKernel() * RBF([1.0] * n_features) + WhiteKernel(1e-4, (1e-8, 1e-1))
+
+
+def adaptive_regressor(random_state=None, n_restarts_optimizer=5):
+	"""
+	Create the metamodel regressor used for adaptive sampling.
+
+	This has the same structure as the default TMIP-EMAT regressor, a
+	linear regression with a Gaussian process regression fit to its
+	residuals, but the Gaussian process stage normalizes the residuals
+	itself, so that its predictive standard deviation (the uncertainty
+	of the metamodel) is reported in the units of each measure.
+
+	Args:
+		random_state (int, optional): The random state for the
+			Gaussian process optimizer.
+		n_restarts_optimizer (int, default 5): The number of restarts
+			of the optimizer of the kernel parameters.
+
+	Returns:
+		emat.learn.boosting.BoostedRegressor
+	"""
+	from sklearn.linear_model import LinearRegression
+	from emat.learn.boosting import BoostedRegressor
+	from emat.learn.multioutput import MultiOutputRegressor
+	from emat.learn.anisotropic import AnisotropicGaussianProcessRegressor
+	return BoostedRegressor([
+		('lr', LinearRegression()),
+		('gpr', MultiOutputRegressor(AnisotropicGaussianProcessRegressor(
+			kernel_generator=_adaptive_kernel,
+			normalize_y=True,
+			standardize_before_fit=False,
+			n_restarts_optimizer=n_restarts_optimizer,
+			random_state=random_state,
+		))),
+	])
+
+
+def metamodel_uncertainty(metamodel, experiments):
+	"""
+	Get the predictive standard deviation of a metamodel.
+
+	Args:
+		metamodel (emat.MetaModel or emat.PythonCoreModel): A metamodel
+			fit with a Gaussian process regression (as the last stage,
+			if it is a `BoostedRegressor`).
+		experiments (pandas.DataFrame): The parameters of the
+			experiments to evaluate.
+
+	Returns:
+		pandas.DataFrame:
+			The standard deviation of each measure (as transformed for
+			the regression, see the `metamodeltype` of each measure in
+			the scope) for each experiment.
+	"""
+	metamodel = getattr(metamodel, 'function', metamodel)
+	X = metamodel.preprocess_raw_input(experiments, to_type=np.float64)
+	regression = metamodel.regression
+	if hasattr(regression, 'estimators_') and hasattr(regression, 'estimator_names'):
+		regression = regression.estimators_[-1]
+	columns = list(metamodel.output_sample.columns)
+	if hasattr(regression, 'estimators_'):
+		std = np.column_stack([
+			np.ravel(e.predict(X, return_std=True)[1])
+			for e in regression.estimators_
+		])
+	else:
+		std = np.asarray(regression.predict(X, return_std=True)[1]).reshape(len(experiments), -1)
+	return pd.DataFrame(std, index=experiments.index, columns=columns)
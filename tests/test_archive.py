@@ -0,0 +1,117 @@
+"""
+Tests of the experiment archives of `emat_verspm`.
+"""
+
+import importlib
+import os
+import sys
+import uuid
+
+import pytest
+
+pytest.importorskip('emat')
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import emat_verspm
+
+
+@pytest.fixture
+def model(tmp_path):
+	m = emat_verspm.VERSPModel(db=False)
+	m.archive_path = str(tmp_path / 'archive')
+	yield m
+	m.master_directory.cleanup()
+
+
+def _archive_dir(model, experiment_id):
+	path = os.path.join(
+		model.resolved_archive_path,
+		f"scp_{model.scope.name}",
+		f"exp_{experiment_id}_{uuid.uuid1()}",
+	)
+	os.makedirs(os.path.join(path, model.rel_output_path))
+	return path
+
+
+def test_reprocess_raises_for_unarchived_outputs(model):
+	archive = _archive_dir(model, 1)
+	with pytest.warns(UserWarning, match='unavailable'):
+		assert model.measures_from_archive(archive) == {}
+	with pytest.raises(emat_verspm.UnarchivedOutputError) as caught:
+		model.reprocess_archives(db=False)
+	assert caught.value.measure_names
+	assert 'of experiment 1' in str(caught.value)
+
+
+def _outputs(path):
+	os.makedirs(os.path.join(path, 'queries'))
+	with open(os.path.join(path, 'queries', 'Marea.csv'), 'wt') as f:
+		f.write("Measure,Value\nDvmtPerCapita,23.5\n")
+	with open(os.path.join(path, 'ComputedMeasures.json'), 'wt') as f:
+		f.write('{"TransitTrips": 12.5}')
+	return path
+
+
+def test_parquet_archive_files_rearchive(tmp_path):
+	outputs = _outputs(str(tmp_path / 'output'))
+	archive = str(tmp_path / 'archive' / 'output')
+	for _ in range(2):
+		manifest = emat_verspm.archive_output_tables(outputs, archive)
+	assert manifest == dict(tables={}, files=['ComputedMeasures.json', 'queries/'])
+	with emat_verspm.ArchivedOutputs(str(tmp_path / 'archive')) as archived:
+		assert archived.read_text('queries/Marea.csv') == "Measure,Value\nDvmtPerCapita,23.5\n"
+		assert archived.read_text('ComputedMeasures.json') == '{"TransitTrips": 12.5}'
+
+
+def test_parquet_archive_tables_round_trip(tmp_path):
+	try:
+		importlib.import_module('pyarrow.parquet')
+	except ImportError as err:
+		pytest.skip(f"pyarrow unavailable: {err}")
+	outputs = _outputs(str(tmp_path / 'output'))
+	with open(os.path.join(outputs, 'Marea_2038_1.csv'), 'wt') as f:
+		f.write("Marea,UrbanHhDvmt,TownHhDvmt\nRVMPO,1250000.5,7.25\nNone,0,0\n")
+	archive = str(tmp_path / 'archive' / 'output')
+	manifest = emat_verspm.archive_output_tables(outputs, archive)
+	assert manifest['tables']['Marea_2038_1']['rows'] == 2
+	assert not os.path.exists(os.path.join(archive, 'Marea_2038_1.csv'))
+	columns = {'Marea': 'str', 'UrbanHhDvmt': 'float64'}
+	expected = emat_verspm.read_output_table(os.path.join(outputs, 'Marea_2038_1.csv'), columns)
+	with emat_verspm.ArchivedOutputs(str(tmp_path / 'archive')) as archived:
+		table = archived.read_table('Marea_2038_1.csv', columns)
+	assert table.equals(expected)
+
+
+def test_blob_archive_round_trip(tmp_path):
+	outputs = _outputs(str(tmp_path / 'output'))
+	with open(os.path.join(outputs, 'Marea_2038_1.csv'), 'wt') as f:
+		f.write("Marea,UrbanHhDvmt,TownHhDvmt\nRVMPO,1250000.5,7.25\n")
+	store = str(tmp_path / 'archive' / 'blobs')
+	first = str(tmp_path / 'archive' / 'exp_1')
+	second = str(tmp_path / 'archive' / 'exp_2')
+	manifest = emat_verspm.archive_output_blobs(outputs, first, store)
+	assert sorted(manifest['files']) == [
+		'output/ComputedMeasures.json', 'output/Marea_2038_1.csv', 'output/queries/Marea.csv',
+	]
+	n_blobs = sum(len(files) for _, _, files in os.walk(store))
+	assert n_blobs == 3
+
+	# A second run with one changed file adds only one blob.
+	with open(os.path.join(outputs, 'ComputedMeasures.json'), 'wt') as f:
+		f.write('{"TransitTrips": 13.0}')
+	emat_verspm.archive_output_blobs(outputs, second, store)
+	assert sum(len(files) for _, _, files in os.walk(store)) == n_blobs + 1
+
+	with emat_verspm.ArchivedOutputs(first) as archived:
+		assert archived.read_text('ComputedMeasures.json') == '{"TransitTrips": 12.5}'
+		table = archived.read_table('Marea_2038_1.csv', {'Marea': 'str', 'UrbanHhDvmt': 'float64'})
+	assert list(table.columns) == ['Marea', 'UrbanHhDvmt']
+	assert table.loc[0, 'UrbanHhDvmt'] == 1250000.5
+	with emat_verspm.ArchivedOutputs(second) as archived:
+		assert archived.read_text('ComputedMeasures.json') == '{"TransitTrips": 13.0}'
+		with pytest.raises(FileNotFoundError):
+			archived.read_text('Missing.csv')
+		restored = archived.restore(str(tmp_path / 'restored'))
+	with open(os.path.join(restored, 'queries', 'Marea.csv'), 'rt') as f:
+		assert f.read() == "Measure,Value\nDvmtPerCapita,23.5\n"
@@ -0,0 +1,89 @@
+"""
+Tests of the experiment journal of `emat_verspm.VERSPModel`.
+"""
+
+import os
+import sys
+import uuid
+
+import pytest
+
+pytest.importorskip('emat')
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import emat_verspm
+from emat import SQLiteDB
+
+
+@pytest.fixture
+def model(tmp_path):
+	db = SQLiteDB(str(tmp_path / 'journal.db'), initialize=True)
+	m = emat_verspm.VERSPModel(db=db)
+	m.archive_path = str(tmp_path / 'archive')
+	m.memoize = False
+	yield m
+	m.master_directory.cleanup()
+
+
+def _design(model, n=2):
+	return model.design_experiments(n_samples=n, random_seed=0, design_name='journal')
+
+
+def test_setup_failure_is_quarantined(model, monkeypatch):
+	def broken(params):
+		raise OSError("cannot stage inputs")
+	monkeypatch.setattr(model, '_stage_inputs', broken)
+	design = _design(model)
+	model.run_experiments(design)
+	states = model.journal_states()
+	assert list(states.loc[design.index, 'status']) == ['quarantined'] * len(design)
+	assert (states.loc[design.index, 'attempts'] == 0).all()
+
+
+def test_setup_failure_in_local_pool_is_quarantined(model, monkeypatch):
+	def broken(self, params):
+		raise OSError("cannot stage inputs")
+	monkeypatch.setattr(emat_verspm.VERSPModel, '_stage_inputs', broken)
+	design = _design(model, 3)
+	result = model.run_experiments(design, n_workers=2, executor='thread')
+	assert len(result) == len(design)
+	states = model.journal_states()
+	assert list(states.loc[design.index, 'status']) == ['quarantined'] * len(design)
+	# The run ids are allocated by the parent, one for each experiment.
+	run_ids = states.loc[design.index, 'run_id']
+	assert run_ids.notna().all() and not run_ids.isin(['None']).any()
+	assert run_ids.nunique() == len(design)
+
+
+def test_invalid_inputs_are_quarantined(model, monkeypatch):
+	def invalid():
+		raise emat_verspm.InputValidationError(["inputs/bzone_parking.csv: PkgCost is not finite"])
+	monkeypatch.setattr(model, 'preflight_inputs', invalid)
+	design = _design(model)
+	model.run_experiments(design)
+	states = model.journal_states()
+	assert list(states.loc[design.index, 'status']) == ['quarantined'] * len(design)
+	assert states.loc[design.index, 'error'].str.contains('problems in staged inputs').all()
+
+
+def test_sink_retries_and_journals_after_commit(model, monkeypatch):
+	design = _design(model)
+	experiment_id = int(design.index[0])
+	write = SQLiteDB.write_experiment_measures
+	calls = []
+	def flaky(self, *args, **kwargs):
+		calls.append(args)
+		if len(calls) == 1:
+			raise RuntimeError("database is locked")
+		return write(self, *args, **kwargs)
+	monkeypatch.setattr(SQLiteDB, 'write_experiment_measures', flaky)
+	sink = emat_verspm.ResultSink(model.db.database_path, model.scope.name, flush_seconds=0.05)
+	measures = {name: 1.0 for name in model.scope.get_measure_names()}
+	with sink:
+		sink.put(model._result_records(experiment_id, str(uuid.uuid1()), {}, measures, None))
+	assert sink.n_failed == 0
+	assert len(calls) == 2
+	stored = model.db.read_experiment_measures(model.scope.name)
+	assert experiment_id in stored.index.get_level_values('experiment')
+	assert model.journal_states().loc[experiment_id, 'status'] == 'complete'
@@ -0,0 +1,101 @@
+"""
+Tests of the compiled measure parsers of `emat_verspm`.
+
+The compiled parsers are compared with the emat parsers they replace,
+which read each file with pandas and look up every measure in it.
+"""
+
+import os
+import sys
+import json
+
+import numpy as np
+import pytest
+
+pytest.importorskip('emat')
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import emat_verspm
+from emat.model.core_files.parsers import TableParser, MappingParser, loc, key
+
+
+@pytest.fixture
+def model():
+	m = emat_verspm.VERSPModel(db=False)
+	yield m
+	m.master_directory.cleanup()
+
+
+def _parser(model, cls):
+	return next(parser for parser in model._parsers if isinstance(parser, cls))
+
+
+def _query_table(parser):
+	"""Write query results with a row for each row a measure reads."""
+	rows = sorted({
+		row
+		for terms in parser.compiled.values() if terms is not None
+		for _, row, _ in terms
+	})
+	rng = np.random.default_rng(0)
+	lines = ['Measure,2010,2038,Units,Description']
+	for row in rows:
+		v2010, v2038 = rng.uniform(-1e6, 1e6, size=2)
+		lines.append(f'{row},{v2010!r},{v2038!r},units,"{row}, synthetic"')
+	return '\n'.join(lines) + '\n'
+
+
+def test_compile_getter():
+	assert emat_verspm.compile_getter(loc['A', '2010']) == [(1.0, 'A', '2010')]
+	assert emat_verspm.compile_getter(loc['A', '2010'] - loc['B', '2038']) == [
+		(1.0, 'A', '2010'), (-1.0, 'B', '2038'),
+	]
+	assert emat_verspm.compile_getter(loc['A', :]) is None
+	assert emat_verspm.compile_getter(key['A']) is None
+
+
+def test_indexed_table():
+	table = emat_verspm.IndexedTable(
+		'Measure,2010,2038\nA,1.5,NA\n"B, quoted",-2,3e2\nA,9,9\nC,,x\n',
+		index_col=0,
+	)
+	assert table.value('B, quoted', '2038') == 300.0
+	assert np.isnan(table.value('C', '2010'))
+	with pytest.raises(KeyError):
+		table.value('A', '2010')
+	with pytest.raises(KeyError):
+		table.value('D', '2010')
+	with pytest.raises(ValueError):
+		table.value('C', '2038')
+	assert list(table.frame.index) == ['A', 'B, quoted', 'A', 'C']
+
+
+def test_table_parser_matches_emat(model, tmp_path):
+	parser = _parser(model, emat_verspm.CompiledTableParser)
+	assert parser.measure_getters
+	assert all(terms is not None for terms in parser.compiled.values())
+	with open(tmp_path / parser.filename, 'wt') as f:
+		f.write(_query_table(parser))
+	expected = TableParser(parser.filename, parser.measure_getters, index_col=0).read(str(tmp_path))
+	assert parser.read(str(tmp_path)) == pytest.approx(expected, rel=1e-12)
+	names = sorted(parser.measure_getters)[:3]
+	assert parser.read(str(tmp_path), names) == pytest.approx(
+		{name: expected[name] for name in names}, rel=1e-12,
+	)
+
+
+def test_mapping_parser_matches_emat(model, tmp_path):
+	parser = _parser(model, emat_verspm.CompiledMappingParser)
+	assert parser.measure_getters
+	rng = np.random.default_rng(0)
+	measures = {
+		measure.parser['key']: float(rng.uniform(0, 1e3))
+		for measure in model.scope.get_measures()
+		if measure.parser and measure.parser.get('file') == parser.filename
+	}
+	with open(tmp_path / parser.filename, 'wt') as f:
+		json.dump(measures, f)
+	expected = MappingParser(parser.filename, parser.measure_getters).read(str(tmp_path))
+	assert parser.read(str(tmp_path)) == expected
+	assert parser.parse(measures) == expected
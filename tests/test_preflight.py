@@ -0,0 +1,111 @@
+"""
+Tests of the checks of staged input files in `emat_verspm`.
+"""
+
+import os
+import sys
+
+import pytest
+
+pytest.importorskip('emat')
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import emat_verspm
+
+
+REFERENCE = (
+	b"Geo,Year,BusPropIcev,BusPropHev,BusPropBev,BusFare\n"
+	b"RVMPO,2010,1,0,0,1.5\n"
+	b"RVMPO,2038,0.5,0.25,0.25,2.0\n"
+)
+
+GEO = {'Marea': {'RVMPO'}}
+
+
+@pytest.fixture
+def schema():
+	return emat_verspm.input_schema(REFERENCE)
+
+
+def test_schema_from_reference(schema):
+	assert schema['columns'] == ['Geo', 'Year', 'BusPropIcev', 'BusPropHev', 'BusPropBev', 'BusFare']
+	assert schema['years'] == ['2010', '2038']
+	assert schema['proportions'] == ['BusPropIcev', 'BusPropHev', 'BusPropBev']
+	assert schema['sum_groups'] == [['BusPropIcev', 'BusPropHev', 'BusPropBev']]
+	assert 'BusFare' in schema['nonnegative']
+
+
+def test_reference_passes(schema):
+	assert emat_verspm.validate_input('marea_bus.csv', REFERENCE, schema, GEO) == []
+
+
+def test_out_of_range_proportion(schema):
+	content = REFERENCE.replace(b"0.5,0.25,0.25", b"1.5,-0.25,-0.25")
+	problems = emat_verspm.validate_input('marea_bus.csv', content, schema, GEO)
+	assert any("proportion BusPropIcev outside 0 to 1" in p for p in problems)
+
+
+def test_proportions_not_summing_to_one(schema):
+	content = REFERENCE.replace(b"0.5,0.25,0.25", b"0.5,0.25,0.5")
+	problems = emat_verspm.validate_input('marea_bus.csv', content, schema, GEO)
+	assert problems == [
+		"marea_bus.csv: BusPropIcev + BusPropHev + BusPropBev sums to 1.250000, not 1, in rows [1]"
+	]
+
+
+def test_negative_and_non_finite_values(schema):
+	content = REFERENCE.replace(b"1.5\n", b"-1.5\n").replace(b"2.0\n", b"inf\n")
+	problems = emat_verspm.validate_input('marea_bus.csv', content, schema, GEO)
+	assert problems == ["marea_bus.csv: missing or non-finite BusFare in rows [1]"]
+	content = REFERENCE.replace(b"1.5\n", b"-1.5\n")
+	problems = emat_verspm.validate_input('marea_bus.csv', content, schema, GEO)
+	assert problems == ["marea_bus.csv: negative BusFare = -1.5"]
+
+
+def test_bad_header(schema):
+	content = REFERENCE.replace(b"BusPropHev", b"BusPropHEV")
+	problems = emat_verspm.validate_input('marea_bus.csv', content, schema, GEO)
+	assert "marea_bus.csv: missing columns ['BusPropHev']" in problems
+
+
+def test_zones_and_years(schema):
+	content = REFERENCE.replace(b"RVMPO,2038", b"Elsewhere,2039")
+	problems = emat_verspm.validate_input('marea_bus.csv', content, schema, GEO)
+	assert "marea_bus.csv: years ['2010', '2039'], expected ['2010', '2038']" in problems
+	assert "marea_bus.csv: Geo not in the Mareas of defs/geo.csv: ['Elsewhere']" in problems
+
+
+@pytest.fixture
+def model():
+	m = emat_verspm.VERSPModel(db=False)
+	yield m
+	m.master_directory.cleanup()
+
+
+def test_preflight_passes_base_inputs(model):
+	model.preflight_inputs()
+
+
+def test_preflight_missing_file(model):
+	model_path = emat_verspm.join_norm(model.local_directory, model.model_path)
+	relative = 'inputs/marea_transit_powertrain_prop.csv'
+	assert relative in model._staged_filenames()
+	os.remove(os.path.join(model_path, relative))
+	with pytest.raises(emat_verspm.InputValidationError) as caught:
+		model.preflight_inputs()
+	assert caught.value.problems == [f"{relative}: missing"]
+
+
+def test_preflight_out_of_range_file(model):
+	model_path = emat_verspm.join_norm(model.local_directory, model.model_path)
+	relative = 'inputs/marea_transit_powertrain_prop.csv'
+	filename = os.path.join(model_path, relative)
+	with open(filename, 'rb') as f:
+		content = f.read()
+	os.remove(filename)
+	with open(filename, 'wb') as f:
+		f.write(content.replace(b"RVMPO,2038,1,0,0", b"RVMPO,2038,2,0,0"))
+	with pytest.raises(emat_verspm.InputValidationError) as caught:
+		model.preflight_inputs()
+	assert any("VanPropIcev outside 0 to 1" in p for p in caught.value.problems)
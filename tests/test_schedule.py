@@ -0,0 +1,64 @@
+"""
+Tests of the ordering of experiments by `schedule_experiments`.
+"""
+
+import os
+import sys
+
+import pytest
+
+pytest.importorskip('emat')
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import emat_verspm
+
+
+EXPERIMENTS = {
+	1: dict(LandUse='growth', TechMix=0.2, Income=5),
+	2: dict(LandUse='base', TechMix=0.5, Income=6),
+	3: dict(LandUse='growth', TechMix=0.5, Income=7),
+	4: dict(LandUse='base', TechMix=0.2, Income=5),
+	5: dict(LandUse='growth', TechMix=0.2, Income=6),
+}
+
+
+def test_groups_with_fewest_values_first():
+	groups = [('Income',), ('TechMix',), ('LandUse',), ('Transit',)]
+	assert emat_verspm.schedule_experiments(EXPERIMENTS, groups) == [[4, 1, 5, 2, 3]]
+
+
+def test_blocks():
+	groups = [('Income',), ('TechMix',), ('LandUse',)]
+	assert emat_verspm.schedule_experiments(EXPERIMENTS, groups, 2) == [[4, 1], [5, 2, 3]]
+	blocks = emat_verspm.schedule_experiments(EXPERIMENTS, groups, 10)
+	assert blocks == [[4], [1], [5], [2], [3]]
+	assert emat_verspm.schedule_experiments({}, groups, 2) == []
+	assert emat_verspm.schedule_experiments(EXPERIMENTS, [], 1) == [[1, 2, 3, 4, 5]]
+
+
+def _changes(model, order, experiments):
+	"""Count the input groups staged again when running in this order."""
+	n = 0
+	for previous, current in zip(order[:-1], order[1:]):
+		for _, _, param_names, _ in model._input_groups:
+			if any(experiments[previous][p] != experiments[current][p] for p in param_names):
+				n += 1
+	return n
+
+
+def test_schedule_reduces_restaging():
+	model = emat_verspm.VERSPModel(db=False)
+	try:
+		design = model.design_experiments(n_samples=40, random_seed=0)
+		experiments = {
+			experiment_id: row.to_dict()
+			for experiment_id, row in design.iterrows()
+		}
+		blocks = model.schedule(experiments, 4)
+		assert len(blocks) == 4
+		order = [experiment_id for block in blocks for experiment_id in block]
+		assert sorted(order) == sorted(experiments)
+		assert _changes(model, order, experiments) < _changes(model, list(experiments), experiments)
+	finally:
+		model.master_directory.cleanup()
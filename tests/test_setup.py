@@ -0,0 +1,190 @@
+"""
+Tests of the staging of scenario inputs by `VERSPModel.setup`.
+
+The staged files are compared byte for byte with the files written by
+the original `_manipulate_*` methods, which re-read and re-blended the
+scenario inputs for every experiment.
+"""
+
+import os
+import sys
+import shutil
+import json
+
+import numpy as np
+import pytest
+
+pd = pytest.importorskip('pandas')
+pytest.importorskip('emat')
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import emat_verspm
+from emat_verspm import scenario_input
+
+
+def _original_inputs(params, directory):
+	"""
+	Write the input files as the original `_manipulate_*` methods did.
+
+	Returns:
+		List[str]: The paths of the files written, relative to `directory`.
+	"""
+	os.makedirs(os.path.join(directory, 'inputs'), exist_ok=True)
+	os.makedirs(os.path.join(directory, 'defs'), exist_ok=True)
+	written = []
+
+	shutil.copyfile(
+		os.path.join(emat_verspm.this_directory, 'VERSPM', 'defs', 'model_parameters.json'),
+		os.path.join(directory, 'defs', 'model_parameters.json'),
+	)
+	with open(os.path.join(directory, 'defs', 'model_parameters.json'), 'rt') as f:
+		y = json.load(f)
+	y[0]['VALUE'] = str(params['ValueOfTime'])
+	with open(os.path.join(directory, 'defs', 'model_parameters.json'), 'wt') as f:
+		json.dump(y, f)
+	written.append('defs/model_parameters.json')
+
+	templates = [
+		('I', 'azone_per_cap_inc.csv', {
+			'HHIncomePC': str(int(params['Income'])),
+			'GQIncomePC': str(int(params['Income']*3/13)),
+		}),
+		('B', 'azone_prop_sov_dvmt_diverted.csv', {
+			'BikeDiversion': f"{params['Bicycles']:.3f}",
+		}),
+		('T', 'marea_transit_service.csv', {
+			'DRRevMi': f"{params['Transit'] * 2381994.664:.3f}",
+			'MBRevMi': f"{params['Transit'] * 3580237.203:.3f}",
+		}),
+		('G', 'azone_fuel_power_cost.csv', {
+			'FuelCost': f"{params['FuelCost']:.3f}",
+			'ElectricCost': f"{params['ElectricCost']:.3f}",
+		}),
+	]
+	for ve_scenario_dir, filename, computed_params in templates:
+		with open(scenario_input(ve_scenario_dir, filename + '.template'), 'rt') as f:
+			y = f.read()
+		for n, value in computed_params.items():
+			y = y.replace(f"__EMAT_PROVIDES_{n}__", value)
+		with open(os.path.join(directory, 'inputs', filename), 'wt') as f:
+			f.write(y)
+		written.append(f'inputs/{filename}')
+
+	categorical = [
+		('LandUse', 'L', {'base': '1', 'growth': '2'}),
+		('VehicleTravelCost', 'C', {
+			'base': '1',
+			'steady ownership cost': '2',
+			'pay-per-mile insurance and higher cost': '3',
+		}),
+	]
+	for cat_param, ve_scenario_dir, cat_mapping in categorical:
+		scenario_dir = cat_mapping[params[cat_param]]
+		for i in os.scandir(scenario_input(ve_scenario_dir, scenario_dir)):
+			if i.is_file():
+				shutil.copyfile(i.path, os.path.join(directory, 'inputs', i.name))
+				written.append(f'inputs/{i.name}')
+
+	mixtures = [
+		('TechMix', 'F'),
+		('Parking', 'P'),
+		('DemandManagement', 'D'),
+		('VehicleCharacteristics', 'V'),
+		('DrivingEfficiency', 'E'),
+	]
+	for weight_param, ve_scenario_dir in mixtures:
+		weight_2 = params[weight_param]
+		weight_1 = 1.0-weight_2
+		for i in os.scandir(scenario_input(ve_scenario_dir, '1')):
+			if not i.is_file():
+				continue
+			df1 = pd.read_csv(scenario_input(ve_scenario_dir, '1', i.name))
+			df2 = pd.read_csv(scenario_input(ve_scenario_dir, '2', i.name))
+			float_mix_cols = [j for j in df1.select_dtypes('float').columns if j not in ('Year', 'Geo')]
+			if float_mix_cols:
+				df1[float_mix_cols] = df1[float_mix_cols] * weight_1 + df2[float_mix_cols] * weight_2
+			int_mix_cols = [j for j in df1.select_dtypes('int').columns if j not in ('Year', 'Geo')]
+			if int_mix_cols:
+				df_int_mix = df1[int_mix_cols] * weight_1 + df2[int_mix_cols] * weight_2
+				df1[int_mix_cols] = np.round(df_int_mix).astype(int)
+			df1.to_csv(os.path.join(directory, 'inputs', i.name), index=False, float_format="%.5f")
+			written.append(f'inputs/{i.name}')
+	return written
+
+
+def _assert_same_files(expected_directory, actual_directory, filenames):
+	for filename in filenames:
+		with open(os.path.join(expected_directory, filename), 'rb') as f:
+			expected = f.read()
+		with open(os.path.join(actual_directory, filename), 'rb') as f:
+			actual = f.read()
+		assert actual == expected, filename
+
+
+@pytest.fixture
+def model():
+	m = emat_verspm.VERSPModel(db=False)
+	yield m
+	m.master_directory.cleanup()
+
+
+@pytest.fixture
+def design(model):
+	return model.design_experiments(n_samples=4, random_seed=0)
+
+
+def test_staged_inputs_match_original(model, design, tmp_path):
+	for experiment_id, row in design.iterrows():
+		params = row.to_dict()
+		model.setup(dict(params))
+		expected = str(tmp_path / f'exp_{experiment_id}')
+		filenames = _original_inputs(params, expected)
+		_assert_same_files(expected, model.resolved_model_path, filenames)
+
+
+
+def test_staging_ledger_skips_unchanged_groups(model, design):
+	params = design.iloc[0].to_dict()
+	all_groups = [group for group, *_ in model._input_groups]
+	assert model._stage_inputs(dict(params)) == all_groups
+	assert model._stage_inputs(dict(params)) == []
+	params['Income'] += 1000
+	params['TechMix'] = 0.5
+	assert model._stage_inputs(dict(params)) == ['Income', 'TechMix']
+
+
+def test_staging_ledger_restages_touched_files(model, design):
+	params = design.iloc[0].to_dict()
+	model._stage_inputs(dict(params))
+	filename = os.path.join(model.resolved_model_path, 'inputs', 'azone_per_cap_inc.csv')
+	with open(filename, 'rb') as f:
+		content = f.read()
+	with open(filename, 'ab') as f:
+		f.write(b"\n")
+	assert model._stage_inputs(dict(params)) == ['Income']
+	with open(filename, 'rb') as f:
+		assert f.read() == content
+	model.incremental_setup = False
+	assert len(model._stage_inputs(dict(params))) == len(model._input_groups)
+
+
+def test_prepared_mixtures_match_original(model, design, tmp_path):
+	store = model.prepare_mixtures(design)
+	assert set(store.index) == {'F', 'P', 'D', 'V', 'E'}
+	for experiment_id, row in design.iterrows():
+		params = row.to_dict()
+		model.setup(dict(params))
+		expected = str(tmp_path / f'exp_{experiment_id}')
+		filenames = _original_inputs(params, expected)
+		_assert_same_files(expected, model.resolved_model_path, filenames)
+
+
+def test_render_many_matches_blend():
+	cache = emat_verspm.ScenarioInputCache()
+	weights = [0.0, 0.125, 1/3, 0.5, 0.987654321, 1.0]
+	for ve_scenario_dir in ('F', 'P', 'D', 'V', 'E'):
+		for pair in cache.mixture(ve_scenario_dir):
+			rendered = pair.render_many(weights)
+			for w, text in zip(weights, rendered):
+				assert text == pair.blend(w).to_csv(index=False, float_format="%.5f")
@@ -0,0 +1,726 @@
+"""
+The scenario inputs of the VERSPM model, and checks of staged inputs.
+
+The scenario input files are read once into a `ScenarioInputCache`,
+mixtures of them are blended (or pre-rendered for a whole design into
+a `MixtureStore`), and the input files staged for a run are checked
+against the base model inputs with `validate_input`.
+"""
+
+import os
+import re
+import io
+import json
+import hashlib
+import logging
+import collections
+import numpy as np
+import pandas as pd
+
+_logger = logging.getLogger("EMAT.VERSPM")
+
+# The scenario_inputs directory is located in the
+# same directory as this script file.
+this_directory = os.path.dirname(__file__)
+
+def scenario_input(*filename):
+	"""The path to a scenario_input file."""
+	return os.path.join(this_directory, 'scenario_inputs', *filename)
+
+def join_norm(*args):
+	"""Normalize joined paths."""
+	return os.path.normpath(os.path.join(*args))
+
+
+class MixturePair:
+	"""
+	A pre-parsed pair of scenario input files for a mixture lever.
+
+	The two variants of the file (from the "1" and "2" sub-directories)
+	are parsed once, and the columns to be mixed are split into float
+	and int NumPy blocks, so that creating a mixed file for any
+	particular weight requires only a weighted sum.
+
+	Args:
+		filename (str):
+			The name of the input file, which is the same in both
+			the "1" and "2" sub-directories.
+		df1, df2 (pandas.DataFrame):
+			The parsed content of the two variants.
+		no_mix_cols (Collection[str]):
+			Columns that are never mixed, e.g. 'Year' and 'Geo'.
+	"""
+
+	def __init__(self, filename, df1, df2, no_mix_cols=('Year', 'Geo',)):
+		if df1.shape != df2.shape:
+			raise ValueError(
+				f"mixture files for {filename} have different shapes, "
+				f"{df1.shape} and {df2.shape}"
+			)
+		self.filename = filename
+		self.frame = df1
+		self.float_cols = [
+			j for j in df1.select_dtypes('float').columns
+			if j not in no_mix_cols
+		]
+		self.int_cols = [
+			j for j in df1.select_dtypes('int').columns
+			if j not in no_mix_cols
+		]
+		self.float_1 = df1[self.float_cols].to_numpy(dtype=np.float64)
+		self.float_2 = df2[self.float_cols].to_numpy(dtype=np.float64)
+		self.int_1 = df1[self.int_cols].to_numpy()
+		self.int_2 = df2[self.int_cols].to_numpy()
+
+	def blend(self, weight_2):
+		"""
+		Create the mixed table for a particular weight.
+
+		Args:
+			weight_2 (float):
+				The weight on the "2" variant; the "1" variant gets
+				the complementary weight.
+
+		Returns:
+			pandas.DataFrame
+		"""
+		weight_1 = 1.0-weight_2
+		df = self.frame.copy()
+		if self.float_cols:
+			df[self.float_cols] = self.float_1 * weight_1 + self.float_2 * weight_2
+		if self.int_cols:
+			df_int_mix = self.int_1 * weight_1 + self.int_2 * weight_2
+			df[self.int_cols] = np.round(df_int_mix).astype(int)
+		return df
+
+	def blend_many(self, weights):
+		"""
+		Create the mixed values for many weights at once.
+
+		The arithmetic is the same as in `blend`, broadcast over all of
+		the weights, so the results (including the rounding of int
+		columns) are identical.
+
+		Args:
+			weights (array-like):
+				The weights on the "2" variant, one for each mixture.
+
+		Returns:
+			Tuple[numpy.ndarray, numpy.ndarray]:
+				The mixed float and int columns, each with shape
+				(len(weights), rows, columns).
+		"""
+		weight_2 = np.asarray(weights, dtype=np.float64)[:, None, None]
+		weight_1 = 1.0-weight_2
+		float_mix = self.float_1[None] * weight_1 + self.float_2[None] * weight_2
+		int_mix = np.round(self.int_1[None] * weight_1 + self.int_2[None] * weight_2).astype(int)
+		return float_mix, int_mix
+
+	def render_many(self, weights, float_format="%.5f"):
+		"""
+		Create the CSV text of the mixed table for many weights at once.
+
+		The text is the same as writing the result of `blend` for each
+		weight with `to_csv(index=False, float_format=float_format)`,
+		but all the values are formatted together with NumPy.  This is
+		checked against pandas for the first weight, and if the text is
+		not identical (e.g. for unusual column types), pandas is used
+		for every weight instead.
+
+		Args:
+			weights (array-like):
+				The weights on the "2" variant, one for each mixture.
+			float_format (str):
+				The format for float values.
+
+		Returns:
+			List[str]
+		"""
+		weights = list(weights)
+		if not weights:
+			return []
+		float_mix, int_mix = self.blend_many(weights)
+		n = len(weights)
+
+		def quoted(value):
+			value = str(value)
+			if any(c in value for c in ',"\r\n'):
+				value = '"' + value.replace('"', '""') + '"'
+			return value
+
+		# Build one format string for the whole table, with the text of
+		# the columns that are not mixed written in directly, so that each
+		# table is rendered with a single formatting operation.
+		mixed = []
+		row_formats = [[] for _ in range(len(self.frame))]
+		for col in self.frame.columns:
+			if col in self.float_cols:
+				mixed.append(float_mix[:, :, self.float_cols.index(col)])
+				for row_format in row_formats:
+					row_format.append(float_format)
+			elif col in self.int_cols:
+				# Rounded ints are exactly representable as floats.
+				mixed.append(int_mix[:, :, self.int_cols.index(col)].astype(np.float64))
+				for row_format in row_formats:
+					row_format.append('%d')
+			else:
+				series = self.frame[col]
+				for row_format, v in zip(row_formats, series):
+					if pd.isna(v):
+						text = ''
+					elif series.dtype.kind == 'f':
+						text = float_format % v
+					else:
+						text = quoted(v)
+					row_format.append(text.replace('%', '%%'))
+		table_format = ','.join(quoted(col) for col in self.frame.columns).replace('%', '%%') + '\n'
+		table_format += ''.join(','.join(row_format) + '\n' for row_format in row_formats)
+		if mixed:
+			values = np.stack(mixed, axis=-1).reshape(n, -1)
+		else:
+			values = np.empty((n, 0))
+		has_nan = np.isnan(values).any(axis=1)
+		rendered = []
+		for i in range(n):
+			if has_nan[i]:
+				# pandas writes NaN as an empty string
+				rendered.append(self.blend(weights[i]).to_csv(index=False, float_format=float_format))
+			else:
+				rendered.append(table_format % tuple(values[i].tolist()))
+		expected = self.blend(weights[0]).to_csv(index=False, float_format=float_format)
+		if rendered[0] != expected:
+			_logger.debug(f"rendering {self.filename} mixtures with pandas")
+			rendered = [
+				self.blend(w).to_csv(index=False, float_format=float_format)
+				for w in weights
+			]
+		return rendered
+
+
+class MixtureStore:
+	"""
+	A compact store of pre-rendered mixture input files.
+
+	The rendered files for each input file of a scenario group are
+	appended to one file in `<directory>/<scenario group>/`, and an
+	index gives the location of the content for each weight, so a
+	large design needs only a few files.  `setup` copies files from
+	here when they are available, instead of blending them for each
+	experiment.
+
+	Args:
+		directory (str): The root directory of the store.
+	"""
+
+	_index_filename = 'index.json'
+
+	def __init__(self, directory):
+		self.directory = directory
+		self._index = None
+		self._index_mtime = None
+
+	@staticmethod
+	def weight_key(weight):
+		"""The index key for a weight."""
+		return repr(float(weight))
+
+	@property
+	def index(self):
+		"""
+		dict: The location of each stored file, as [offset, length],
+		by scenario group, weight key and filename.
+		"""
+		filename = os.path.join(self.directory, self._index_filename)
+		try:
+			mtime = os.stat(filename).st_mtime_ns
+		except FileNotFoundError:
+			return {}
+		if self._index is None or mtime != self._index_mtime:
+			with open(filename, 'rt') as f:
+				self._index = json.load(f)
+			self._index_mtime = mtime
+		return self._index
+
+	def read(self, ve_scenario_dir, weight, filename):
+		"""
+		Read the content of a mixed file from this store.
+
+		Args:
+			ve_scenario_dir (str): The scenario group, e.g. 'F'.
+			weight (float): The weight on the "2" variant.
+			filename (str): The name of the input file.
+
+		Returns:
+			bytes or None: The content, or None if it is not stored.
+		"""
+		location = self.index.get(ve_scenario_dir, {}).get(self.weight_key(weight), {}).get(filename)
+		if location is None:
+			return None
+		offset, length = location
+		with open(os.path.join(self.directory, ve_scenario_dir, filename), 'rb') as f:
+			f.seek(offset)
+			return f.read(length)
+
+	def stage(self, pairs, ve_scenario_dir, weights):
+		"""
+		Render and store the mixed files for a set of weights.
+
+		Mixtures that are already in the store are not rendered again.
+		This should not be called by several processes at once.
+
+		Args:
+			pairs (List[MixturePair]): The mixture pairs of the group.
+			ve_scenario_dir (str): The scenario group, e.g. 'F'.
+			weights (Iterable[float]): The weights on the "2" variant.
+
+		Returns:
+			int: The number of mixtures that were added.
+		"""
+		index = self.index
+		group_index = index.setdefault(ve_scenario_dir, {})
+		weights = sorted(set(float(w) for w in weights))
+		weights = [w for w in weights if self.weight_key(w) not in group_index]
+		if not weights:
+			return 0
+		os.makedirs(os.path.join(self.directory, ve_scenario_dir), exist_ok=True)
+		for pair in pairs:
+			with open(os.path.join(self.directory, ve_scenario_dir, pair.filename), 'ab') as f:
+				offset = f.tell()
+				for w, text in zip(weights, pair.render_many(weights)):
+					# Use the line endings that pandas writes to files.
+					content = text.replace('\n', os.linesep).encode('utf-8')
+					f.write(content)
+					group_index.setdefault(self.weight_key(w), {})[pair.filename] = [offset, len(content)]
+					offset += len(content)
+		filename = os.path.join(self.directory, self._index_filename)
+		with open(filename + '.tmp', 'wt') as f:
+			json.dump(index, f)
+		os.replace(filename + '.tmp', filename)
+		self._index = index
+		self._index_mtime = os.stat(filename).st_mtime_ns
+		return len(weights)
+
+
+# The MixtureStore for each directory, shared within this process.
+_mixture_stores = {}
+
+
+def fingerprint_tree(directory):
+	"""
+	Get a hash of the name and content of every file in a directory tree.
+
+	Args:
+		directory (str): The root of the directory tree.
+
+	Returns:
+		str
+	"""
+	h = hashlib.sha256()
+	for dirpath, dirnames, filenames in sorted(os.walk(directory)):
+		dirnames.sort()
+		for filename in sorted(filenames):
+			full_path = os.path.join(dirpath, filename)
+			h.update(os.path.relpath(full_path, directory).encode())
+			with open(full_path, 'rb') as f:
+				h.update(f.read())
+	return h.hexdigest()
+
+
+class ScenarioInputCache:
+	"""
+	An in-memory cache of the files in `scenario_inputs`.
+
+	Template files, mixture pairs, and categorical drop-in files are
+	each read from disk only the first time they are needed, and then
+	held in memory for all subsequent experiments.  Use
+	`get_scenario_input_cache` to get the cache shared by every
+	model instance in this process (i.e. one per worker).
+
+	Args:
+		directory (str, optional):
+			The scenario_inputs directory to read from.  Defaults
+			to the one distributed alongside this module.
+		model_directory (str, optional):
+			The base model directory, whose input files are used
+			where a categorical drop-in option has no replacement.
+			Defaults to the one distributed alongside this module.
+	"""
+
+	def __init__(self, directory=None, model_directory=None):
+		if directory is None:
+			directory = join_norm(this_directory, 'scenario_inputs')
+		if model_directory is None:
+			model_directory = join_norm(this_directory, 'VERSPM')
+		self.directory = directory
+		self.model_directory = model_directory
+		self._base_inputs = {}
+		self._templates = {}
+		self._mixtures = {}
+		self._drop_ins = {}
+		self._fingerprints = {}
+
+	def path(self, *filename):
+		"""The path to a file in this cache's scenario_inputs directory."""
+		return os.path.join(self.directory, *filename)
+
+	def template(self, ve_scenario_dir, filename):
+		"""
+		Get the text of a template file.
+
+		Args:
+			ve_scenario_dir (str): The scenario group, e.g. 'I'.
+			filename (str): The template filename.
+
+		Returns:
+			str
+		"""
+		k = (ve_scenario_dir, filename)
+		if k not in self._templates:
+			with open(self.path(ve_scenario_dir, filename), 'rt') as f:
+				self._templates[k] = f.read()
+		return self._templates[k]
+
+	def mixture(self, ve_scenario_dir, no_mix_cols=('Year', 'Geo',)):
+		"""
+		Get the mixture pairs for a scenario group.
+
+		Args:
+			ve_scenario_dir (str): The scenario group, e.g. 'F'.
+			no_mix_cols (Collection[str]): Columns that are never mixed.
+
+		Returns:
+			List[MixturePair]
+
+		Raises:
+			FileNotFoundError:
+				If a file in the "1" sub-directory has no
+				counterpart in the "2" sub-directory.
+		"""
+		k = (ve_scenario_dir, tuple(no_mix_cols))
+		if k not in self._mixtures:
+			# Gather list of all files in directory "1", and confirm they
+			# are also in directory "2"
+			filenames = []
+			for i in os.scandir(self.path(ve_scenario_dir, '1')):
+				if i.is_file():
+					filenames.append(i.name)
+					f2 = self.path(ve_scenario_dir, '2', i.name)
+					if not os.path.exists(f2):
+						raise FileNotFoundError(f2)
+			self._mixtures[k] = [
+				MixturePair(
+					filename,
+					pd.read_csv(self.path(ve_scenario_dir, '1', filename)),
+					pd.read_csv(self.path(ve_scenario_dir, '2', filename)),
+					no_mix_cols,
+				)
+				for filename in filenames
+			]
+		return self._mixtures[k]
+
+	def drop_in(self, ve_scenario_dir, scenario_dir):
+		"""
+		Get the raw content of a set of categorical drop-in files.
+
+		Args:
+			ve_scenario_dir (str): The scenario group, e.g. 'L'.
+			scenario_dir (str): The sub-directory, e.g. '1'.
+
+		Returns:
+			Dict[str, bytes]: File content keyed by filename.
+		"""
+		k = (ve_scenario_dir, scenario_dir)
+		if k not in self._drop_ins:
+			content = {}
+			for i in os.scandir(self.path(ve_scenario_dir, scenario_dir)):
+				if i.is_file():
+					with open(i.path, 'rb') as f:
+						content[i.name] = f.read()
+			self._drop_ins[k] = content
+		return self._drop_ins[k]
+
+
+	def base_input(self, filename):
+		"""
+		Get the raw content of an input file in the base model.
+
+		Args:
+			filename (str): The input filename.
+
+		Returns:
+			bytes or None: The content, or None if there is no such file.
+		"""
+		if filename not in self._base_inputs:
+			try:
+				with open(join_norm(self.model_directory, 'inputs', filename), 'rb') as f:
+					self._base_inputs[filename] = f.read()
+			except FileNotFoundError:
+				self._base_inputs[filename] = None
+		return self._base_inputs[filename]
+
+	def reference_input(self, filename):
+		"""
+		Get the raw content of a known good version of an input file.
+
+		This is the base model version of the file if there is one, and
+		otherwise the first version of it among the categorical drop-in
+		files, so that staged files can be checked against it.
+
+		Args:
+			filename (str): The input filename.
+
+		Returns:
+			bytes or None: The content, or None if there is no such file.
+		"""
+		content = self.base_input(filename)
+		if content is not None:
+			return content
+		for dirpath, dirnames, filenames in sorted(os.walk(self.directory)):
+			dirnames.sort()
+			if filename in filenames:
+				with open(os.path.join(dirpath, filename), 'rb') as f:
+					return f.read()
+		return None
+
+	def staged_filenames(self):
+		"""
+		Get the names of all the input files that any scenario group can write.
+
+		Returns:
+			Set[str]
+		"""
+		names = set()
+		for group in os.scandir(self.directory):
+			if group.is_dir():
+				for dirpath, dirnames, filenames in os.walk(group.path):
+					for filename in filenames:
+						if filename.endswith('.template'):
+							filename = filename[:-len('.template')]
+						names.add(filename)
+		return names
+
+	def fingerprint(self, ve_scenario_dir):
+		"""
+		Get a hash of the content of every file in a scenario group.
+
+		Args:
+			ve_scenario_dir (str): The scenario group, e.g. 'F'.
+
+		Returns:
+			str
+		"""
+		if ve_scenario_dir not in self._fingerprints:
+			self._fingerprints[ve_scenario_dir] = fingerprint_tree(self.path(ve_scenario_dir))
+		return self._fingerprints[ve_scenario_dir]
+
+
+_scenario_input_caches = {}
+
+# Fingerprints of directory trees that do not change while this
+# process is running, i.e. those distributed alongside this module.
+_tree_fingerprints = {}
+
+def get_scenario_input_cache(directory=None):
+	"""
+	Get the ScenarioInputCache for a directory, shared within this process.
+
+	Args:
+		directory (str, optional):
+			The scenario_inputs directory.  Defaults to the one
+			distributed alongside this module.
+
+	Returns:
+		ScenarioInputCache
+	"""
+	if directory is None:
+		directory = join_norm(this_directory, 'scenario_inputs')
+	if directory not in _scenario_input_caches:
+		_scenario_input_caches[directory] = ScenarioInputCache(directory)
+	return _scenario_input_caches[directory]
+
+
+class InputValidationError(ValueError):
+	"""
+	Staged input files that VisionEval would reject, or that are not sound.
+
+	Attributes:
+		problems (List[str]): A description of each problem found.
+	"""
+
+	def __init__(self, problems):
+		self.problems = list(problems)
+		super().__init__(
+			f"{len(self.problems)} problems in staged inputs: " + "; ".join(self.problems)
+		)
+
+
+# The column of `defs/geo.csv` giving the zones of each input file,
+# by the prefix of the input filename.
+_geo_levels = {
+	'azone_': 'Azone',
+	'bzone_': 'Bzone',
+	'czone_': 'Czone',
+	'marea_': 'Marea',
+}
+
+
+def read_geo(model_path):
+	"""
+	Read the zones of each level of geography of a model.
+
+	Args:
+		model_path (str): The model directory.
+
+	Returns:
+		Dict[str, Set[str]]: The names of the zones, by level.
+	"""
+	geo = pd.read_csv(join_norm(model_path, 'defs', 'geo.csv'), dtype=str, keep_default_na=False)
+	return {
+		level: set(geo[level]) - {'NA', ''}
+		for level in geo.columns
+	}
+
+
+def input_schema(content):
+	"""
+	Derive the expected form of an input file from a known good version of it.
+
+	VisionEval specifies the columns of each input file, the years and
+	zones it must cover, and which values must be proportions or add
+	up to a total, in the module specifications, which are only
+	available in R.  This derives the equivalent checks from a version
+	of the file that VisionEval accepts:
+
+	- the columns, which must all be present, and the years (if
+	  there is a `Year` column);
+	- the columns with no missing values, which must have none;
+	- the columns with no negative values, which must have none;
+	- the proportion columns (named with "Prop"), which must stay
+	  between 0 and 1; and
+	- groups of proportion columns sharing a name up to "Prop" (e.g.
+	  `BusPropIcev`, `BusPropHev` and `BusPropBev`) that add up to 1 on
+	  every row, which must still do so.
+
+	Args:
+		content (bytes): The content of the known good file.
+
+	Returns:
+		dict
+	"""
+	table = pd.read_csv(io.BytesIO(content))
+	numeric = [c for c in table.columns if pd.api.types.is_numeric_dtype(table[c]) and c != 'Year']
+	proportions = [c for c in numeric if 'Prop' in c and table[c].between(0, 1).all()]
+	groups = collections.defaultdict(list)
+	for c in proportions:
+		prefix = re.match(r"(.*Prop)[A-Z0-9]", c)
+		if prefix:
+			groups[prefix.group(1)].append(c)
+	return dict(
+		columns=list(table.columns),
+		years=sorted(table['Year'].astype(str).unique()) if 'Year' in table.columns else None,
+		required=[c for c in table.columns if table[c].notna().all()],
+		numeric=numeric,
+		nonnegative=[c for c in numeric if (table[c].dropna() >= 0).all()],
+		proportions=proportions,
+		sum_groups=[
+			cols for cols in groups.values()
+			if len(cols) > 1 and np.allclose(table[cols].sum(axis=1), 1.0, atol=1e-6)
+		],
+	)
+
+
+def validate_input(filename, content, schema, geo, tolerance=1e-3):
+	"""
+	Check the content of a staged input file.
+
+	Args:
+		filename (str): The input filename, which gives the level of
+			geography of the `Geo` column (see `_geo_levels`).
+		content (bytes): The content of the staged file.
+		schema (dict): The expected form of the file, see `input_schema`.
+		geo (Dict[str, Set[str]]): The zones of each level of
+			geography, see `read_geo`.
+		tolerance (float, default 1e-3): The tolerance of proportion
+			bounds and sums.
+
+	Returns:
+		List[str]: A description of each problem found.
+	"""
+	try:
+		table = pd.read_csv(io.BytesIO(content))
+	except Exception as err:
+		return [f"{filename}: cannot be read: {err}"]
+	problems = []
+	# VisionEval reads only the columns a module specifies, so extra
+	# columns (like `Geo` in some region drop-in files) are ignored.
+	missing = [c for c in schema['columns'] if c not in table.columns]
+	if missing:
+		problems.append(f"{filename}: missing columns {missing}")
+	if schema['years'] is not None and 'Year' in table.columns:
+		years = sorted(table['Year'].astype(str).unique())
+		if years != schema['years']:
+			problems.append(f"{filename}: years {years}, expected {schema['years']}")
+	level = next((level for prefix, level in _geo_levels.items() if filename.startswith(prefix)), None)
+	if level is not None and 'Geo' in table.columns and level in geo:
+		zones = table['Geo'].astype(str)
+		unknown = sorted(set(zones) - geo[level])
+		if unknown:
+			problems.append(f"{filename}: Geo not in the {level}s of defs/geo.csv: {unknown[:5]}")
+		keys = [zones] + ([table['Year'].astype(str)] if 'Year' in table.columns else [])
+		duplicated = pd.concat(keys, axis=1).duplicated()
+		if duplicated.any():
+			problems.append(f"{filename}: duplicated Geo rows: {sorted(set(zones[duplicated]))[:5]}")
+		years = table['Year'].astype(str) if 'Year' in table.columns else pd.Series('', index=table.index)
+		for year, year_zones in zones.groupby(years):
+			uncovered = sorted(geo[level] - set(year_zones))
+			if uncovered:
+				where = f" in {year}" if year else ""
+				problems.append(f"{filename}: no rows for {level}s {uncovered[:5]}{where}")
+	# The values are checked as one array, as per-column pandas
+	# operations would cost more than reading the file.
+	numeric = [c for c in schema['numeric'] if c in table.columns]
+	raw = table[numeric]
+	if all(pd.api.types.is_numeric_dtype(t) for t in raw.dtypes):
+		values = raw.to_numpy(dtype=float)
+		unparsed = np.zeros(values.shape, dtype=bool)
+	else:
+		values = raw.apply(pd.to_numeric, errors='coerce').to_numpy(dtype=float)
+		unparsed = np.isnan(values) & raw.notna().to_numpy()
+	required = np.isin(numeric, schema['required'])
+	bad = unparsed | np.isinf(values) | (np.isnan(values) & required)
+	with np.errstate(invalid='ignore'):
+		negative = (values < 0) & np.isin(numeric, schema['nonnegative'])
+		outside = (
+			((values < -tolerance) | (values > 1 + tolerance))
+			& np.isin(numeric, schema['proportions'])
+		)
+	for j in np.flatnonzero(bad.any(axis=0) | negative.any(axis=0) | outside.any(axis=0)):
+		c = numeric[j]
+		if bad[:, j].any():
+			problems.append(f"{filename}: missing or non-finite {c} in rows {list(table.index[bad[:, j]][:5])}")
+		elif negative[:, j].any():
+			problems.append(f"{filename}: negative {c} = {np.nanmin(values[:, j])}")
+		else:
+			problems.append(
+				f"{filename}: proportion {c} outside 0 to 1, "
+				f"from {np.nanmin(values[:, j])} to {np.nanmax(values[:, j])}"
+			)
+	for cols in schema['sum_groups']:
+		if not all(c in numeric for c in cols):
+			continue
+		sums = values[:, [numeric.index(c) for c in cols]].sum(axis=1)
+		off = np.abs(sums - 1) > tolerance
+		if off.any():
+			problems.append(
+				f"{filename}: {' + '.join(cols)} sums to {sums[off][0]:.6f}, not 1, "
+				f"in rows {list(table.index[off][:5])}"
+			)
+	return problems
+
+
+# The schemas derived from reference input files, by filename and the
+# hash of the reference content, and the staged input files that have
+# passed validation, by path, size and modification time, so that each
+# is only derived or checked once in a process.
+_input_schemas = {}
+_validated_inputs = {}
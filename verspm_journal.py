@@ -0,0 +1,100 @@
+"""
+The journal of the stages of VERSPM experiments.
+
+The journal is a SQLite database recording the state of each
+experiment, shared by every worker writing to the same archive.
+"""
+
+import os
+import time
+import sqlite3
+import threading
+
+
+# The journal connections, by journal file, process and thread.
+_journal_connections = {}
+
+
+def open_journal(path):
+	"""
+	Get the sqlite3 connection to a journal, for this process and thread.
+
+	The journal tables are created if they do not exist.
+
+	Args:
+		path (str): The journal database file.
+
+	Returns:
+		sqlite3.Connection
+	"""
+	k = (path, os.getpid(), threading.get_ident())
+	if k not in _journal_connections:
+		os.makedirs(os.path.dirname(path), exist_ok=True)
+		conn = sqlite3.connect(path, timeout=60)
+		conn.execute("PRAGMA journal_mode=WAL")
+		conn.execute("PRAGMA synchronous=NORMAL")
+		with conn:
+			conn.execute(
+				"CREATE TABLE IF NOT EXISTS experiments ("
+				"experiment_id INTEGER PRIMARY KEY, "
+				"run_id TEXT, "
+				"stage TEXT, "
+				"status TEXT, "
+				"attempts INTEGER, "
+				"error TEXT, "
+				"updated REAL)"
+			)
+			conn.execute(
+				"CREATE TABLE IF NOT EXISTS events ("
+				"experiment_id INTEGER, "
+				"run_id TEXT, "
+				"stage TEXT, "
+				"status TEXT, "
+				"error TEXT, "
+				"time REAL)"
+			)
+		_journal_connections[k] = conn
+	return _journal_connections[k]
+
+
+def record_journal_event(path, experiment_id, run_id, stage, status, error=None, attempt=False):
+	"""
+	Record a stage of an experiment in a journal.
+
+	Args:
+		path (str): The journal database file.
+		experiment_id (int): The experiment id.
+		run_id (UUID or str, optional): The run id.
+		stage (str): The stage, or 'experiment' for the state of
+			the experiment as a whole.
+		status (str): The status of the stage.
+		error (str, optional): A description of the failure.
+		attempt (bool, default False): Count this as an attempt
+			to run the model.
+	"""
+	experiment_id = int(experiment_id)
+	run_id = None if run_id is None else str(run_id)
+	now = time.time()
+	conn = open_journal(path)
+	with conn:
+		conn.execute(
+			"INSERT INTO events VALUES (?, ?, ?, ?, ?, ?)",
+			(experiment_id, run_id, stage, status, error, now),
+		)
+		if stage == 'experiment':
+			conn.execute(
+				"INSERT INTO experiments VALUES (?, ?, ?, ?, 0, ?, ?) "
+				"ON CONFLICT(experiment_id) DO UPDATE SET "
+				"run_id = excluded.run_id, "
+				"stage = CASE WHEN excluded.status = 'started' "
+				"THEN excluded.stage ELSE experiments.stage END, "
+				"status = excluded.status, error = excluded.error, "
+				"updated = excluded.updated",
+				(experiment_id, run_id, f"{stage}:{status}", status, error, now),
+			)
+		else:
+			conn.execute(
+				"UPDATE experiments SET stage = ?, error = ?, updated = ?, "
+				"attempts = attempts + ? WHERE experiment_id = ?",
+				(f"{stage}:{status}", error, now, int(attempt), experiment_id),
+			)
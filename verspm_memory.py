@@ -0,0 +1,324 @@
+"""
+Memory admission for concurrent VERSPM model runs.
+
+A `MemoryGovernor` admits each model run on a host only while the runs
+already in progress there are expected to leave room for it.
+"""
+
+import os
+import time
+import sqlite3
+import logging
+import platform
+import contextlib
+
+_logger = logging.getLogger("EMAT.VERSPM")
+
+
+def max_rss_mb(who='self'):
+	"""
+	Get the peak resident memory of this process or its waited-for children.
+
+	Args:
+		who ({'self', 'children'}): Which processes to report on.
+
+	Returns:
+		float or None: The peak resident set size in megabytes, or
+		None where the `resource` module is not available (Windows).
+	"""
+	try:
+		import resource
+	except ImportError:
+		return None
+	usage = resource.getrusage(
+		resource.RUSAGE_SELF if who == 'self' else resource.RUSAGE_CHILDREN
+	)
+	# ru_maxrss is in bytes on macOS, and in kilobytes elsewhere.
+	if platform.system() == 'Darwin':
+		return usage.ru_maxrss / 2**20
+	return usage.ru_maxrss / 2**10
+
+
+def process_usage(pid):
+	"""
+	Get the CPU time and peak resident memory of a running process.
+
+	This reads `/proc`, so it is only available on Linux.
+
+	Args:
+		pid (int): The process id.
+
+	Returns:
+		dict or None:
+			The total user and system CPU seconds as `cpu`, and the
+			peak resident set size in megabytes as `max_rss_mb`, or
+			None if this information is not available.
+	"""
+	try:
+		with open(f"/proc/{pid}/stat", 'rt') as f:
+			fields = f.read().rsplit(')', 1)[1].split()
+		with open(f"/proc/{pid}/status", 'rt') as f:
+			status = dict(
+				line.split(':', 1) for line in f if ':' in line
+			)
+	except (OSError, IndexError, ValueError):
+		return None
+	ticks = os.sysconf('SC_CLK_TCK')
+	return dict(
+		# utime and stime are fields 14 and 15 of stat, the 12th
+		# and 13th after the command name.
+		cpu=(int(fields[11]) + int(fields[12])) / ticks,
+		max_rss_mb=int(status.get('VmHWM', '0 kB').split()[0]) / 2**10,
+	)
+
+
+def host_memory():
+	"""
+	Get the memory of this host, and how much of it is available.
+
+	This reads `/proc/meminfo` (and `/proc/pressure/memory`, where the
+	kernel reports pressure stall information), so it is only available
+	on Linux.
+
+	Returns:
+		dict or None:
+			The `total_mb` and `available_mb` memory, and the share of
+			the last ten seconds that some tasks were stalled waiting
+			for memory as `pressure` (None if not reported), or None
+			if this information is not available.
+	"""
+	try:
+		with open("/proc/meminfo", 'rt') as f:
+			meminfo = dict(
+				line.split(':', 1) for line in f if ':' in line
+			)
+		total = int(meminfo['MemTotal'].split()[0]) / 2**10
+		available = int(meminfo['MemAvailable'].split()[0]) / 2**10
+	except (OSError, KeyError, ValueError):
+		return None
+	pressure = None
+	try:
+		with open("/proc/pressure/memory", 'rt') as f:
+			some = f.readline().split()
+		pressure = float(dict(i.split('=') for i in some[1:])['avg10']) / 100
+	except (OSError, IndexError, KeyError, ValueError):
+		pass
+	return dict(total_mb=total, available_mb=available, pressure=pressure)
+
+
+class MemoryGovernor:
+	"""
+	Admit model runs on a host only while they are expected to fit in memory.
+
+	Every process running models on a host (local pool workers, dask
+	workers, or threads in either) shares a small SQLite ledger in a
+	host-local directory, recording the memory reserved by each run in
+	progress and the peak memory observed for recent runs.  A new run
+	is admitted only when the memory already reserved, plus the memory
+	it is expected to need, fits in the `budget_mb`, and the host has
+	that much memory available and is not stalling on memory; otherwise
+	it waits, backing off, until runs finish.  A run is always admitted
+	when no other runs are in progress, so a budget that is too small
+	slows runs down but cannot block them entirely.
+
+	The memory a run is expected to need is the largest peak observed
+	for the last `history` runs, plus `margin`, or `initial_mb` before
+	any runs have been observed.
+
+	Args:
+		ledger (str): The ledger file, which must be on a host-local
+			file system.
+		budget_mb (float, optional): The memory that runs may reserve in
+			total.  Defaults to 80% of the memory of the host.
+		initial_mb (float, default 2048): The memory expected for a run
+			before any runs have been observed.
+		margin (float, default 0.1): The extra share of the observed peak
+			to reserve for each run.
+		history (int, default 20): The number of recent runs used to
+			estimate the memory needed for a run.
+		max_pressure (float, default 0.1): Hold new runs while tasks on
+			the host have been stalled waiting for memory for more than
+			this share of the last ten seconds.
+		poll (float, default 1.0): The initial wait between admission
+			checks, which doubles up to `max_poll` while runs are held.
+		max_poll (float, default 30.0): The longest wait between
+			admission checks.
+	"""
+
+	def __init__(
+			self,
+			ledger,
+			budget_mb=None,
+			initial_mb=2048,
+			margin=0.1,
+			history=20,
+			max_pressure=0.1,
+			poll=1.0,
+			max_poll=30.0,
+	):
+		self.ledger = ledger
+		if budget_mb is None:
+			memory = host_memory()
+			budget_mb = memory['total_mb'] * 0.8 if memory else float('inf')
+		self.budget_mb = budget_mb
+		self.initial_mb = initial_mb
+		self.margin = margin
+		self.history = history
+		self.max_pressure = max_pressure
+		self.poll = poll
+		self.max_poll = max_poll
+
+	def _connect(self):
+		os.makedirs(os.path.dirname(os.path.abspath(self.ledger)), exist_ok=True)
+		conn = sqlite3.connect(self.ledger, timeout=60, isolation_level=None)
+		conn.execute("PRAGMA journal_mode=WAL")
+		conn.execute(
+			"CREATE TABLE IF NOT EXISTS reservations ("
+			"id INTEGER PRIMARY KEY, pid INTEGER, reserved_mb REAL, label TEXT, started REAL)"
+		)
+		conn.execute(
+			"CREATE TABLE IF NOT EXISTS observations ("
+			"id INTEGER PRIMARY KEY, peak_mb REAL, time REAL)"
+		)
+		return conn
+
+	@staticmethod
+	def _alive(pid):
+		try:
+			os.kill(pid, 0)
+		except ProcessLookupError:
+			return False
+		except (PermissionError, OSError):
+			pass
+		return True
+
+	def expected_mb(self, conn=None):
+		"""float: The memory a new run is expected to need."""
+		close = conn is None
+		if close:
+			conn = self._connect()
+		try:
+			peaks = [
+				row[0] for row in conn.execute(
+					"SELECT peak_mb FROM observations ORDER BY id DESC LIMIT ?",
+					(self.history,),
+				)
+			]
+		finally:
+			if close:
+				conn.close()
+		if not peaks:
+			return self.initial_mb
+		return max(peaks) * (1 + self.margin)
+
+	def _try_admit(self, conn, label):
+		"""
+		Reserve memory for a run, if it can be admitted now.
+
+		Returns:
+			Tuple[int or None, str]:
+				The reservation id (None if not admitted), and the reason.
+		"""
+		conn.execute("BEGIN IMMEDIATE")
+		try:
+			# Reservations left by processes that died are released.
+			for rid, pid in conn.execute("SELECT id, pid FROM reservations").fetchall():
+				if not self._alive(pid):
+					conn.execute("DELETE FROM reservations WHERE id = ?", (rid,))
+			n_active, reserved = conn.execute(
+				"SELECT COUNT(*), COALESCE(SUM(reserved_mb), 0) FROM reservations"
+			).fetchone()
+			needed = self.expected_mb(conn)
+			reason = None
+			if n_active:
+				memory = host_memory()
+				if reserved + needed > self.budget_mb:
+					reason = (
+						f"{n_active} runs reserve {reserved:.0f} MB of the "
+						f"{self.budget_mb:.0f} MB budget, next needs {needed:.0f} MB"
+					)
+				elif memory and memory['available_mb'] < needed:
+					reason = (
+						f"{memory['available_mb']:.0f} MB available on the host, "
+						f"next needs {needed:.0f} MB"
+					)
+				elif memory and memory['pressure'] is not None and memory['pressure'] > self.max_pressure:
+					reason = f"host memory pressure {memory['pressure']:.0%}"
+			if reason is not None:
+				conn.execute("COMMIT")
+				return None, reason
+			rid = conn.execute(
+				"INSERT INTO reservations (pid, reserved_mb, label, started) VALUES (?, ?, ?, ?)",
+				(os.getpid(), needed, label, time.time()),
+			).lastrowid
+			conn.execute("COMMIT")
+			return rid, None
+		except BaseException:
+			conn.execute("ROLLBACK")
+			raise
+
+	@contextlib.contextmanager
+	def admit(self, label=None):
+		"""
+		Wait until a run can be admitted, and hold its reservation.
+
+		Args:
+			label (str, optional): A label for the run in the ledger.
+
+		Yields:
+			MemoryReservation: Report the observed peak memory of the
+			run to it with `observe`.
+		"""
+		conn = self._connect()
+		try:
+			delay = self.poll
+			waited = 0.0
+			while True:
+				rid, reason = self._try_admit(conn, label)
+				if rid is not None:
+					break
+				if not waited:
+					_logger.info(f"VERSPM MEMORY holding run: {reason}")
+				time.sleep(delay)
+				waited += delay
+				delay = min(delay * 2, self.max_poll)
+			if waited:
+				_logger.info(f"VERSPM MEMORY admitted run after {waited:.0f} seconds")
+			reservation = MemoryReservation(waited)
+			try:
+				yield reservation
+			finally:
+				conn.execute("BEGIN IMMEDIATE")
+				conn.execute("DELETE FROM reservations WHERE id = ?", (rid,))
+				if reservation.peak_mb:
+					conn.execute(
+						"INSERT INTO observations (peak_mb, time) VALUES (?, ?)",
+						(reservation.peak_mb, time.time()),
+					)
+					conn.execute(
+						"DELETE FROM observations WHERE id <= "
+						"(SELECT MAX(id) FROM observations) - ?",
+						(max(self.history, 100),),
+					)
+				conn.execute("COMMIT")
+		finally:
+			conn.close()
+
+
+class MemoryReservation:
+	"""
+	A run admitted by a `MemoryGovernor`.
+
+	Attributes:
+		waited (float): The seconds the run waited to be admitted.
+		peak_mb (float): The observed peak memory of the run, if reported.
+	"""
+
+	def __init__(self, waited=0.0):
+		self.waited = waited
+		self.peak_mb = None
+
+	def observe(self, peak_mb):
+		"""Report the observed peak memory of the run, in megabytes."""
+		if peak_mb:
+			self.peak_mb = max(self.peak_mb or 0, peak_mb)
@@ -0,0 +1,274 @@
+"""
+Local pools of workers for running VERSPM experiments.
+
+The experiments of a design are ordered by `schedule_experiments` and
+sent in blocks to process or thread workers, each with a model
+instance of its own.  This module is imported by `emat_verspm`, so the
+names it needs from there are imported where they are used.
+"""
+
+import queue
+import logging
+import warnings
+import numpy as np
+import pandas as pd
+
+_logger = logging.getLogger("EMAT.VERSPM")
+
+
+def schedule_experiments(experiments, groups, n_blocks=1):
+	"""
+	Order experiments so that those sharing input values run in sequence.
+
+	The experiments are sorted by the values of each group of parameters
+	in turn, taking first the groups with the fewest distinct values
+	(e.g. categorical levers that swap whole input files), so that
+	consecutive experiments change as few input groups as possible.
+	The ordered experiments are then cut into contiguous blocks, each
+	to be run in sequence by one worker.
+
+	Args:
+		experiments (Mapping[int, dict]): The parameters of each
+			experiment, by experiment id.
+		groups (Iterable[Tuple[str]]): The names of the parameters
+			in each group of inputs.
+		n_blocks (int, default 1): The number of blocks.
+
+	Returns:
+		List[List[int]]: The experiment ids in each block.
+	"""
+	ids = list(experiments)
+	if not ids:
+		return []
+	frame = pd.DataFrame.from_dict(experiments, orient='index')
+	columns = []
+	cardinality = []
+	for names in groups:
+		names = [name for name in names if name in frame.columns]
+		if names:
+			columns.append(names)
+			cardinality.append(len(frame[names].drop_duplicates()))
+	by = [
+		name
+		for _, names in sorted(zip(cardinality, columns), key=lambda x: x[0])
+		for name in names
+	]
+	if by:
+		ids = list(frame.sort_values(by, kind='mergesort').index)
+	n_blocks = max(min(n_blocks, len(ids)), 1)
+	edges = np.linspace(0, len(ids), n_blocks + 1).round().astype(int)
+	return [ids[a:b] for a, b in zip(edges[:-1], edges[1:])]
+
+
+# When running experiments in a local process pool (see
+# `VERSPModel.run_experiments`), each worker process creates its
+# own model instance once, with its own copy of the model files,
+# and then uses it for every experiment dispatched to that worker.
+_local_worker_model = None
+
+# The queue on which a local process pool worker sends back the
+# result of each experiment.
+_local_worker_results = None
+
+def _local_worker_model_for(scope, config, archive_path):
+	"""
+	Create a model instance for a local pool worker.
+
+	Args:
+		scope (emat.Scope): The scope for the experiments.
+		config (dict): The model configuration from the parent.
+		archive_path (str): The absolute archive path of the parent model.
+
+	Returns:
+		VERSPModel
+	"""
+	from emat_verspm import VERSPModel
+	model = VERSPModel(db=False, scope=scope)
+	model.config.update(config)
+	model.archive_path = archive_path
+	# The parent process records each experiment as complete.
+	model._journal_on_commit = True
+	return model
+
+def _local_worker_init(scope, config, archive_path, results=None):
+	"""
+	Create the model instance for a local process pool worker.
+
+	Args:
+		scope (emat.Scope): The scope for the experiments.
+		config (dict): The model configuration from the parent process.
+		archive_path (str): The absolute archive path of the parent model.
+		results (multiprocessing.Queue, optional): The queue for the
+			result of each experiment, see `_local_worker_run`.
+	"""
+	global _local_worker_model, _local_worker_results
+	_local_worker_results = results
+	from multiprocessing.util import Finalize
+	from emat_verspm import close_r_sessions
+	logging.getLogger("EMAT").setLevel(_logger.getEffectiveLevel())
+	model = _local_worker_model_for(scope, config, archive_path)
+	_local_worker_model = model
+	# Worker processes do not run normal interpreter shutdown, so
+	# register clean up of the temporary model files explicitly.
+	Finalize(model, model.master_directory.cleanup, exitpriority=10)
+	Finalize(None, close_r_sessions, exitpriority=10)
+
+def _local_worker_run(block):
+	"""
+	Run a block of experiments in sequence on a local process pool worker.
+
+	The result of each experiment is put on the worker's results queue
+	as soon as it finishes, see `_run_local_experiment` for its form.
+
+	Args:
+		block (List[Tuple[int, dict, UUID]]): The experiment id,
+			parameters and run id of each experiment.
+	"""
+	for experiment_id, params, run_id in block:
+		_local_worker_results.put(
+			_run_local_experiment(_local_worker_model, experiment_id, params, run_id)
+		)
+
+def _thread_worker_run(models, results, block):
+	"""
+	Run a block of experiments in sequence on a local thread pool worker.
+
+	The result of each experiment is put on the results queue as soon
+	as it finishes, see `_run_local_experiment` for its form.
+
+	Args:
+		models (queue.Queue): The model instances available to the
+			threads; one is checked out for this block.
+		results (queue.Queue): The queue for the results.
+		block (List[Tuple[int, dict, UUID]]): The experiment id,
+			parameters and run id of each experiment.
+	"""
+	model = models.get()
+	try:
+		for experiment_id, params, run_id in block:
+			results.put(_run_local_experiment(model, experiment_id, params, run_id))
+	finally:
+		models.put(model)
+
+def _pool_results(results, futures, n_total, poll_seconds=1.0):
+	"""
+	Yield the result of each experiment run by a local pool as it arrives.
+
+	Args:
+		results (queue.Queue or multiprocessing.Queue): The queue on
+			which the workers send back results.
+		futures (List[concurrent.futures.Future]): The futures of the
+			blocks of experiments given to the workers.
+		n_total (int): The number of experiments.
+		poll_seconds (float, default 1.0): How often to check the futures
+			for a failed worker while waiting for results.
+
+	Yields:
+		Tuple[int, UUID, dict, str, dict]: See `_run_local_experiment`.
+
+	Raises:
+		Exception: The error of any block of experiments that failed.
+		RuntimeError: If the workers finish without sending all the results.
+	"""
+	n_received = 0
+	while n_received < n_total:
+		try:
+			result = results.get(timeout=poll_seconds)
+		except queue.Empty:
+			for future in futures:
+				if future.done() and future.exception() is not None:
+					raise future.exception()
+			if all(future.done() for future in futures):
+				# Results sent just before a worker finished may still
+				# be on their way from its process.
+				try:
+					result = results.get(timeout=60)
+				except queue.Empty:
+					raise RuntimeError(
+						f"local pool finished with {n_total - n_received} results missing"
+					) from None
+			else:
+				continue
+		n_received += 1
+		yield result
+
+def _run_local_experiment(model, experiment_id, params, run_id):
+	"""
+	Run one experiment with a local pool worker's model instance.
+
+	Args:
+		model (VERSPModel): The model instance.
+		experiment_id (int): The experiment id.
+		params (dict): The experiment parameters.
+		run_id (UUID): The run id, allocated by the parent.
+
+	Returns:
+		Tuple[int, UUID, dict, str, dict]:
+			The experiment id, the run id, the measures, the
+			comment on the run (None if successful), and the
+			stage metrics.
+	"""
+	model.run_id = run_id
+	model.outcomes_output = {}
+	scenario = {
+		k: params[k]
+		for k in model.scope._get_uncertainty_and_constant_names()
+		if k in params
+	}
+	scenario['_experiment_id_'] = experiment_id
+	policy = {
+		k: params[k]
+		for k in model.scope.get_lever_names()
+		if k in params
+	}
+	model.run_model(scenario, policy)
+	return (
+		experiment_id,
+		model.run_id,
+		dict(model.outcomes_output),
+		model.comment_on_run,
+		dict(model.stage_metrics),
+	)
+
+def _reprocess_archives(model, tasks, measure_names):
+	"""
+	Compute measures from experiment archives.
+
+	Args:
+		model (VERSPModel): The model instance.
+		tasks (List[Tuple[int, str]]): The experiment id and archive
+			path of each archive.
+		measure_names (Collection[str]): The measures to compute,
+			or None for all measures.
+
+	Returns:
+		List[Tuple[int, dict, str, Tuple[List[str], str]]]:
+			For each archive, the experiment id, the measures, an
+			error message (None if successful), and, if an output
+			needed for some measures is not in the archive, those
+			measures and the output (otherwise None).
+	"""
+	from emat_verspm import UnarchivedOutputError
+	results = []
+	for experiment_id, archive_path in tasks:
+		try:
+			with warnings.catch_warnings(record=True) as caught:
+				warnings.simplefilter("always")
+				outcomes = model.measures_from_archive(archive_path, measure_names, strict=True)
+			for w in caught:
+				_logger.warning(f"VERSPM REPROCESS experiment {experiment_id}: {w.message}")
+		except UnarchivedOutputError as err:
+			results.append((experiment_id, None, repr(err), (err.measure_names, str(err.__cause__))))
+		except Exception as err:
+			results.append((experiment_id, None, repr(err), None))
+		else:
+			results.append((experiment_id, outcomes, None, None))
+	return results
+
+def _reprocess_worker_run(tasks, measure_names):
+	"""
+	Compute measures from experiment archives on a local process pool worker.
+
+	See `_reprocess_archives` for the arguments and result.
+	"""
+	return _reprocess_archives(_local_worker_model, tasks, measure_names)
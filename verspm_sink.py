@@ -0,0 +1,383 @@
+"""
+Batched writes of experiment results to a SQLiteDB.
+
+Results from many workers are sent to a single `ResultSink` writer
+thread, directly or through a spool directory, and written to the
+database in batches.
+"""
+
+import os
+import json
+import time
+import uuid
+import queue
+import logging
+import tempfile
+import threading
+import collections
+import pandas as pd
+
+from emat import SQLiteDB
+
+from verspm_journal import record_journal_event
+
+_logger = logging.getLogger("EMAT.VERSPM")
+
+
+def spool_results(spool, records):
+	"""
+	Send result records to a `ResultSink` through its spool directory.
+
+	The records are written to a new file, which is moved into place
+	when complete, so the sink never reads a partly written file.
+
+	Args:
+		spool (str): The spool directory of the sink.
+		records (List[dict]): The records, see `ResultSink.put`.
+	"""
+	os.makedirs(spool, exist_ok=True)
+	name = f"{time.time():.6f}-{os.getpid()}-{threading.get_ident()}-{os.urandom(4).hex()}"
+	tmp = os.path.join(spool, f".{name}.tmp")
+	with open(tmp, 'wt') as f:
+		json.dump(records, f, default=str)
+	os.replace(tmp, os.path.join(spool, f"{name}.json"))
+
+
+class ResultSink:
+	"""
+	Write experiment results to a SQLiteDB from a single writer thread.
+
+	Records of finished experiments are put on a queue (or, from other
+	processes, such as dask workers, written to a spool directory with
+	`spool_results`), and a writer thread, with its own connection to
+	the database in WAL mode, commits them in batches: whenever
+	`batch_size` records are waiting, or the oldest waiting record is
+	`flush_seconds` old.  Workers then never wait on the database lock,
+	and the database sees one writer with a few large transactions
+	instead of many writers with one small transaction each.
+
+	A batch that fails to be written is kept and retried, with a
+	growing delay.  If it still cannot be written when the sink is
+	closed, after `close_retries` attempts, its records are left in
+	a spool directory (see `close`), and a new sink given that
+	spool directory writes them.  Experiments are recorded as
+	complete in the journal (with 'journal' records) only once their
+	results are committed.
+
+	Args:
+		database_path (str): The database file.
+		scope_name (str): The scope of the experiments.
+		batch_size (int, default 100): Flush when this many records
+			are waiting.
+		flush_seconds (float, default 2.0): Flush when the oldest
+			waiting record is this old.
+		spool (str, optional): A directory to also collect records from.
+		close_retries (int, default 5): The attempts to write the last
+			batch when closing, before leaving it in a spool directory.
+	"""
+
+	def __init__(self, database_path, scope_name, batch_size=100, flush_seconds=2.0, spool=None, close_retries=5):
+		self.database_path = database_path
+		self.scope_name = scope_name
+		self.batch_size = batch_size
+		self.flush_seconds = flush_seconds
+		self.spool = spool
+		self.close_retries = close_retries
+		self.n_written = 0
+		self.n_failed = 0
+		self._queue = queue.Queue()
+		self._closing = object()
+		self._thread = None
+
+	def __enter__(self):
+		self.start()
+		return self
+
+	def __exit__(self, exc_type, exc_val, exc_tb):
+		self.close()
+
+	def start(self):
+		"""Start the writer thread."""
+		if self.spool:
+			os.makedirs(self.spool, exist_ok=True)
+		self._thread = threading.Thread(target=self._writer, name='verspm-result-sink', daemon=True)
+		self._thread.start()
+
+	def put(self, records):
+		"""
+		Queue result records for writing.
+
+		Args:
+			records (List[dict]): Each record has a `kind`, and:
+
+				- 'measures': the `experiment_id`, the `run_id` (or None
+				  for a new one), the `measures` dict, and the `source`
+				  (0 for a core model run).
+				- 'status': the `experiment_id`, `run_id` and `status`.
+				- 'memo': the memo `table`, and the `row` to insert.
+				- 'metrics': the stage metrics `table`, and the `row`
+				  to insert.
+				- 'journal': the journal `path`, the `experiment_id`,
+				  `run_id` and `status`, recorded once the rest of the
+				  batch is written.
+		"""
+		for record in records:
+			self._queue.put(record)
+
+	def close(self):
+		"""
+		Write all the waiting records, and stop the writer thread.
+
+		The spool directory, if any, is removed if it is empty.  Records
+		that could not be written are left in the spool directory, or
+		in a new one next to the database, and an error is logged.
+		"""
+		if self._thread is None:
+			return
+		self._queue.put(self._closing)
+		self._thread.join()
+		self._thread = None
+		if self.spool:
+			try:
+				os.rmdir(self.spool)
+			except OSError:
+				_logger.error(f"VERSPM RESULT SINK left unwritten results in {self.spool}")
+		if self.n_written or self.n_failed:
+			_logger.info(f"VERSPM RESULT SINK wrote {self.n_written} records, {self.n_failed} failed")
+
+	def _read_spool(self, seen):
+		"""Read the records of spool files not seen before."""
+		records, files = [], []
+		if not self.spool:
+			return records, files
+		for entry in sorted(os.scandir(self.spool), key=lambda e: e.name):
+			if not entry.name.endswith('.json') or entry.path in seen:
+				continue
+			try:
+				with open(entry.path, 'rt') as f:
+					spooled = json.load(f)
+			except (OSError, ValueError):
+				_logger.exception(f"VERSPM RESULT SINK cannot read {entry.path}")
+				os.replace(entry.path, entry.path + '.failed')
+				continue
+			for record in spooled:
+				record['_file'] = entry.path
+			records.extend(spooled)
+			seen.add(entry.path)
+			files.append(entry.path)
+		return records, files
+
+	def _writer(self):
+		db = SQLiteDB(self.database_path, initialize='skip', check_same_thread=False)
+		db.conn.execute("PRAGMA busy_timeout=60000")
+		db.conn.execute("PRAGMA journal_mode=WAL")
+		pending, files, seen = [], [], set()
+		oldest = None
+		retry_at = None
+		backoff = self.flush_seconds
+		closing = False
+		close_attempts = 0
+		try:
+			while True:
+				wait = self.flush_seconds
+				if retry_at is not None:
+					wait = max(retry_at - time.monotonic(), 0)
+				elif oldest is not None:
+					wait = max(oldest + self.flush_seconds - time.monotonic(), 0)
+				if closing and not pending:
+					break
+				try:
+					item = self._queue.get(timeout=wait)
+					while True:
+						if item is self._closing:
+							closing = True
+						else:
+							pending.append(item)
+						item = self._queue.get_nowait()
+				except queue.Empty:
+					pass
+				spooled, spool_files = self._read_spool(seen)
+				pending.extend(spooled)
+				files.extend(spool_files)
+				if pending and oldest is None:
+					oldest = time.monotonic()
+				if not pending:
+					continue
+				if retry_at is not None:
+					due = time.monotonic() >= retry_at
+				else:
+					due = (
+						closing
+						or len(pending) >= self.batch_size
+						or time.monotonic() - oldest >= self.flush_seconds
+					)
+				if not due:
+					continue
+				if self._flush(db, pending, files):
+					pending, files, oldest, retry_at = [], [], None, None
+					backoff = self.flush_seconds
+					continue
+				# A failed batch is kept, with any records that arrive
+				# meanwhile, and written again after a growing delay.
+				if closing:
+					close_attempts += 1
+					if close_attempts >= self.close_retries:
+						self._keep_unwritten(pending, files)
+						pending, files = [], []
+						break
+				retry_at = time.monotonic() + backoff
+				backoff = min(backoff * 2, 60.0)
+		finally:
+			db.conn.close()
+
+	def _keep_unwritten(self, records, files):
+		"""
+		Leave records that cannot be written in the spool directory.
+
+		The spool files are left where they are, and the other records
+		are written to a new spool file, in the spool directory of this
+		sink or, if it has none, in a new one next to the database, so
+		they can be written later by a new sink on that directory.
+		"""
+		spooled = set(files)
+		queued = [r for r in records if r.get('_file') not in spooled]
+		spool = self.spool
+		if queued:
+			if spool is None:
+				database_path = os.path.abspath(self.database_path)
+				spool = tempfile.mkdtemp(
+					prefix=f".{os.path.basename(database_path)}-results-",
+					dir=os.path.dirname(database_path),
+				)
+			spool_results(spool, [
+				{k: v for k, v in r.items() if k not in ('_file', '_written')}
+				for r in queued
+			])
+		self.n_failed += len(records)
+		_logger.error(
+			f"VERSPM RESULT SINK cannot write {len(records)} records, they are kept in {spool}"
+		)
+
+	def _flush(self, db, records, files):
+		"""
+		Write a batch of records, and remove their spool files.
+
+		The journal records are written only once the results they
+		follow are committed to the database.
+
+		Returns:
+			bool: Whether the batch was written.
+		"""
+		start = time.perf_counter()
+		try:
+			measures = collections.defaultdict(list)
+			for r in records:
+				if r['kind'] == 'measures':
+					measures[(r.get('source', 0), r.get('run_id') is None)].append(r)
+			# Records written before a failure are marked, so they
+			# are not written again when the batch is retried.
+			for (source, new_runs), group in measures.items():
+				group = [r for r in group if not r.get('_written')]
+				if not group:
+					continue
+				db.write_experiment_measures(
+					self.scope_name,
+					source,
+					pd.DataFrame(
+						[r['measures'] for r in group],
+						index=[r['experiment_id'] for r in group],
+					),
+					None if new_runs else [r['run_id'] for r in group],
+				)
+				for r in group:
+					r['_written'] = True
+			for r in records:
+				if r['kind'] == 'status' and not r.get('_written'):
+					if r['status'] != 'COMPLETE':
+						db.existing_run_id(r['run_id'], self.scope_name, experiment_id=r['experiment_id'])
+					db.write_experiment_run_status(self.scope_name, r['run_id'], r['experiment_id'], r['status'])
+					r['_written'] = True
+			memos = collections.defaultdict(list)
+			for r in records:
+				if r['kind'] in ('memo', 'metrics'):
+					memos[r['table']].append(tuple(r['row']))
+			with db.conn:
+				for table, rows in memos.items():
+					db.conn.executemany(
+						f"INSERT OR REPLACE INTO {table} VALUES ({','.join('?' * len(rows[0]))})",
+						rows,
+					)
+		except Exception:
+			experiment_ids = sorted({str(r.get('experiment_id')) for r in records})
+			_logger.exception(
+				f"VERSPM RESULT SINK failed to write results for experiments {', '.join(experiment_ids)}, will retry"
+			)
+			return False
+		for r in records:
+			if r['kind'] == 'journal':
+				try:
+					record_journal_event(
+						r['path'], r['experiment_id'], r.get('run_id'), 'experiment', r['status'],
+					)
+				except Exception:
+					# The results are stored; the experiment is only run
+					# again if the design is resumed.
+					_logger.exception(
+						f"VERSPM RESULT SINK cannot record experiment {r['experiment_id']} in the journal"
+					)
+		for filename in files:
+			os.remove(filename)
+		self.n_written += len(records)
+		_logger.debug(
+			f"VERSPM RESULT SINK wrote {len(records)} records in {time.perf_counter() - start:.3f} seconds"
+		)
+		return True
+
+
+class _SpoolingDB(SQLiteDB):
+	"""
+	A view of a SQLiteDB that sends results to a `ResultSink` spool.
+
+	Reads go to the database as usual, but the measures, run statuses
+	and memo rows of experiments are held, and written to the spool by
+	`flush`, instead of being written to the database.  New run ids are
+	only recorded along with the results of the run.
+	"""
+
+	def __init__(self, db, spool):
+		self.__dict__.update(db.__dict__)
+		self.spool = spool
+		self.pending = []
+
+	def new_run_id(self, scope_name=None, parameters=None, location=None, experiment_id=None, source=0, **extra_attrs):
+		if experiment_id is None:
+			experiment_id = self.get_experiment_id(scope_name, parameters)
+		return uuid.uuid1(), experiment_id
+
+	def write_experiment_measures(self, scope_name, source, m_df, run_ids=None, experiment_id=None):
+		if experiment_id is not None:
+			m_df = pd.DataFrame(m_df, index=[experiment_id])
+		if run_ids is None:
+			run_ids = [None] * len(m_df)
+		for (experiment_id, row), run_id in zip(m_df.iterrows(), run_ids):
+			self.pending.append(dict(
+				kind='measures',
+				experiment_id=int(experiment_id),
+				run_id=None if run_id is None else str(run_id),
+				measures={k: float(v) for k, v in row.items()},
+				source=int(source or 0),
+			))
+
+	def write_experiment_run_status(self, scope_name, run_id, experiment_id, msg):
+		self.pending.append(dict(
+			kind='status',
+			experiment_id=int(experiment_id),
+			run_id=str(run_id),
+			status=msg,
+		))
+
+	def flush(self):
+		"""Write the held records to the spool."""
+		if self.pending:
+			spool_results(self.spool, self.pending)
+			self.pending = []